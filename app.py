@@ -19,7 +19,7 @@ import locale
 from models import (
     db, Cliente, Centro, Empresa, Contrato, Factura, Pago,
     Partida, Concepto, CatalogoVersion, ConceptoCatalogo,
-    AvanceObra, DetalleAvance
+    AvanceObra, DetalleAvance, AcumuladoAvance
 )
 
 from base.clientes import clientes_bp
@@ -37,6 +37,7 @@ from obra.prefiniquitos import prefiniquitos_bp
 from desarrollo.kanban import kanban_bp
 from obra.extraordinarios import extraordinarios_bp
 from obra.estimaciones_nuevo import estimaciones_nuevo_bp
+from obra.trabajos import trabajos_bp
 
 
 # ======================= CONFIGURACIÓN =======================
@@ -45,7 +46,39 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'clave-secreta-fact'
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(basedir, 'instance', 'fact.db')}"
+# DATABASE_URL permite usar otra base de datos (p. ej. una temporal para las pruebas)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', f"sqlite:///{os.path.join(basedir, 'instance', 'fact.db')}"
+)
+
+# Número máximo de contratos cuyo catálogo base se mantiene en memoria (LRU)
+app.config['CATALOGO_BASE_CACHE_TAMANO'] = 64
+
+# Vistas previas de catálogos (archivo comparado contra el catálogo base) que se conservan en memoria
+app.config['CATALOGO_VISTA_PREVIA_CACHE_TAMANO'] = 16
+
+# Comparaciones entre versiones de catálogo (prefiniquitos sin congelar) que se conservan en memoria
+app.config['PREFINIQUITO_CACHE_TAMANO'] = 32
+
+# Matrices concepto × versión (evolución del catálogo de un contrato) que se conservan en memoria
+app.config['CATALOGO_MATRIZ_CACHE_TAMANO'] = 8
+
+# Columnas (fechas, semanas, meses o estimaciones) que el panel de avances manda al navegador a la vez
+app.config['AVANCES_PANEL_MAX_COLUMNAS'] = 12
+
+# Cada cuántas versiones del Catálogo Base Acumulado se guarda el contenido completo (las demás son deltas)
+app.config['CATALOGO_BASE_CHECKPOINT_CADA'] = 10
+
+# Filas por bloque al importar catálogos (la memoria usada depende de esto, no del tamaño del archivo)
+app.config['CATALOGO_IMPORTACION_BLOQUE'] = 2000
+
+# Valor inicial de "guardar solo los conceptos que cambiaron" al subir un catálogo actualizado
+app.config['CATALOGO_VERSIONES_SOLO_CAMBIOS'] = False
+
+# Trabajos largos (importar catálogo, generar prefiniquito) fuera de la solicitud HTTP.
+# Con False se ejecutan en la misma solicitud.
+app.config['TRABAJOS_EN_SEGUNDO_PLANO'] = True
+app.config['TRABAJOS_MAX_HILOS'] = 2
 
 db.init_app(app)
 migrate = Migrate(app, db)
@@ -66,6 +99,7 @@ app.register_blueprint(kanban_bp, url_prefix='/kanban')
 app.register_blueprint(prefiniquitos_bp)
 app.register_blueprint(extraordinarios_bp)
 app.register_blueprint(estimaciones_nuevo_bp)
+app.register_blueprint(trabajos_bp)
 
 
 # ======================= RUTAS =======================
@@ -125,6 +159,41 @@ def listar_rutas():
         output.append(route)
     return "<pre>" + "\n".join(sorted(output)) + "</pre>"
 
+# ======================= COMANDOS =======================
+
+@app.cli.command('reconstruir-catalogo-base')
+def reconstruir_catalogo_base_cmd():
+    """Recalcula el catálogo base vigente de todos los contratos con catálogos."""
+    from services.catalogo_base import reconstruir_catalogo_base, registrar_snapshot_catalogo_base
+
+    contratos_ids = [c.id for c in Contrato.query.filter(Contrato.catalogos.any()).all()]
+    for contrato_id in contratos_ids:
+        total = reconstruir_catalogo_base(contrato_id)
+        registrar_snapshot_catalogo_base(contrato_id)
+        print(f"✅ Contrato {contrato_id}: {total} conceptos en el catálogo base")
+    db.session.commit()
+
+@app.cli.command('reconstruir-acumulados-avance')
+def reconstruir_acumulados_avance_cmd():
+    """Recalcula desde los avances registrados los acumulados por concepto de todos los contratos."""
+    from services.avances import reconstruir_acumulados_avance
+
+    # También los que ya no tienen avances pero conservan acumulados
+    contratos_ids = {c.id for c in Contrato.query.filter(Contrato.avances.any()).all()}
+    contratos_ids |= {a.contrato_id for a in AcumuladoAvance.query.with_entities(AcumuladoAvance.contrato_id).distinct()}
+    for contrato_id in sorted(contratos_ids):
+        total = reconstruir_acumulados_avance(contrato_id)
+        print(f"✅ Contrato {contrato_id}: {total} conceptos con avance")
+    db.session.commit()
+
+@app.cli.command('recuperar-trabajos')
+def recuperar_trabajos_cmd():
+    """Marca como fallidos los trabajos que quedaron a medias y descarta lo que dejaron (p. ej. versiones de catálogo)."""
+    from services.trabajos import recuperar_trabajos_interrumpidos
+
+    total = recuperar_trabajos_interrumpidos()
+    print(f"✅ {total} trabajos interrumpidos recuperados")
+
 # ======================= FILTROS =======================
 
 # Establecer configuración regional para moneda mexicana
@@ -152,4 +221,10 @@ if __name__ == '__main__':
         db.session.commit()
         print("✅ Empresas cargadas correctamente")
 
+        # Los trabajos en segundo plano no sobreviven a un reinicio: los que quedaron a medias se
+        # marcan como fallidos y se descarta lo que dejaron (versiones de catálogo incompletas)
+        from services.trabajos import recuperar_trabajos_interrumpidos
+        if recuperar_trabajos_interrumpidos():
+            print("⚠️ Se recuperaron trabajos interrumpidos")
+
     app.run(debug=True, host='127.0.0.1', port=5055)
\ No newline at end of file
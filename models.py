@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import date
+from datetime import date, datetime
 
 # Inicializar SQLAlchemy
 db = SQLAlchemy()
@@ -118,6 +118,10 @@ class Concepto(db.Model):
 # ---------- Modelo Catálogo ----------
 class CatalogoVersion(db.Model):
     __tablename__ = 'catalogo_version'
+    __table_args__ = (
+        db.Index('ix_catalogo_version_contrato_id', 'contrato_id', 'id'),
+        db.Index('ix_catalogo_version_contrato_hash', 'contrato_id', 'hash_archivo'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), nullable=False)
@@ -125,6 +129,9 @@ class CatalogoVersion(db.Model):
     fecha_subida = db.Column(db.Date)
     nombre = db.Column(db.String(100))
     comentario = db.Column(db.Text)
+    hash_archivo = db.Column(db.String(64))  # SHA-256 del archivo subido (uploads/<hash>.<ext>)
+    modo_almacenamiento = db.Column(db.String(20), default='completo')  # completo o cambios (solo lo que cambió)
+    importando = db.Column(db.Boolean, default=False)  # ⏳ El trabajo de importación todavía no termina
 
     conceptos = db.relationship('ConceptoCatalogo', backref='version', lazy=True)
 
@@ -145,6 +152,14 @@ class CatalogoVersion(db.Model):
 
 # ---------- Conceptos del Catálogo ----------
 class ConceptoCatalogo(db.Model):
+    # Para resolver el catálogo base (actual o histórico) por clave y versión, y para leer (o
+    # filtrar por partida) los conceptos de una o varias versiones sin recorrer toda la tabla
+    __table_args__ = (
+        db.Index('ix_concepto_catalogo_clave_version', 'clave_concepto', 'version_id'),
+        db.Index('ix_concepto_catalogo_version_id', 'version_id', 'id'),
+        db.Index('ix_concepto_catalogo_version_partida', 'version_id', 'partida'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     version_id = db.Column(db.Integer, db.ForeignKey('catalogo_version.id'), nullable=False)
     partida = db.Column(db.String(100))
@@ -157,12 +172,17 @@ class ConceptoCatalogo(db.Model):
     cantidad = db.Column(db.Float)
     subtotal = db.Column(db.Float)
     estatus = db.Column(db.String(10), default='E')  # E = Elaboración, R1/R2... = Revisión, A = Aprobado
+    eliminado = db.Column(db.Boolean, default=False)  # 🪦 La clave ya no viene en esta versión (modo 'cambios')
 
 
     # ========== AVANCES DE OBRA ========== #
 
 class AvanceObra(db.Model):
     __tablename__ = 'avance_obra'
+    # Para agregar los avances de un contrato por fecha (panel de avances)
+    __table_args__ = (
+        db.Index('ix_avance_obra_contrato_fecha', 'contrato_id', 'fecha'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), nullable=False)
@@ -176,6 +196,9 @@ class AvanceObra(db.Model):
 
 class DetalleAvance(db.Model):
     __tablename__ = 'detalle_avance'
+    __table_args__ = (
+        db.Index('ix_detalle_avance_avance_id', 'avance_id', 'concepto_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     avance_id = db.Column(db.Integer, db.ForeignKey('avance_obra.id'), nullable=False)
@@ -185,6 +208,21 @@ class DetalleAvance(db.Model):
 
     concepto = db.relationship('ConceptoCatalogo')
 
+# Cantidad y subtotal avanzados de cada concepto en un contrato. Se actualiza en la misma
+# transacción en que se registran o eliminan avances (ver services/avances.py) y se puede
+# reconstruir con `flask reconstruir-acumulados-avance`.
+class AcumuladoAvance(db.Model):
+    __tablename__ = 'acumulado_avance'
+    __table_args__ = (
+        db.UniqueConstraint('contrato_id', 'concepto_id', name='uq_acumulado_avance_contrato_concepto'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), nullable=False)
+    concepto_id = db.Column(db.Integer, db.ForeignKey('concepto_catalogo.id'), nullable=False)
+    cantidad_acumulada = db.Column(db.Float, nullable=False, default=0.0)
+    subtotal_acumulado = db.Column(db.Float, nullable=False, default=0.0)
+
 
 # ========== PREFINIQUITOS ========== #
 
@@ -209,6 +247,12 @@ class Prefiniquito(db.Model):
 # Este modelo representa el detalle por concepto dentro del prefiniquito.
 # Se guarda cada concepto comparado, incluyendo aquellos sin cambios.
 class DetallePrefiniquito(db.Model):
+    # Para paginar por llave los renglones de un prefiniquito y filtrarlos o totalizarlos por partida
+    __table_args__ = (
+        db.Index('ix_detalle_prefiniquito_prefiniquito_id', 'prefiniquito_id', 'id'),
+        db.Index('ix_detalle_prefiniquito_partida', 'prefiniquito_id', 'partida'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     prefiniquito_id = db.Column(db.Integer, db.ForeignKey('prefiniquito.id'), nullable=False)
@@ -364,12 +408,76 @@ class CatalogoBaseAcumulado(db.Model):
     # Hash SHA-256 del contenido para detectar duplicados o cambios
     hash_contenido = db.Column(db.String(64))
 
-    # ✅ Contenido del catálogo acumulado como JSON serializado
-    conceptos_json = db.Column(db.Text, nullable=False)
+    # ✅ Contenido del catálogo acumulado como JSON serializado (versiones anteriores al formato comprimido)
+    conceptos_json = db.Column(db.Text, nullable=True)
+
+    # Contenido comprimido (zlib + JSON): catálogo completo si es_checkpoint, si no, delta contra la versión anterior
+    contenido = db.Column(db.LargeBinary, nullable=True)
+    es_checkpoint = db.Column(db.Boolean, default=False)
+
+    # Marca del catálogo base (última versión:contador de cambios) de la que salió esta instantánea
+    marca_fuente = db.Column(db.String(50))
 
     # Relación inversa para acceso desde el contrato
     contrato = db.relationship('Contrato', backref='catalogos_base_acumulados')
 
+# ========== CATÁLOGO BASE VIGENTE ==========
+# Una fila por (contrato, clave) con el concepto que hoy resulta de aplicar todas las
+# versiones del catálogo. Se mantiene de forma incremental al subir un catálogo o al
+# cambiar el estatus de un extraordinario (ver services/catalogo_base.py).
+class CatalogoBaseActual(db.Model):
+    __tablename__ = 'catalogo_base_actual'
+    __table_args__ = (
+        db.UniqueConstraint('contrato_id', 'clave', name='uq_catalogo_base_actual_contrato_clave'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), nullable=False)
+    clave = db.Column(db.String(50), nullable=False)
+
+    # Concepto del catálogo (de la versión que "ganó") del que se copiaron los datos
+    concepto_id = db.Column(db.Integer, db.ForeignKey('concepto_catalogo.id'), nullable=False)
+
+    partida = db.Column(db.String(100))
+    nombre_partida = db.Column(db.String(100))
+    concepto = db.Column(db.String(100))
+    descripcion = db.Column(db.Text)
+    unidad = db.Column(db.String(50))
+    precio_unitario = db.Column(db.Float)
+    cantidad = db.Column(db.Float)
+    subtotal = db.Column(db.Float)
+    estatus = db.Column(db.String(10))
+
+# Contador de cambios del catálogo base vigente por contrato. Junto con el id de la última
+# CatalogoVersion forma la "marca" con la que se valida la caché del catálogo base.
+class MarcaCatalogoBase(db.Model):
+    __tablename__ = 'marca_catalogo_base'
+
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), primary_key=True)
+    contador_cambios = db.Column(db.Integer, nullable=False, default=0)
+
+# ========== TRABAJOS EN SEGUNDO PLANO ==========
+# Estado de los procesos largos (importar catálogo, generar prefiniquito) que corren fuera
+# de la solicitud HTTP; la pantalla de resultado consulta su avance (ver services/trabajos.py).
+class TrabajoSegundoPlano(db.Model):
+    __tablename__ = 'trabajo_segundo_plano'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # p. ej. 'subir_catalogo'
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_proceso, terminado, error
+    contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), nullable=True)
+    parametros = db.Column(db.Text)  # JSON con los argumentos del trabajo
+
+    paso = db.Column(db.String(100))  # Descripción del paso actual
+    filas_procesadas = db.Column(db.Integer, default=0)
+    mensaje = db.Column(db.Text)  # Resultado o error
+
+    fecha_creacion = db.Column(db.DateTime, default=datetime.now)
+    fecha_inicio = db.Column(db.DateTime)
+    fecha_fin = db.Column(db.DateTime)
+
+    contrato = db.relationship('Contrato', backref='trabajos')
+
     #----estatus concepto extraordinario E R1 R2 etc----
 class EstatusConcepto(db.Model):
     __tablename__ = 'estatus_concepto'
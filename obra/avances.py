@@ -1,8 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, url_for
-from models import db, Contrato, CatalogoVersion, ConceptoCatalogo, AvanceObra, DetalleAvance
+from flask import Blueprint, render_template, request, redirect, url_for, abort, jsonify, current_app
+from models import db, Contrato, CatalogoVersion, AvanceObra, DetalleAvance
 from datetime import date
-from sqlalchemy import func
-from services.catalogo_base import generar_catalogo_base
+from services.catalogo_base import generar_catalogo_base, conceptos_base_por_id
+from services.importacion_catalogo import guardar_archivo_por_contenido, guardar_reporte_validacion
+from services.lectura_archivos import tiene_errores
+from services.importacion_avances import leer_archivo_avances, importar_avances
+from services.avances import (
+    calcular_panel_avances, columnas_anteriores_panel, AGRUPACIONES, MAX_COLUMNAS,
+    leer_acumulados, restar_avance_de_acumulados, registrar_avances
+)
 
 avances_bp = Blueprint('avances', __name__, url_prefix='/avances', template_folder='../templates')
 
@@ -10,6 +16,16 @@ avances_bp = Blueprint('avances', __name__, url_prefix='/avances', template_fold
 def test():
     return "Avances funcionando"
 
+
+def _cantidades_del_formulario(conceptos_ids):
+    """{concepto_id: cantidad} de los campos `cantidad_<id>` enviados (vacíos cuentan como 0)."""
+    cantidades = {}
+    for concepto_id in conceptos_ids:
+        valor = request.form.get(f'cantidad_{concepto_id}', '').strip()
+        cantidades[int(concepto_id)] = float(valor) if valor else 0.0
+    return cantidades
+
+
 #------subir avances------
 @avances_bp.route('/subir_avance', methods=['GET', 'POST'])
 def subir_avance():
@@ -21,38 +37,14 @@ def subir_avance():
         conceptos_ids = request.form.getlist('concepto_id')
         contrato = Contrato.query.get_or_404(contrato_id)
 
-        numero_version = AvanceObra.query.filter_by(contrato_id=contrato_id).count() + 1
-
-        avance = AvanceObra(
-            contrato_id=contrato_id,
-            fecha=date.fromisoformat(fecha),
-            version_catalogo_id=None,  # Se mantiene nulo al usar catálogo base acumulado
-            numero_version=numero_version
-        )
-        db.session.add(avance)
-        db.session.flush()
-
-        total_registrado = 0
-
-        for concepto_id in conceptos_ids:
-            concepto = ConceptoCatalogo.query.get(concepto_id)
-            valor = request.form.get(f'cantidad_{concepto_id}', '0')
-            cantidad = float(valor) if valor.strip() else 0.0
-
-            if cantidad <= 0:
-                continue
-
-            subtotal = cantidad * concepto.precio_unitario
-            detalle = DetalleAvance(
-                avance_id=avance.id,
-                concepto_id=concepto.id,
-                cantidad_avance=cantidad,
-                subtotal_avance=subtotal
-            )
-            db.session.add(detalle)
-            total_registrado += 1
+        cantidades = _cantidades_del_formulario(conceptos_ids)
+        try:
+            registrados = registrar_avances(contrato_id, {date.fromisoformat(fecha): cantidades})
+        except ValueError as e:
+            db.session.rollback()
+            return render_template('obra/mensaje_subida.html', mensaje=str(e), contrato_id=contrato_id)
 
-        if total_registrado == 0:
+        if not registrados:
             db.session.rollback()
             return redirect(request.referrer + "?error=No+se+ingresaron+datos+de+avance")
 
@@ -65,6 +57,62 @@ def subir_avance():
 
     return render_template('obra/subir_avance.html', contratos=contratos)
 
+# ============================
+# IMPORTAR AVANCES DESDE ARCHIVO
+# ============================
+@avances_bp.route('/importar/<int:contrato_id>', methods=['GET', 'POST'])
+def importar_avances_archivo(contrato_id):
+    contrato = Contrato.query.get_or_404(contrato_id)
+    if request.method == 'GET':
+        return render_template('obra/importar_avances.html', contrato=contrato)
+
+    archivo = request.files.get('archivo')
+    valor_fecha = request.form.get('fecha', '').strip()
+    permitir_excedentes = request.form.get('permitir_excedentes') == '1'
+    formulario = {'contrato': contrato, 'fecha': valor_fecha, 'permitir_excedentes': permitir_excedentes}
+
+    if not archivo or not archivo.filename:
+        return render_template('obra/importar_avances.html', mensaje_error="Selecciona un archivo.", **formulario), 400
+    try:
+        fecha = date.fromisoformat(valor_fecha) if valor_fecha else None
+    except ValueError:
+        return render_template('obra/importar_avances.html', mensaje_error="Fecha inválida.", **formulario), 400
+
+    # Se guarda como uploads/<hash>.<ext>, igual que los catálogos, para poder ligar su reporte
+    filepath, hash_archivo = guardar_archivo_por_contenido(archivo)
+    try:
+        df = leer_archivo_avances(filepath)
+    except ValueError as e:
+        return render_template('obra/importar_avances.html', mensaje_error=str(e), **formulario), 400
+    except Exception as e:
+        return render_template('obra/importar_avances.html', mensaje_error=f"Error al leer el archivo: {e}",
+                               **formulario), 400
+
+    avances, reporte = importar_avances(contrato_id, df, fecha, permitir_excedentes)
+    guardar_reporte_validacion(hash_archivo, reporte)
+    url_reporte = url_for('catalogos.descargar_reporte_validacion', hash_archivo=hash_archivo)
+
+    if tiene_errores(reporte):
+        db.session.rollback()
+        errores = reporte[reporte['nivel'] == 'error']
+        return render_template('obra/importar_avances.html', errores=errores.head(50).to_dict('records'),
+                               total_errores=len(errores), url_reporte=url_reporte, **formulario), 400
+    if not avances:
+        db.session.rollback()
+        return render_template('obra/importar_avances.html', mensaje_error="El archivo no trae cantidades para registrar.",
+                               **formulario), 400
+
+    db.session.commit()
+    fechas = f"{avances[0].fecha:%d/%m/%Y}" if len(avances) == 1 \
+        else f"del {avances[0].fecha:%d/%m/%Y} al {avances[-1].fecha:%d/%m/%Y}"
+    return render_template(
+        'obra/mensaje_subida.html',
+        mensaje=f"Se registraron {len(avances)} avances desde el archivo ({fechas}).",
+        contrato_id=contrato_id,
+        url_reporte=url_reporte,
+        hay_reporte=not reporte.empty
+    )
+
 # ============================
 # HISTORIAL DE AVANCES
 # ============================
@@ -105,7 +153,7 @@ def seleccionar_conceptos(contrato_id):
             )
 
         conceptos_seleccionados = [c for c in catalogo_base if c['clave'] in conceptos_ids]
-        acumulados = calcular_acumulados([c['id'] for c in conceptos_seleccionados], contrato.id)
+        acumulados = leer_acumulados(contrato.id, [c['id'] for c in conceptos_seleccionados])
 
         return render_template(
             'obra/subir_avance.html',
@@ -141,40 +189,16 @@ def guardar_avance_filtrado(contrato_id):
             contrato_id=contrato_id
         )
 
-    numero_version = AvanceObra.query.filter_by(contrato_id=contrato_id).count() + 1
-
-    avance = AvanceObra(
-        contrato_id=contrato_id,
-        fecha=date.fromisoformat(fecha),
-        version_catalogo_id=None,
-        numero_version=numero_version
-    )
-    db.session.add(avance)
-    db.session.flush()
-
-    total_registrado = 0
-    for concepto_id in conceptos_ids:
-        valor = request.form.get(f'cantidad_{concepto_id}', '').strip()
-        cantidad = float(valor) if valor else 0.0
-        if cantidad <= 0:
-            continue
-
-        concepto = ConceptoCatalogo.query.get(concepto_id)
-        subtotal = cantidad * concepto.precio_unitario
-
-        detalle = DetalleAvance(
-            avance_id=avance.id,
-            concepto_id=concepto.id,
-            cantidad_avance=cantidad,
-            subtotal_avance=subtotal
-        )
-        db.session.add(detalle)
-        total_registrado += 1
+    cantidades = _cantidades_del_formulario(conceptos_ids)
+    try:
+        registrados = registrar_avances(contrato_id, {date.fromisoformat(fecha): cantidades})
+    except ValueError as e:
+        db.session.rollback()
+        return render_template('obra/mensaje_subida.html', mensaje=str(e), contrato_id=contrato_id)
 
-    if total_registrado == 0:
+    if not registrados:
         db.session.rollback()
         return redirect(request.referrer + "?error=No+se+ingresaron+datos+de+avance")
-    print(f"Total conceptos registrados: {total_registrado}")
     db.session.commit()
     return render_template(
         'obra/mensaje_subida.html',
@@ -186,6 +210,24 @@ def guardar_avance_filtrado(contrato_id):
 # PANEL DE AVANCES CON SCROLL HORIZONTAL
 # ============================
 
+def _parametros_panel():
+    """Agrupación y ventana de fechas pedidas en la URL del panel (o de sus columnas anteriores)."""
+    def fecha(nombre):
+        valor = request.args.get(nombre)
+        try:
+            return date.fromisoformat(valor) if valor else None
+        except ValueError:
+            abort(400)
+
+    agrupacion = request.args.get('agrupacion', 'fecha')
+    return {
+        'agrupacion': agrupacion if agrupacion in AGRUPACIONES else 'fecha',
+        'desde': fecha('desde'),
+        'hasta': fecha('hasta'),
+        'max_columnas': current_app.config.get('AVANCES_PANEL_MAX_COLUMNAS', MAX_COLUMNAS),
+    }
+
+
 @avances_bp.route('/panel/<int:contrato_id>')
 def panel_avances(contrato_id):
     contrato = Contrato.query.get_or_404(contrato_id)
@@ -194,122 +236,32 @@ def panel_avances(contrato_id):
     if not catalogo_base:
         return "Este contrato no tiene un catálogo base disponible.", 400
 
-    # Obtener todas las fechas de avance en orden ascendente
-    fechas = db.session.query(AvanceObra.fecha) \
-        .filter_by(contrato_id=contrato_id) \
-        .order_by(AvanceObra.fecha.asc()) \
-        .distinct().all()
-    fechas = [f[0] for f in fechas]
-
-    # Construir avance_data por concepto
-    avance_data = {}
-    totales_por_fecha = {f: 0 for f in fechas}
-    totales_cantidades = {f: 0 for f in fechas}
-
-    for concepto in catalogo_base:
-        concepto_id = concepto['id']
-
-        acumulado = db.session.query(func.sum(DetalleAvance.cantidad_avance)) \
-            .join(AvanceObra) \
-            .filter(
-                DetalleAvance.concepto_id == concepto_id,
-                AvanceObra.contrato_id == contrato_id
-            ).scalar() or 0
-
-        subtotal_catalogo = concepto['precio_unitario'] * concepto['cantidad']
-        subtotal_avanzado = concepto['precio_unitario'] * acumulado
-        subtotal_pendiente = subtotal_catalogo - subtotal_avanzado
-
-        cantidades_por_fecha = {}
-        subtotales_por_fecha = {}
-
-        for f in fechas:
-            cantidad = db.session.query(func.sum(DetalleAvance.cantidad_avance)) \
-                .join(AvanceObra) \
-                .filter(
-                    DetalleAvance.concepto_id == concepto_id,
-                    AvanceObra.contrato_id == contrato_id,
-                    AvanceObra.fecha == f
-                ).scalar() or 0
-
-            subtotal_fecha = cantidad * concepto['precio_unitario']
-            cantidades_por_fecha[f] = cantidad
-            subtotales_por_fecha[f] = subtotal_fecha
-
-            totales_por_fecha[f] += subtotal_fecha
-            totales_cantidades[f] += cantidad
-
-        avance_data[concepto_id] = {
-            'concepto': concepto,
-            'acumulado': acumulado,
-            'subtotal_catalogo': subtotal_catalogo,
-            'subtotal_avanzado': subtotal_avanzado,
-            'subtotal_pendiente': subtotal_pendiente,
-            'cantidades_por_fecha': cantidades_por_fecha,
-            'subtotales_por_fecha': subtotales_por_fecha,
-        }
-
-    # Ahora agrupar avance_data por partida
-    from collections import defaultdict
-
-    partidas = defaultdict(lambda: {
-        'nombre_partida': '',
-        'conceptos': [],
-        'subtotal_partida_catalogo': 0.0,
-        'subtotal_partida_avanzado': 0.0,
-        'subtotal_partida_pendiente': 0.0,
-    })
-
-    for info in avance_data.values():
-        partida = info['concepto']['partida']
-        partidas[partida]['nombre_partida'] = info['concepto']['nombre_partida']
-        partidas[partida]['conceptos'].append(info)
-        partidas[partida]['subtotal_partida_catalogo'] += info['subtotal_catalogo']
-        partidas[partida]['subtotal_partida_avanzado'] += info['subtotal_avanzado']
-        partidas[partida]['subtotal_partida_pendiente'] += info['subtotal_pendiente']
-
-    # Ordenar partidas por clave
-    partidas = dict(sorted(partidas.items()))
+    # Matriz concepto × fecha a partir de un solo GROUP BY, agrupada por periodo en el servidor;
+    # solo se mandan las últimas columnas de la ventana (las anteriores se piden por JSON)
+    parametros = _parametros_panel()
+    panel = calcular_panel_avances(contrato_id, catalogo_base, **parametros)
 
     return render_template(
         'obra/panel_avances.html',
         contrato=contrato,
-        fechas=fechas,
-        partidas=partidas,
-        totales_por_fecha=totales_por_fecha,
-        totales_cantidades=totales_cantidades
+        agrupaciones=AGRUPACIONES,
+        agrupacion=parametros['agrupacion'],
+        desde=parametros['desde'],
+        hasta=parametros['hasta'],
+        **panel
     )
 
-# ============================
-# FUNCIÓN AUXILIAR: CALCULAR ACUMULADOS
-# ============================
-
-def calcular_acumulados(conceptos_ids, contrato_id):
-    acumulados = {}
-    for concepto_id in conceptos_ids:
-        total = db.session.query(func.sum(DetalleAvance.cantidad_avance)) \
-            .join(AvanceObra) \
-            .filter(DetalleAvance.concepto_id == concepto_id) \
-            .filter(AvanceObra.contrato_id == contrato_id) \
-            .scalar() or 0
-        acumulados[int(concepto_id)] = total
-    return acumulados
 
+@avances_bp.route('/panel/<int:contrato_id>/columnas')
+def columnas_panel_avances(contrato_id):
+    """Columnas anteriores del panel (?antes=<clave de periodo>), con la misma agrupación y ventana."""
+    Contrato.query.get_or_404(contrato_id)
+    antes = request.args.get('antes')
+    if not antes:
+        abort(400)
 
-# ============================
-# FUNCIÓN AUXILIAR: CALCULAR ACUMULADOS
-# ============================
-
-def calcular_acumulados(conceptos_ids, contrato_id):
-    acumulados = {}
-    for concepto_id in conceptos_ids:
-        total = db.session.query(func.sum(DetalleAvance.cantidad_avance)) \
-            .join(AvanceObra) \
-            .filter(DetalleAvance.concepto_id == concepto_id) \
-            .filter(AvanceObra.contrato_id == contrato_id) \
-            .scalar() or 0
-        acumulados[int(concepto_id)] = total
-    return acumulados
+    catalogo_base = [c for c in generar_catalogo_base(contrato_id) if c['cantidad'] > 0]
+    return jsonify(columnas_anteriores_panel(contrato_id, catalogo_base, antes, **_parametros_panel()))
 
 def agrupar_por_partida(lista_conceptos):
     from collections import defaultdict
@@ -328,8 +280,10 @@ def detalle_avance(avance_id):
     contrato = avance.contrato
     detalles_raw = avance.detalles
 
-    # Obtener catálogo base acumulado
-    catalogo_base = {c['id']: c for c in generar_catalogo_base(contrato.id)}
+    # Catálogo base tal como estaba cuando se capturó el avance (los avances anteriores a que se
+    # guardara la versión se resuelven por fecha); los conceptos que falten salen del vigente
+    as_of = avance.version_catalogo_id or avance.fecha
+    catalogo_base = conceptos_base_por_id(contrato.id, [d.concepto_id for d in detalles_raw], as_of=as_of)
 
     # Preparar los detalles enriquecidos
     detalles = []
@@ -356,7 +310,8 @@ def eliminar_avance(avance_id):
     contrato_id = avance.contrato_id
 
     try:
-        # Eliminar primero los detalles vinculados
+        # Descontar de los acumulados y eliminar primero los detalles vinculados
+        restar_avance_de_acumulados(avance)
         DetalleAvance.query.filter_by(avance_id=avance.id).delete()
         db.session.delete(avance)
         db.session.commit()
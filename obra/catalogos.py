@@ -1,18 +1,36 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, abort, send_file, Response
 from models import db, Contrato, CatalogoVersion, ConceptoCatalogo
-import os
-import pandas as pd
 from datetime import date
+from sqlalchemy import select, func
 from sqlalchemy.orm import joinedload
-from services.prefiniquitos import generar_prefiniquito
+from services.catalogo_base import (
+    reconstruir_catalogo_base, registrar_snapshot_catalogo_base, obtener_contrato, obtener_version_original,
+    conceptos_de_version, consulta_conceptos_version, totales_partida_version,
+    obtener_versiones_cambios_siguientes, guardar_version_completa, obtener_version_terminada
+)
+from services.importacion_catalogo import (
+    validar_archivo, guardar_archivo_por_contenido, buscar_version_importada, buscar_archivo_subido,
+    ErroresValidacion, guardar_reporte_validacion, buscar_reporte_validacion, obtener_ultima_aprobacion_id
+)
+from services.vista_previa_catalogo import obtener_vista_previa, pagina_vista_previa, TIPOS_CAMBIO
+from services.matriz_catalogo import obtener_matriz_catalogo, pagina_matriz, matriz_a_csv, CAMPOS_MATRIZ
+from services.trabajos import encolar_trabajo
+from services.paginacion import paginar_keyset, filtro_texto
+from obra.prefiniquitos import historial_prefiniquitos, detalle_prefiniquito
 from collections import defaultdict
+import os
 from flask import flash
 from models import AprobacionConcepto, RevisionConcepto
 
 
 catalogos_bp = Blueprint('catalogos', __name__, template_folder='../templates')
 
+# Columnas que muestra el listado de conceptos de una versión
+_COLUMNAS_LISTADO = [
+    'id', 'partida', 'nombre_partida', 'clave_concepto', 'concepto', 'descripcion', 'unidad',
+    'cantidad', 'precio_unitario', 'subtotal'
+]
+
 #----SUBIR CATALOGO-----
 @catalogos_bp.route('/subir_catalogo', methods=['GET', 'POST'])
 def subir_catalogo():
@@ -23,137 +41,151 @@ def subir_catalogo():
         contrato_id = request.form.get('contrato_id')
         archivo = request.files.get('archivo')
         comentario = request.form.get('comentario', '').strip()
+        solo_cambios = request.form.get('solo_cambios') == '1'
 
         if not contrato_id or not archivo:
             return "Faltan datos", 400
 
-        contrato = Contrato.query.get(contrato_id)
+        contrato = obtener_contrato(contrato_id)
         if not contrato:
             return "Contrato no encontrado", 404
 
-        filename = secure_filename(archivo.filename)
-        filepath = os.path.join('uploads', filename)
-        os.makedirs('uploads', exist_ok=True)
-        archivo.save(filepath)
-
-        try:
-            df = pd.read_excel(filepath)
-        except Exception as e:
-            return f"Error al leer el archivo: {e}", 400
-
-        columnas_requeridas = [
-            'numero partida',
-            'nombre partida',
-            'clave concepto',
-            'descripcion concepto',
-            'unidad',
-            'precio unitario',
-            'cantidad',
-            'subtotal'
-        ]
-
-        if not all(col in df.columns for col in columnas_requeridas):
-            return "El archivo debe tener las siguientes columnas: " + ", ".join(columnas_requeridas), 400
-
-        original_existente = CatalogoVersion.query.filter_by(contrato_id=contrato_id, tipo='original').first()
-        tipo = 'actualizado' if original_existente else 'original'
-        nombre = f"Catálogo {tipo.capitalize()}"
-
-        nueva_version = CatalogoVersion(
-            contrato_id=contrato_id,
-            tipo=tipo,
-            fecha_subida=date.today(),
-            nombre=nombre,
-            comentario=comentario
-        )
-        db.session.add(nueva_version)
-        db.session.flush()
-
-        for _, fila in df.iterrows():
-            try:
-                precio_unitario = float(str(fila['precio unitario']).replace('$', '').replace(',', '').strip())
-                cantidad = float(fila['cantidad'])
-
-                if 'subtotal' in fila and pd.notnull(fila['subtotal']):
-                    subtotal = float(str(fila['subtotal']).replace('$', '').replace(',', '').strip())
-                else:
-                    subtotal = precio_unitario * cantidad
-            except (ValueError, TypeError):
-                return "Error al convertir valores numéricos. Revisa que los precios, cantidades y subtotales sean válidos.", 400
-
-            clave_concepto = str(fila['clave concepto']).strip()
-
-            concepto = ConceptoCatalogo(
-                version_id=nueva_version.id,
-                clave_concepto=clave_concepto,
-                partida=str(fila['numero partida']).strip(),
-                nombre_partida=str(fila['nombre partida']).strip(),
-                descripcion=str(fila['descripcion concepto']).strip(),
-                unidad=str(fila['unidad']).strip(),
-                precio_unitario=precio_unitario,
-                cantidad=cantidad,
-                subtotal=subtotal
-            )
-            db.session.add(concepto)
-
-        db.session.commit()
-
-        # =======================
-        # CREAR APROBACIÓN Y PRIMERA REVISIÓN PARA EXTRAORDINARIOS NUEVOS
-        # =======================
-        for _, fila in df.iterrows():
-            clave = str(fila['clave concepto']).strip()
-
-            if clave.lower().startswith('e'):
-                descripcion = str(fila['descripcion concepto']).strip()
-                precio_unitario = float(str(fila['precio unitario']).replace('$', '').replace(',', '').strip())
-
-                aprobacion = AprobacionConcepto.query.filter_by(
-                    contrato_id=contrato_id,
-                    clave_concepto=clave
-                ).first()
-
-                if not aprobacion:
-                    # Crear nueva aprobación
-                    aprobacion = AprobacionConcepto(
-                        contrato_id=contrato_id,
-                        clave_concepto=clave,
-                        estado='elaboracion',
-                        precio_unitario=precio_unitario,
-                        descripcion=descripcion
-                    )
-                    db.session.add(aprobacion)
-                    db.session.flush()
-
-                    # Crear primera revisión en estado E
-                    primera = RevisionConcepto(
-                        aprobacion_id=aprobacion.id,
-                        numero_revision=1,
-                        fecha=date.today(),
-                        precio_unitario=precio_unitario,
-                        comentario='Registro inicial desde catálogo',
-                        estado='elaboracion'
-                    )
-                    db.session.add(primera)
-
-        db.session.commit()
-
-        if nueva_version.tipo == 'actualizado':
-            version_original = CatalogoVersion.query \
-                .filter_by(contrato_id=contrato_id, tipo='original') \
-                .order_by(CatalogoVersion.id.asc()) \
-                .first()
-
-            if version_original:
-                generar_prefiniquito(
-                    contrato_id=contrato_id,
-                    version_original_id=version_original.id,
-                    version_actualizada_id=nueva_version.id
-                )
-
-        return render_template('obra/mensaje_subida.html', mensaje="Catálogo cargado correctamente.", contrato_id=contrato_id)
-
-    return render_template('obra/subir_catalogo.html', contratos=contratos, contrato_id_param=contrato_id_param)
+        # Se guarda como uploads/<hash>.<ext>; si ese contenido ya se importó no se procesa otra vez
+        filepath, hash_archivo = guardar_archivo_por_contenido(archivo)
+        respuesta = _verificar_archivo(contrato, filepath, hash_archivo)
+        if respuesta:
+            return respuesta
+
+        # 👀 Vista previa: no se escribe nada hasta que el usuario confirme
+        if request.form.get('accion') == 'vista_previa':
+            return redirect(url_for('catalogos.vista_previa_catalogo', contrato_id=contrato.id,
+                                    hash_archivo=hash_archivo, comentario=comentario or None,
+                                    solo_cambios=1 if solo_cambios else None))
+
+        return _importar_archivo(contrato, filepath, hash_archivo, comentario, solo_cambios)
+
+    return render_template('obra/subir_catalogo.html', contratos=contratos, contrato_id_param=contrato_id_param,
+                           solo_cambios=current_app.config.get('CATALOGO_VERSIONES_SOLO_CAMBIOS', False))
+
+
+def _verificar_archivo(contrato, filepath, hash_archivo):
+    """Respuesta de error (o de archivo repetido) si el archivo no se debe importar; None si se puede."""
+    version_existente = buscar_version_importada(contrato.id, hash_archivo)
+    if version_existente and version_existente.importando:
+        mensaje = "Este archivo ya se está importando; no se volvió a procesar."
+        return render_template('obra/mensaje_subida.html', mensaje=mensaje, contrato_id=contrato.id)
+    if version_existente:
+        fecha = version_existente.fecha_subida.strftime('%d/%m/%Y') if version_existente.fecha_subida else 's/f'
+        mensaje = (f"Este archivo ya se había importado como «{version_existente.nombre}» ({fecha}); "
+                   "no se volvió a procesar.")
+        return render_template('obra/mensaje_subida.html', mensaje=mensaje, contrato_id=contrato.id)
+
+    # Solo se validan los encabezados; las filas se importan en segundo plano
+    try:
+        validar_archivo(filepath)
+    except ValueError as e:
+        return str(e), 400
+    except Exception as e:
+        return f"Error al leer el archivo: {e}", 400
+    return None
+
+
+def _importar_archivo(contrato, filepath, hash_archivo, comentario, solo_cambios):
+    """Crea la versión del catálogo y encola su importación."""
+    original_existente = obtener_version_original(contrato.id)
+    tipo = 'actualizado' if original_existente else 'original'
+    nombre = f"Catálogo {tipo.capitalize()}"
+    # Un catálogo actualizado puede guardar solo lo que cambió respecto al catálogo base
+    modo = 'cambios' if solo_cambios and tipo == 'actualizado' else 'completo'
+
+    nueva_version = CatalogoVersion(
+        contrato_id=contrato.id,
+        tipo=tipo,
+        fecha_subida=date.today(),
+        nombre=nombre,
+        comentario=comentario,
+        hash_archivo=hash_archivo,  # si la importación falla, el trabajo descarta la versión con todo y hash
+        modo_almacenamiento=modo,
+        importando=True  # no se ve en ninguna consulta hasta que el trabajo la aplica al catálogo base
+    )
+    db.session.add(nueva_version)
+    db.session.commit()
+
+    # Importación, aprobaciones de extraordinarios, catálogo base y prefiniquito
+    trabajo = encolar_trabajo('subir_catalogo', contrato_id=contrato.id,
+                              version_id=nueva_version.id, filepath=filepath, hash_archivo=hash_archivo,
+                              ultima_aprobacion_id=obtener_ultima_aprobacion_id())
+
+    return render_template('obra/mensaje_subida.html', mensaje="Catálogo recibido; se está importando.",
+                           contrato_id=contrato.id, trabajo=trabajo,
+                           url_reporte=url_for('catalogos.descargar_reporte_validacion', hash_archivo=hash_archivo),
+                           hay_reporte=buscar_reporte_validacion(hash_archivo) is not None)
+
+
+# ---------- Vista previa de un catálogo antes de importarlo ----------
+@catalogos_bp.route('/subir_catalogo/vista_previa/<int:contrato_id>/<hash_archivo>')
+def vista_previa_catalogo(contrato_id, hash_archivo):
+    contrato = obtener_contrato(contrato_id)
+    filepath = buscar_archivo_subido(hash_archivo)
+    if not contrato or not filepath:
+        abort(404)
+
+    try:
+        vista = obtener_vista_previa(contrato.id, hash_archivo, filepath)
+    except ErroresValidacion as e:
+        # El archivo no se podría importar: se muestra el error con el reporte completo
+        guardar_reporte_validacion(hash_archivo, e.reporte)
+        return render_template('obra/mensaje_subida.html', mensaje=f"❌ {e}", contrato_id=contrato.id,
+                               url_reporte=url_for('catalogos.descargar_reporte_validacion', hash_archivo=hash_archivo),
+                               hay_reporte=True), 400
+    except ValueError as e:
+        return str(e), 400
+
+    # El reporte depende solo del contenido del archivo: basta con escribirlo una vez
+    if not vista['advertencias'].empty and not buscar_reporte_validacion(hash_archivo):
+        guardar_reporte_validacion(hash_archivo, vista['advertencias'])
+
+    tipo = request.args.get('tipo')
+    cambios, pagina, paginas, total = pagina_vista_previa(vista, request.args.get('pagina', 1, type=int), tipo)
+
+    return render_template(
+        'obra/vista_previa_catalogo.html',
+        contrato=contrato,
+        hash_archivo=hash_archivo,
+        resumen=vista['resumen'],
+        cambios=cambios,
+        tipo=tipo if tipo in TIPOS_CAMBIO else None,
+        pagina=pagina,
+        paginas=paginas,
+        total=total,
+        comentario=request.args.get('comentario', ''),
+        solo_cambios=request.args.get('solo_cambios') == '1'
+    )
+
+
+# ---------- Reporte de validación de un archivo (CSV) ----------
+@catalogos_bp.route('/subir_catalogo/reporte/<hash_archivo>')
+def descargar_reporte_validacion(hash_archivo):
+    ruta = buscar_reporte_validacion(hash_archivo)
+    if not ruta:
+        abort(404)
+    return send_file(os.path.abspath(ruta), mimetype='text/csv', as_attachment=True,
+                     download_name=f"reporte_validacion_{hash_archivo[:10]}.csv")
+
+
+@catalogos_bp.route('/subir_catalogo/confirmar/<int:contrato_id>/<hash_archivo>', methods=['POST'])
+def confirmar_catalogo(contrato_id, hash_archivo):
+    contrato = obtener_contrato(contrato_id)
+    filepath = buscar_archivo_subido(hash_archivo)
+    if not contrato or not filepath:
+        abort(404)
+
+    respuesta = _verificar_archivo(contrato, filepath, hash_archivo)
+    if respuesta:
+        return respuesta
+
+    return _importar_archivo(contrato, filepath, hash_archivo, request.form.get('comentario', '').strip(),
+                             request.form.get('solo_cambios') == '1')
 
 
 # ---------- Vista de catálogos por contrato ----------
@@ -162,15 +194,60 @@ def catalogos_por_contrato(contrato_id):
     contrato = Contrato.query.get_or_404(contrato_id)
 
     versiones = CatalogoVersion.query \
-        .options(joinedload(CatalogoVersion.conceptos)) \
         .filter_by(contrato_id=contrato_id) \
+        .filter(CatalogoVersion.importando.isnot(True)) \
         .order_by(CatalogoVersion.fecha_subida.desc(), CatalogoVersion.id.desc()) \
         .all()
 
+    # 🔢 Conceptos guardados por versión en un solo GROUP BY (sin cargar los conceptos)
+    conceptos_por_version = dict(db.session.execute(
+        select(ConceptoCatalogo.version_id, func.count())
+        .join(CatalogoVersion, ConceptoCatalogo.version_id == CatalogoVersion.id)
+        .where(CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True),
+               ConceptoCatalogo.eliminado.isnot(True))
+        .group_by(ConceptoCatalogo.version_id)
+    ).all())
+
     return render_template(
         'obra/catalogos_por_contrato.html',
         contrato=contrato,
-        versiones=versiones
+        versiones=versiones,
+        conceptos_por_version=conceptos_por_version
+    )
+
+# ---------- Evolución de los conceptos en todas las versiones ----------
+@catalogos_bp.route('/catalogo_matriz/<int:contrato_id>')
+def matriz_catalogo(contrato_id):
+    contrato = Contrato.query.get_or_404(contrato_id)
+    matriz = obtener_matriz_catalogo(contrato.id)
+
+    # 📤 Exportar la matriz completa (PU, cantidad y subtotal de todas las versiones)
+    if request.args.get('formato') == 'csv':
+        return Response(
+            matriz_a_csv(matriz),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename=matriz_catalogo_{contrato.id}.csv'}
+        )
+
+    campo = request.args.get('campo', 'subtotal')
+    if campo not in CAMPOS_MATRIZ:
+        campo = 'subtotal'
+    partida = request.args.get('partida') or None
+    renglones, pagina, paginas, total = pagina_matriz(matriz, campo, partida, request.args.get('pagina', 1, type=int))
+
+    return render_template(
+        'obra/matriz_catalogo.html',
+        contrato=contrato,
+        versiones=matriz.versiones,
+        renglones=renglones,
+        partidas=list(zip(matriz.partidas.to_dict('records'), matriz.subtotal_partida.tolist())),
+        total_version=matriz.total_version.tolist(),
+        campo=campo,
+        campos=CAMPOS_MATRIZ,
+        partida=partida,
+        pagina=pagina,
+        paginas=paginas,
+        total=total
     )
 
 # ---------- Ver todos los contratos con catálogo ----------
@@ -184,25 +261,49 @@ def ver_catalogos():
 # ---------- Ver conceptos de una versión específica ----------
 @catalogos_bp.route('/catalogo_conceptos/<int:version_id>')
 def ver_catalogo_conceptos(version_id):
-    version = CatalogoVersion.query.get_or_404(version_id)
+    version = obtener_version_terminada(version_id)
+    if version is None:
+        abort(404)
     contrato = version.contrato
-    conceptos = ConceptoCatalogo.query.filter_by(version_id=version_id).all()
+
+    # La versión completa, aunque se haya guardado solo con los cambios, filtrada y paginada en SQL
+    filtros = {
+        'partida': request.args.get('partida') or None,
+        'texto': request.args.get('texto') or None,
+    }
+    consulta = consulta_conceptos_version(version, _COLUMNAS_LISTADO)
+    if filtros['partida'] is not None:
+        consulta = consulta.where(ConceptoCatalogo.partida == filtros['partida'])
+    condicion = filtro_texto(filtros['texto'], ConceptoCatalogo.clave_concepto, ConceptoCatalogo.descripcion)
+    if condicion is not None:
+        consulta = consulta.where(condicion)
+
+    pagina = paginar_keyset(
+        consulta,
+        ConceptoCatalogo.id,
+        despues=request.args.get('despues', type=int),
+        antes=request.args.get('antes', type=int)
+    )
 
     return render_template(
         'obra/catalogo_conceptos.html',
         contrato=contrato,
         version=version,
-        conceptos=conceptos
+        conceptos=pagina.filas,
+        pagina=pagina,
+        filtros=filtros,
+        totales_partida=totales_partida_version(version)
     )
 
 # ---------- Ver conceptos por versión específica con agrupación ----------
 @catalogos_bp.route('/catalogo_conceptos_version/<int:version_id>')
 def ver_conceptos_version(version_id):
-    version = CatalogoVersion.query.get_or_404(version_id)
+    version = obtener_version_terminada(version_id)
+    if version is None:
+        abort(404)
     contrato = version.contrato
-    conceptos = ConceptoCatalogo.query \
-        .filter_by(version_id=version_id) \
-        .order_by(ConceptoCatalogo.partida, ConceptoCatalogo.concepto).all()
+    conceptos = sorted(conceptos_de_version(version),
+                       key=lambda c: (c.partida is not None, c.partida or '', c.concepto is not None, c.concepto or ''))
 
     from collections import defaultdict
 
@@ -248,53 +349,34 @@ def ver_conceptos_version(version_id):
 # ---------- Prefiniquitos por contrato ----------
 @catalogos_bp.route('/prefiniquitos/<int:contrato_id>')
 def ver_prefiniquitos(contrato_id):
-    contrato = Contrato.query.get_or_404(contrato_id)
-
-    prefiniquitos = contrato.prefiniquitos
-    prefiniquitos = sorted(prefiniquitos, key=lambda p: p.fecha_generacion, reverse=True)
-
-    return render_template(
-        'obra/historial_prefiniquitos.html',
-        contrato=contrato,
-        prefiniquitos=prefiniquitos
-    )
+    # Misma URL que prefiniquitos.historial_prefiniquitos (prefiniquitos guardados y comparaciones
+    # disponibles); se atiende con esa vista
+    return historial_prefiniquitos(contrato_id)
 
 # ---------- Detalle de un prefiniquito ----------
 @catalogos_bp.route('/prefiniquito_detalle/<int:prefiniquito_id>')
 def ver_prefiniquito_detalle(prefiniquito_id):
-    from models import Prefiniquito, DetallePrefiniquito
-
-    prefiniquito = Prefiniquito.query.get_or_404(prefiniquito_id)
-    detalles = DetallePrefiniquito.query.filter_by(prefiniquito_id=prefiniquito.id).all()
-
-    return render_template(
-        'obra/prefiniquito_detalle.html',
-        prefiniquito=prefiniquito,
-        detalles=detalles
-    )
+    # Misma vista que prefiniquitos.detalle_prefiniquito (paginada y con filtros)
+    return detalle_prefiniquito(prefiniquito_id)
 
 # ---------- Vista del Catálogo Base acumulado ----------
 @catalogos_bp.route('/catalogo_base/<int:contrato_id>')
 def ver_catalogo_base(contrato_id):
-    from datetime import date
-    from types import SimpleNamespace
     from collections import defaultdict
-    from models import CatalogoBaseAcumulado
-    from services.catalogo_base import guardar_catalogo_base_si_nuevo
-    import json
+    from services.catalogo_base import obtener_snapshot_catalogo_base
 
     # 🔍 Obtener el contrato
     contrato = Contrato.query.get_or_404(contrato_id)
 
-    # 📦 Obtener la versión guardada del catálogo (o crear una nueva si ha cambiado)
-    catalogo_guardado = guardar_catalogo_base_si_nuevo(contrato_id)
+    # 📦 Obtener la última instantánea del catálogo (solo lectura: se registran al subir catálogos o cambiar estatus)
+    # o una versión anterior si se pide con ?version=N
+    catalogo_guardado = obtener_snapshot_catalogo_base(contrato_id, version=request.args.get('version', type=int))
 
     # ⚠️ Si no hay contenido guardado, mostramos error
-    if not catalogo_guardado or not catalogo_guardado.conceptos_json:
+    if not catalogo_guardado or not catalogo_guardado.conceptos:
         return "No se pudo generar el Catálogo Base.", 400
 
-    # 🔄 Convertimos el JSON guardado a lista de diccionarios
-    conceptos = json.loads(catalogo_guardado.conceptos_json)
+    conceptos = catalogo_guardado.conceptos
 
     # ========================
     # Agrupar conceptos por partida
@@ -309,7 +391,7 @@ def ver_catalogo_base(contrato_id):
     for c in conceptos:
         key = (c['partida'], c['nombre_partida'])
         partidas[key]['nombre_partida'] = c['nombre_partida']
-        partidas[key]['conceptos'].append(SimpleNamespace(**c))  # Convertimos a objeto para usar en plantilla
+        partidas[key]['conceptos'].append(c)  # ConceptoBase ya se puede usar como objeto en la plantilla
         partidas[key]['subtotal_partida'] += c['subtotal']
         total_catalogo += c['subtotal']
 
@@ -344,6 +426,13 @@ def ver_catalogo_base(contrato_id):
         version_catalogo=catalogo_guardado.version
     )
 
+# ---------- Estadísticas de la caché del Catálogo Base ----------
+@catalogos_bp.route('/catalogo_base/cache')
+def estadisticas_cache_catalogo_base():
+    from services.catalogo_base import cache_catalogo_base
+
+    return cache_catalogo_base.estadisticas()
+
 # ---------- Actualizar comentario de versión ----------
 @catalogos_bp.route('/actualizar_comentario/<int:version_id>', methods=['POST'])
 def actualizar_comentario(version_id):
@@ -357,7 +446,10 @@ def actualizar_comentario(version_id):
 
 @catalogos_bp.route('/eliminar_catalogo/<int:version_id>', methods=['POST'])
 def eliminar_catalogo(version_id):
-    version = CatalogoVersion.query.get_or_404(version_id)
+    # Una versión que se sigue importando la descarta su propio trabajo si falla
+    version = obtener_version_terminada(version_id)
+    if version is None:
+        abort(404)
 
     # Eliminar prefiniquitos relacionados (y sus detalles)
     from models import Prefiniquito, DetallePrefiniquito
@@ -371,11 +463,22 @@ def eliminar_catalogo(version_id):
         DetallePrefiniquito.query.filter_by(prefiniquito_id=pref.id).delete()
         db.session.delete(pref)
 
+    # Las versiones 'cambios' posteriores heredan del catálogo base, que incluye lo de esta versión
+    # (también detrás de una versión completa: el catálogo base conserva todas las claves), así
+    # que primero se guardan completas. En orden: cada una se arma con las anteriores intactas
+    for siguiente in obtener_versiones_cambios_siguientes(version):
+        guardar_version_completa(siguiente)
+
     # Eliminar conceptos del catálogo
     ConceptoCatalogo.query.filter_by(version_id=version.id).delete()
 
     # Eliminar el catálogo
     db.session.delete(version)
+    db.session.flush()
+
+    # Sin esta versión el catálogo base vigente se vuelve a calcular con las restantes
+    reconstruir_catalogo_base(version.contrato_id)
+    registrar_snapshot_catalogo_base(version.contrato_id)
     db.session.commit()
 
     flash("Catálogo y prefiniquito relacionado eliminados correctamente.", "success")
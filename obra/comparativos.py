@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template
-from models import Contrato, Prefiniquito, DetalleAvance, AvanceObra, ConceptoCatalogo
+from models import db, Contrato, Prefiniquito, AcumuladoAvance, ConceptoCatalogo
+from sqlalchemy import select, func
 from collections import defaultdict
+from services.prefiniquitos import obtener_comparacion_vigente
 
 comparativos_bp = Blueprint('comparativos', __name__, template_folder='../templates')
 
@@ -9,10 +11,8 @@ comparativos_bp = Blueprint('comparativos', __name__, template_folder='../templa
 def comparativo_prefiniquito_avances(contrato_id):
     contrato = Contrato.query.get_or_404(contrato_id)
 
-    prefiniquito = Prefiniquito.query \
-        .filter_by(contrato_id=contrato_id) \
-        .order_by(Prefiniquito.id.desc()) \
-        .first()
+    # Original contra el catálogo vigente, calculado bajo demanda (en caché mientras no cambie)
+    prefiniquito = obtener_comparacion_vigente(contrato_id)
 
     if not prefiniquito:
         return render_template('obra/comparativo_prefiniquito_avances.html',
@@ -23,17 +23,13 @@ def comparativo_prefiniquito_avances(contrato_id):
                                monto_original_contrato=0,
                                diferencia_total=0)
 
-    avances = DetalleAvance.query \
-        .join(AvanceObra) \
-        .filter(AvanceObra.contrato_id == contrato_id) \
-        .all()
-
-    avance_dict = defaultdict(float)
-
-    for a in avances:
-        if a.concepto:
-            clave = a.concepto.clave_concepto
-            avance_dict[clave] += a.cantidad_avance or 0
+    # Cantidad avanzada por clave, desde los acumulados por concepto
+    avance_dict = dict(db.session.execute(
+        select(ConceptoCatalogo.clave_concepto, func.sum(AcumuladoAvance.cantidad_acumulada))
+        .join(ConceptoCatalogo, AcumuladoAvance.concepto_id == ConceptoCatalogo.id)
+        .where(AcumuladoAvance.contrato_id == contrato_id)
+        .group_by(ConceptoCatalogo.clave_concepto)
+    ).all())
 
     filas_por_partida = defaultdict(list)
     totales_por_partida = defaultdict(lambda: {
@@ -58,7 +54,8 @@ def comparativo_prefiniquito_avances(contrato_id):
         subtotal_avance = cantidad_avance * precio_unitario
         subtotal_pendiente = cantidad_pendiente * precio_unitario
 
-        concepto = ConceptoCatalogo.query.filter_by(clave_concepto=clave).order_by(ConceptoCatalogo.id.desc()).first()
+        concepto = ConceptoCatalogo.query.filter_by(clave_concepto=clave).filter(ConceptoCatalogo.eliminado.isnot(True))\
+            .order_by(ConceptoCatalogo.id.desc()).first()
         estatus = concepto.estatus if concepto else ''
 
         fila = {
@@ -97,7 +94,7 @@ def comparativo_prefiniquito_avances(contrato_id):
         'total_pendiente': subtotal_general_pendiente * 1.16
     }
 
-    # ✅ Obtener monto original del contrato desde el objeto prefiniquito
+    # ✅ Obtener monto original del contrato desde el prefiniquito
     monto_original_contrato = sum(
         (d.cantidad_original or 0) * (d.precio_unitario_original or 0)
         for d in prefiniquito.detalles
@@ -1,73 +1,29 @@
 from flask import Blueprint, render_template, request, redirect, url_for
-from models import CatalogoVersion, CatalogoBaseAcumulado, db
+from models import CatalogoVersion, db
 from sqlalchemy.orm import joinedload
 from datetime import date
-import hashlib
-import json
 from models import Contrato, Estimacion
 
 # Crear blueprint
 estimaciones_nuevo_bp = Blueprint('estimaciones_nuevo', __name__, url_prefix='/estimaciones', template_folder='templates')
 
-# ============================================
-# Guardar nueva versión del Catálogo Base Acumulado (si cambia el contenido)
-# ============================================
-def guardar_catalogo_base_si_nuevo(contrato_id, forzar=False):
-    from services.catalogo_base import generar_catalogo_base
-
-    conceptos = generar_catalogo_base(contrato_id)
-
-    if not conceptos:
-        return None
-
-    contenido_json = json.dumps(sorted(conceptos, key=lambda c: c['clave']), sort_keys=True)
-    hash_actual = hashlib.sha256(contenido_json.encode('utf-8')).hexdigest()
-
-    ultima_version = CatalogoBaseAcumulado.query.filter_by(contrato_id=contrato_id) \
-        .order_by(CatalogoBaseAcumulado.version.desc()).first()
-
-    if not forzar and ultima_version and ultima_version.hash_contenido == hash_actual:
-        return ultima_version
-
-    nueva_version = (ultima_version.version + 1) if ultima_version else 1
-
-    nuevo_catalogo = CatalogoBaseAcumulado(
-        contrato_id=contrato_id,
-        version=nueva_version,
-        hash_contenido=hash_actual,
-        conceptos_json=contenido_json
-    )
-    db.session.add(nuevo_catalogo)
-    db.session.commit()
-
-    return nuevo_catalogo
-
 # ============================================
 # Crear estimación (pantalla inicial)
 # ============================================
-from services.catalogo_base import generar_catalogo_base
+from services.catalogo_base import generar_catalogo_base, obtener_claves_extraordinarios_aprobados, conceptos_base_por_clave
 
 @estimaciones_nuevo_bp.route('/crear_estimacion/<int:contrato_id>', methods=['GET', 'POST'])
 def crear_estimacion(contrato_id):
-    conceptos = generar_catalogo_base(contrato_id)
-
-    # Filtrar: ordinarios + extraordinarios con estatus A
-    conceptos_filtrados = [
-        c for c in conceptos
-        if not c['clave'].startswith('E') or c.get('estatus') == 'A'
-    ]
+    catalogo_base = generar_catalogo_base(contrato_id)
+    aprobados = obtener_claves_extraordinarios_aprobados(contrato_id)
 
-    # Agrupar por partida
+    # Por partida (ya agrupado en el catálogo base): ordinarios + extraordinarios con estatus A,
+    # ordenados por clave
     conceptos_por_partida = {}
-    for c in conceptos_filtrados:
-        nombre_partida = c.get('nombre_partida', 'SIN PARTIDA')
-        if nombre_partida not in conceptos_por_partida:
-            conceptos_por_partida[nombre_partida] = []
-        conceptos_por_partida[nombre_partida].append(c)
-
-    # Ordenar conceptos por clave
-    for partida in conceptos_por_partida:
-        conceptos_por_partida[partida].sort(key=lambda x: x['clave'])
+    for nombre_partida, conceptos in catalogo_base.por_nombre_partida.items():
+        validos = [c for c in conceptos if not c.clave.startswith('E') or c.clave in aprobados]
+        if validos:
+            conceptos_por_partida[nombre_partida] = sorted(validos, key=lambda c: c.clave)
 
     if request.method == 'POST':
         claves = request.form.getlist('clave[]')
@@ -113,9 +69,8 @@ def suma_conceptos():
     cantidades = request.form.to_dict()
     claves = request.form.getlist('clave[]')
 
-    # Obtener conceptos del catálogo base
-    conceptos_base = generar_catalogo_base(contrato_id)
-    conceptos_dict = {c['clave']: c for c in conceptos_base if c['clave'] in claves}
+    # Conceptos del catálogo base por clave
+    conceptos_dict = generar_catalogo_base(contrato_id).por_clave
 
     conceptos_por_partida = {}
     subtotales_por_partida = {}
@@ -131,6 +86,8 @@ def suma_conceptos():
         except ValueError:
             cantidad = 0.0
 
+        # Copia: los conceptos del catálogo base son inmutables y compartidos
+        concepto = concepto._asdict()
         concepto['cantidad_estimacion'] = cantidad
         concepto['subtotal_estimacion'] = cantidad * concepto['precio_unitario']
 
@@ -166,8 +123,7 @@ def guardar_estimacion():
     cantidades = request.form.to_dict()
     claves = request.form.getlist('clave[]')
 
-    conceptos = generar_catalogo_base(contrato_id)
-    conceptos_dict = {c['clave']: c for c in conceptos if c['clave'] in claves}
+    conceptos_dict = generar_catalogo_base(contrato_id).por_clave
 
     numero_estimacion = Estimacion.query.filter_by(contrato_id=contrato_id).count() + 1
     hoy = date.today()
@@ -292,8 +248,7 @@ def guardar_nuevos_conceptos(estimacion_id):
     claves = request.form.getlist('clave[]')
     cantidades = request.form.to_dict()
 
-    conceptos_base = generar_catalogo_base(contrato_id)
-    conceptos_dict = {c['clave']: c for c in conceptos_base if c['clave'] in claves}
+    conceptos_dict = generar_catalogo_base(contrato_id).por_clave
 
     for clave in claves:
         concepto = conceptos_dict.get(clave)
@@ -382,10 +337,16 @@ def detalle_estimacion(estimacion_id):
     estimacion = Estimacion.query.get_or_404(estimacion_id)
     detalles = DetalleEstimacion.query.filter_by(estimacion_id=estimacion_id).all()
 
+    # Catálogo base vigente a la fecha de la estimación (para comparar cantidades contratadas); las
+    # claves que en esa fecha todavía no estaban (catálogo subido después) salen del vigente
+    catalogo_base = conceptos_base_por_clave(estimacion.contrato_id, [d.clave_concepto for d in detalles],
+                                             as_of=estimacion.fecha)
+
     return render_template(
         'estimaciones_nuevo/detalle_estimacion.html',
         estimacion=estimacion,
-        detalles=detalles
+        detalles=detalles,
+        catalogo_base=catalogo_base
     )
 
 @estimaciones_nuevo_bp.route('/estimacion/<int:estimacion_id>/eliminar/<string:clave_concepto>', methods=['GET'])
@@ -407,7 +368,7 @@ def eliminar_concepto_estimacion(estimacion_id, clave_concepto):
 
 @estimaciones_nuevo_bp.route('/agregar_conceptos/<int:estimacion_id>', methods=['GET', 'POST'])
 def agregar_conceptos_estimacion(estimacion_id):
-    from services.catalogo_base import generar_catalogo_base
+    from services.catalogo_base import generar_catalogo_base, obtener_claves_extraordinarios_aprobados
     from models import DetalleEstimacion
 
     estimacion = Estimacion.query.get_or_404(estimacion_id)
@@ -418,13 +379,13 @@ def agregar_conceptos_estimacion(estimacion_id):
 
     # Obtener catálogo base
     conceptos_base = generar_catalogo_base(contrato_id)
+    aprobados = obtener_claves_extraordinarios_aprobados(contrato_id)
 
     # ✅ Filtrar conceptos: ordinarios + extraordinarios solo si estatus == 'A'
     conceptos_disponibles = []
     for c in conceptos_base:
         clave = c.get('clave', '')
-        estatus = c.get('estatus', 'A')
-        if clave.startswith('E') and estatus != 'A':
+        if clave.startswith('E') and clave not in aprobados:
             continue
         if clave not in claves_registradas:
             conceptos_disponibles.append(c)
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from models import db, Contrato, AprobacionConcepto, RevisionConcepto, ConceptoCatalogo
-from services.catalogo_base import generar_catalogo_base
+from models import db, Contrato, AprobacionConcepto, RevisionConcepto, ConceptoCatalogo, CatalogoVersion
+from services.catalogo_base import generar_catalogo_base, recalcular_clave_catalogo_base, registrar_snapshot_catalogo_base
 from datetime import date, datetime
 import os
 
@@ -131,7 +131,9 @@ def nuevo_reg_extra(contrato_id, clave):
         if archivo_pdf_nombre:
             aprobacion.nombre_archivo_pdf = archivo_pdf_nombre
 
-        concepto = ConceptoCatalogo.query.filter_by(clave_concepto=clave)\
+        concepto = ConceptoCatalogo.query.join(CatalogoVersion)\
+            .filter(CatalogoVersion.contrato_id == contrato_id, ConceptoCatalogo.clave_concepto == clave,
+                    CatalogoVersion.importando.isnot(True), ConceptoCatalogo.eliminado.isnot(True))\
             .order_by(ConceptoCatalogo.id.desc()).first()
 
         if concepto:
@@ -144,6 +146,10 @@ def nuevo_reg_extra(contrato_id, clave):
                 concepto.estatus = 'E'
             db.session.add(concepto)
 
+            # El estatus decide si el extraordinario aprobado prevalece en el catálogo base
+            recalcular_clave_catalogo_base(contrato_id, clave)
+            registrar_snapshot_catalogo_base(contrato_id)
+
         db.session.commit()
 
         return redirect(url_for('extraordinarios.historial_revisiones', contrato_id=contrato_id, clave=clave))
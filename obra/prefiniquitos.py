@@ -1,5 +1,12 @@
-from flask import Blueprint, render_template
-from models import Contrato, Prefiniquito, DetallePrefiniquito
+from flask import Blueprint, render_template, request, redirect, url_for, abort, jsonify
+from models import Contrato, Prefiniquito, DetallePrefiniquito, CatalogoVersion
+from services.catalogo_base import obtener_version_original, obtener_version_terminada, resolver_version_as_of
+from services.prefiniquitos import (
+    comparar_versiones_catalogo, congelar_comparacion, consulta_detalles_prefiniquito, totales_partida_prefiniquito,
+    TIPOS_CAMBIO
+)
+from services.paginacion import paginar_keyset
+from datetime import datetime
 
 prefiniquitos_bp = Blueprint('prefiniquitos', __name__, url_prefix='/prefiniquitos')
 
@@ -9,13 +16,23 @@ def historial_prefiniquitos(contrato_id):
     contrato = Contrato.query.get_or_404(contrato_id)
     prefiniquitos = Prefiniquito.query \
         .filter_by(contrato_id=contrato.id) \
-        .order_by(Prefiniquito.fecha_generacion.desc()) \
+        .order_by(Prefiniquito.fecha_generacion.desc(), Prefiniquito.id.desc()) \
+        .all()
+
+    # Solo se listan las versiones; cada comparación se calcula al abrirla
+    versiones = CatalogoVersion.query \
+        .filter_by(contrato_id=contrato.id) \
+        .filter(CatalogoVersion.importando.isnot(True)) \
+        .order_by(CatalogoVersion.id.asc()) \
         .all()
 
     return render_template(
         'obra/historial_prefiniquitos.html',
+        contrato=contrato,
         contrato_id=contrato.id,
-        prefiniquitos=prefiniquitos
+        prefiniquitos=prefiniquitos,
+        versiones=versiones,
+        version_original=obtener_version_original(contrato.id)
     )
 
 # ---------- Detalle del Prefiniquito ----------
@@ -23,11 +40,92 @@ def historial_prefiniquitos(contrato_id):
 def detalle_prefiniquito(prefiniquito_id):
     prefiniquito = Prefiniquito.query.get_or_404(prefiniquito_id)
     contrato = prefiniquito.contrato
-    detalles = prefiniquito.detalles
+
+    # 🔎 Filtros y página (por llave: ?despues=<id> / ?antes=<id>)
+    filtros = {
+        'partida': request.args.get('partida') or None,
+        'tipo_cambio': request.args.get('tipo_cambio') or None,
+        'texto': request.args.get('texto') or None,
+    }
+    pagina = paginar_keyset(
+        consulta_detalles_prefiniquito(prefiniquito.id, **filtros),
+        DetallePrefiniquito.id,
+        despues=request.args.get('despues', type=int),
+        antes=request.args.get('antes', type=int)
+    )
 
     return render_template(
         'obra/prefiniquito_detalle.html',
         contrato=contrato,
         prefiniquito=prefiniquito,
-        detalles=detalles
+        detalles=pagina.filas,
+        pagina=pagina,
+        filtros=filtros,
+        tipos_cambio=TIPOS_CAMBIO,
+        totales_partida=totales_partida_prefiniquito(prefiniquito.id)
+    )
+
+
+def _version_solicitada(contrato_id, parametro, predeterminada):
+    """
+    Versión indicada en la URL por id (`a`, `b`) o por fecha (`fecha_a`, `fecha_b`: la versión
+    vigente ese día). Sin ninguno de los dos se usa `predeterminada`.
+    """
+    fecha = request.args.get(f'fecha_{parametro}')
+    if fecha:
+        try:
+            version_id = resolver_version_as_of(contrato_id, datetime.strptime(fecha, '%Y-%m-%d').date())
+        except ValueError:
+            abort(400)
+    else:
+        version_id = request.args.get(parametro, type=int) or (predeterminada.id if predeterminada else None)
+
+    version = obtener_version_terminada(version_id) if version_id else None
+    if not version or version.contrato_id != contrato_id:
+        abort(404)
+    return version
+
+# ---------- Comparación bajo demanda entre dos versiones ----------
+@prefiniquitos_bp.route('/comparar/<int:contrato_id>')
+def comparar_versiones(contrato_id):
+    contrato = Contrato.query.get_or_404(contrato_id)
+    ultima = CatalogoVersion.query.filter_by(contrato_id=contrato.id) \
+        .filter(CatalogoVersion.importando.isnot(True)).order_by(CatalogoVersion.id.desc()).first()
+
+    version_a = _version_solicitada(contrato.id, 'a', obtener_version_original(contrato.id))
+    version_b = _version_solicitada(contrato.id, 'b', ultima)
+    comparacion = comparar_versiones_catalogo(version_a, version_b)
+
+    if request.args.get('formato') == 'json':
+        return jsonify({
+            'contrato_id': contrato.id,
+            'version_original_id': version_a.id,
+            'version_actualizada_id': version_b.id,
+            'total_original': comparacion.total_original,
+            'total_actualizado': comparacion.total_actualizado,
+            'diferencia_total': comparacion.diferencia_total,
+            'detalles': [d._asdict() for d in comparacion.detalles],
+        })
+
+    versiones = CatalogoVersion.query.filter_by(contrato_id=contrato.id) \
+        .filter(CatalogoVersion.importando.isnot(True)).order_by(CatalogoVersion.id.asc()).all()
+    return render_template(
+        'obra/comparacion_catalogo.html',
+        contrato=contrato,
+        comparacion=comparacion,
+        version_a=version_a,
+        version_b=version_b,
+        versiones=versiones
     )
+
+# ---------- Congelar (guardar) una comparación como prefiniquito ----------
+@prefiniquitos_bp.route('/congelar/<int:contrato_id>', methods=['POST'])
+def congelar_prefiniquito(contrato_id):
+    contrato = Contrato.query.get_or_404(contrato_id)
+    version_a = obtener_version_terminada(request.form.get('a', 0, type=int))
+    version_b = obtener_version_terminada(request.form.get('b', 0, type=int))
+    if not version_a or not version_b or version_a.contrato_id != contrato.id or version_b.contrato_id != contrato.id:
+        abort(404)
+
+    prefiniquito_id = congelar_comparacion(comparar_versiones_catalogo(version_a, version_b))
+    return redirect(url_for('prefiniquitos.detalle_prefiniquito', prefiniquito_id=prefiniquito_id))
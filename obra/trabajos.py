@@ -0,0 +1,12 @@
+from flask import Blueprint
+from models import TrabajoSegundoPlano
+from services.trabajos import estado_trabajo
+
+trabajos_bp = Blueprint('trabajos', __name__)
+
+
+# ---------- Avance de un trabajo en segundo plano (JSON, lo consulta mensaje_subida.html) ----------
+@trabajos_bp.route('/trabajos/<int:trabajo_id>')
+def ver_estado_trabajo(trabajo_id):
+    trabajo = TrabajoSegundoPlano.query.get_or_404(trabajo_id)
+    return estado_trabajo(trabajo)
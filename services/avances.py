@@ -0,0 +1,397 @@
+from models import db, AvanceObra, DetalleAvance, AcumuladoAvance, Estimacion
+from datetime import date, timedelta
+from sqlalchemy import select, func, insert, update, delete, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+from services.catalogo_base import generar_catalogo_base, marca_catalogo_base
+
+
+# ============================================
+# Acumulados por concepto
+# ============================================
+# Tamaño de los bloques de ids en consultas IN (SQLite admite 999 parámetros por consulta)
+_TAMANO_BLOQUE_IDS = 900
+
+
+def leer_acumulados(contrato_id, conceptos_ids=None):
+    """
+    {concepto_id: cantidad acumulada} del contrato, de la tabla `acumulado_avance` por su índice
+    (contrato, concepto). Con `conceptos_ids` solo esos, filtrados en SQL en bloques de ids
+    (0 si no tienen avance).
+    """
+    consulta = select(AcumuladoAvance.concepto_id, AcumuladoAvance.cantidad_acumulada) \
+        .where(AcumuladoAvance.contrato_id == contrato_id)
+    if conceptos_ids is None:
+        return dict(db.session.execute(consulta).all())
+
+    ids = list(dict.fromkeys(int(i) for i in conceptos_ids))
+    filas = {}
+    for inicio in range(0, len(ids), _TAMANO_BLOQUE_IDS):
+        bloque = ids[inicio:inicio + _TAMANO_BLOQUE_IDS]
+        filas.update(db.session.execute(consulta.where(AcumuladoAvance.concepto_id.in_(bloque))).all())
+    return {i: filas.get(i, 0.0) for i in ids}
+
+
+def _sumar_por_concepto(detalles):
+    """{concepto_id: [cantidad, subtotal]} de una lista de (concepto_id, cantidad, subtotal)."""
+    sumas = {}
+    for concepto_id, cantidad, subtotal in detalles:
+        suma = sumas.setdefault(concepto_id, [0.0, 0.0])
+        suma[0] += cantidad
+        suma[1] += subtotal
+    return sumas
+
+
+def sumar_a_acumulados(contrato_id, detalles, signo=1):
+    """
+    Suma (o resta con signo=-1) a los acumulados del contrato los detalles dados como tuplas
+    (concepto_id, cantidad, subtotal). Las filas que falten se crean en 0 (INSERT ... ON CONFLICT
+    DO NOTHING, sin leerlas antes) y luego todas se incrementan en la base de datos (no se leen y
+    reescriben), en la transacción actual. No hace commit.
+    """
+    sumas = _sumar_por_concepto(detalles)
+    if not sumas:
+        return
+
+    db.session.execute(
+        sqlite_insert(AcumuladoAvance).on_conflict_do_nothing(index_elements=['contrato_id', 'concepto_id']),
+        [{'contrato_id': contrato_id, 'concepto_id': concepto_id, 'cantidad_acumulada': 0.0,
+          'subtotal_acumulado': 0.0} for concepto_id in sumas]
+    )
+
+    tabla = AcumuladoAvance.__table__
+    db.session.execute(
+        update(tabla)
+        .where(tabla.c.contrato_id == contrato_id, tabla.c.concepto_id == bindparam('concepto'))
+        .values(cantidad_acumulada=tabla.c.cantidad_acumulada + bindparam('cantidad'),
+                subtotal_acumulado=tabla.c.subtotal_acumulado + bindparam('subtotal')),
+        [{'concepto': concepto_id, 'cantidad': signo * cantidad, 'subtotal': signo * subtotal}
+         for concepto_id, (cantidad, subtotal) in sumas.items()]
+    )
+
+
+def restar_avance_de_acumulados(avance):
+    """Descuenta de los acumulados todos los detalles del avance (antes de eliminarlo). No hace commit."""
+    detalles = db.session.execute(
+        select(DetalleAvance.concepto_id, DetalleAvance.cantidad_avance, DetalleAvance.subtotal_avance)
+        .where(DetalleAvance.avance_id == avance.id)
+    ).all()
+    sumar_a_acumulados(avance.contrato_id, detalles, signo=-1)
+
+
+def reconstruir_acumulados_avance(contrato_id):
+    """
+    Recalcula desde cero los acumulados del contrato a partir de todos sus DetalleAvance
+    (un INSERT ... SELECT con GROUP BY). Devuelve cuántos conceptos tienen avance. No hace commit.
+    """
+    db.session.execute(delete(AcumuladoAvance).where(AcumuladoAvance.contrato_id == contrato_id))
+    sumas = select(
+        AvanceObra.contrato_id, DetalleAvance.concepto_id,
+        func.sum(DetalleAvance.cantidad_avance), func.sum(DetalleAvance.subtotal_avance)
+    ).join(AvanceObra, DetalleAvance.avance_id == AvanceObra.id) \
+        .where(AvanceObra.contrato_id == contrato_id) \
+        .group_by(AvanceObra.contrato_id, DetalleAvance.concepto_id)
+    db.session.execute(
+        insert(AcumuladoAvance).from_select(
+            ['contrato_id', 'concepto_id', 'cantidad_acumulada', 'subtotal_acumulado'], sumas)
+    )
+    return db.session.execute(
+        select(func.count()).where(AcumuladoAvance.contrato_id == contrato_id)
+    ).scalar()
+
+
+# ============================================
+# Registro de avances
+# ============================================
+def registrar_avances(contrato_id, cantidades_por_fecha, catalogo_base=None):
+    """
+    Registra un AvanceObra por fecha con sus detalles y actualiza los acumulados, todo en la
+    transacción actual (no hace commit). `cantidades_por_fecha` es {fecha: {concepto_id: cantidad}};
+    se ignoran las cantidades <= 0 y las fechas que se quedan sin detalles.
+
+    Los conceptos se validan y se valúan con el catálogo base vigente del contrato (ya en caché),
+    sin consultarlos uno por uno; si alguno no forma parte de él se lanza ValueError y no se
+    registra nada. Los detalles de todas las fechas se escriben en una sola inserción en bloque.
+    Devuelve los avances creados, en orden de fecha.
+    """
+    por_fecha = {
+        fecha: {int(concepto_id): float(cantidad) for concepto_id, cantidad in cantidades.items() if cantidad > 0}
+        for fecha, cantidades in sorted(cantidades_por_fecha.items())
+    }
+    por_fecha = {fecha: cantidades for fecha, cantidades in por_fecha.items() if cantidades}
+    if not por_fecha:
+        return []
+
+    por_id = (catalogo_base if catalogo_base is not None else generar_catalogo_base(contrato_id)).por_id
+    desconocidos = sorted({i for cantidades in por_fecha.values() for i in cantidades if i not in por_id})
+    if desconocidos:
+        raise ValueError("Conceptos que no forman parte del catálogo base del contrato: "
+                         + ", ".join(str(i) for i in desconocidos))
+
+    numero_version = db.session.execute(
+        select(func.count()).where(AvanceObra.contrato_id == contrato_id)
+    ).scalar()
+    # Última versión del catálogo base con que se capturó, para verlo después tal como estaba
+    version_catalogo_id = marca_catalogo_base(contrato_id)[0] or None
+    avances = [
+        AvanceObra(contrato_id=contrato_id, fecha=fecha, version_catalogo_id=version_catalogo_id,
+                   numero_version=numero_version + i)
+        for i, fecha in enumerate(por_fecha, start=1)
+    ]
+    db.session.add_all(avances)
+    db.session.flush()
+
+    detalles = [
+        {'avance_id': avance.id, 'concepto_id': concepto_id, 'cantidad_avance': cantidad,
+         'subtotal_avance': cantidad * (por_id[concepto_id].precio_unitario or 0.0)}
+        for avance, cantidades in zip(avances, por_fecha.values())
+        for concepto_id, cantidad in cantidades.items()
+    ]
+    db.session.execute(insert(DetalleAvance), detalles)
+    sumar_a_acumulados(contrato_id, [(d['concepto_id'], d['cantidad_avance'], d['subtotal_avance']) for d in detalles])
+    return avances
+
+
+# ============================================
+# Matriz concepto × fecha de los avances
+# ============================================
+class MatrizAvances(NamedTuple):
+    """Cantidad avanzada de cada concepto en cada fecha de avance del contrato."""
+    fechas: list              # fechas de avance en orden ascendente
+    cantidades: pd.DataFrame  # índice concepto_id, una columna por fecha (0 donde no hubo avance)
+
+
+def matriz_avances(contrato_id):
+    """
+    Un solo GROUP BY (concepto, fecha) sobre DetalleAvance unido a AvanceObra, pivotado en memoria.
+    Las fechas de avances sin detalles también aparecen (con cantidad 0), igual que antes.
+    """
+    filas = db.session.execute(
+        select(DetalleAvance.concepto_id, AvanceObra.fecha, func.sum(DetalleAvance.cantidad_avance))
+        .select_from(AvanceObra)
+        .outerjoin(DetalleAvance, DetalleAvance.avance_id == AvanceObra.id)
+        .where(AvanceObra.contrato_id == contrato_id)
+        .group_by(DetalleAvance.concepto_id, AvanceObra.fecha)
+    ).all()
+    filas = pd.DataFrame(filas, columns=['concepto_id', 'fecha', 'cantidad'])
+
+    fechas = sorted(filas['fecha'].unique())
+    con_concepto = filas[filas['concepto_id'].notna()].astype({'concepto_id': int})
+    cantidades = con_concepto.pivot(index='concepto_id', columns='fecha', values='cantidad') \
+        .reindex(columns=fechas).fillna(0.0)
+    return MatrizAvances(fechas=fechas, cantidades=cantidades)
+
+
+# ============================================
+# Periodos (columnas) del panel de avances
+# ============================================
+AGRUPACIONES = ('fecha', 'semana', 'mes', 'estimacion')
+
+# Columnas que se mandan al navegador a la vez; las anteriores se piden después (ver ventana_periodos)
+MAX_COLUMNAS = 12
+
+
+class Periodo(NamedTuple):
+    """Columna del panel: una fecha, una semana, un mes o el periodo de trabajos de una estimación."""
+    clave: str      # identificador estable (URL y JSON)
+    etiqueta: str
+    inicio: date
+    fin: date
+
+
+def _periodo_fecha(fecha):
+    return Periodo(fecha.isoformat(), fecha.strftime('%d/%m/%Y'), fecha, fecha)
+
+
+def _periodo_semana(fecha):
+    lunes = fecha - timedelta(days=fecha.weekday())
+    anio, semana, _ = lunes.isocalendar()
+    return Periodo(f'{anio}-S{semana:02d}', f"Sem {lunes.strftime('%d/%m/%Y')}", lunes, lunes + timedelta(days=6))
+
+
+def _periodo_mes(fecha):
+    inicio = fecha.replace(day=1)
+    fin = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return Periodo(inicio.strftime('%Y-%m'), inicio.strftime('%m/%Y'), inicio, fin)
+
+
+def _periodos_estimacion(contrato_id):
+    """Periodos de trabajos de las estimaciones del contrato que tienen inicio y fin, por fecha de inicio."""
+    estimaciones = Estimacion.query \
+        .filter(Estimacion.contrato_id == contrato_id,
+                Estimacion.fecha_inicio_trab_est.isnot(None), Estimacion.fecha_fin_trab_est.isnot(None)) \
+        .order_by(Estimacion.fecha_inicio_trab_est.asc(), Estimacion.id.asc()) \
+        .all()
+    return [
+        Periodo(f'E{e.id}', f"Est. {e.numero_estimacion or e.folio or e.id}", e.fecha_inicio_trab_est, e.fecha_fin_trab_est)
+        for e in estimaciones
+    ]
+
+
+def periodos_de_fechas(fechas, agrupacion, contrato_id=None):
+    """
+    Periodo al que pertenece cada fecha (misma longitud que `fechas`). Con 'estimacion' cada
+    fecha va al primer periodo de trabajos que la contiene; las que no caen en ninguno quedan
+    como columna propia.
+    """
+    if agrupacion == 'semana':
+        return [_periodo_semana(f) for f in fechas]
+    if agrupacion == 'mes':
+        return [_periodo_mes(f) for f in fechas]
+    if agrupacion == 'estimacion':
+        estimaciones = _periodos_estimacion(contrato_id)
+        periodos = []
+        for f in fechas:
+            periodo = next((e for e in estimaciones if e.inicio <= f <= e.fin), None)
+            periodos.append(periodo or _periodo_fecha(f)._replace(etiqueta=f"{f.strftime('%d/%m/%Y')} (sin estimación)"))
+        return periodos
+    return [_periodo_fecha(f) for f in fechas]
+
+
+def agrupar_matriz(matriz, agrupacion='fecha', contrato_id=None):
+    """
+    Suma las columnas de la matriz por periodo, en el servidor. Devuelve (periodos en orden,
+    DataFrame concepto × clave de periodo).
+    """
+    if not matriz.fechas:
+        return [], matriz.cantidades
+    periodo_de = periodos_de_fechas(matriz.fechas, agrupacion, contrato_id)
+    periodos = sorted(set(periodo_de), key=lambda p: (p.inicio, p.clave))
+    cantidades = matriz.cantidades.T.groupby([p.clave for p in periodo_de]).sum().T \
+        .reindex(columns=[p.clave for p in periodos], fill_value=0.0)
+    return periodos, cantidades
+
+
+def ventana_periodos(periodos, desde=None, hasta=None, antes=None, max_columnas=MAX_COLUMNAS):
+    """
+    Los últimos `max_columnas` periodos dentro de [desde, hasta] y, si se indica, anteriores al
+    periodo con clave `antes` (para ir cargando las columnas viejas). Devuelve (periodos,
+    hay_anteriores).
+    """
+    candidatos = [p for p in periodos
+                  if (desde is None or p.fin >= desde) and (hasta is None or p.inicio <= hasta)]
+    if antes is not None:
+        claves = [p.clave for p in candidatos]
+        candidatos = candidatos[:claves.index(antes)] if antes in claves else []
+    inicio = max(0, len(candidatos) - max_columnas)
+    return candidatos[inicio:], inicio > 0
+
+
+# ============================================
+# Panel de avances
+# ============================================
+def _columnas_panel(conceptos, filas_partida, cantidades, periodos):
+    """Cantidades y subtotales por periodo de cada concepto, de cada partida y del total."""
+    claves = [p.clave for p in periodos]
+    precios = np.array([c['precio_unitario'] or 0.0 for c in conceptos], dtype=float)
+    subtotales = cantidades * precios[:, None]
+    return {
+        'cantidades': [dict(zip(claves, fila)) for fila in cantidades.tolist()],
+        'subtotales': [dict(zip(claves, fila)) for fila in subtotales.tolist()],
+        'partidas': {partida: dict(zip(claves, subtotales[filas].sum(axis=0).tolist()))
+                     for partida, filas in filas_partida.items()},
+        'totales_por_fecha': dict(zip(claves, subtotales.sum(axis=0).tolist())),
+        'totales_cantidades': dict(zip(claves, cantidades.sum(axis=0).tolist())),
+    }
+
+
+def _filas_por_partida(conceptos):
+    filas = {}
+    for i, concepto in enumerate(conceptos):
+        filas.setdefault(concepto['partida'], []).append(i)
+    return filas
+
+
+def _ventana_panel(contrato_id, conceptos, agrupacion, desde, hasta, antes, max_columnas):
+    """Matriz agrupada por periodo y recortada a la ventana pedida, solo de `conceptos`."""
+    matriz = matriz_avances(contrato_id)
+    periodos, agrupada = agrupar_matriz(matriz, agrupacion if agrupacion in AGRUPACIONES else 'fecha', contrato_id)
+    ventana, hay_anteriores = ventana_periodos(periodos, desde, hasta, antes, max_columnas)
+
+    ids = [c['id'] for c in conceptos]
+    cantidades = agrupada.reindex(index=ids, columns=[p.clave for p in ventana]).fillna(0.0).to_numpy()
+    return ventana, hay_anteriores, cantidades
+
+
+def calcular_panel_avances(contrato_id, conceptos, agrupacion='fecha', desde=None, hasta=None,
+                           max_columnas=MAX_COLUMNAS):
+    """
+    Datos del panel de avances para los conceptos dados (del catálogo base), a partir de la
+    matriz de avances: acumulado, subtotales y cantidades por periodo de cada concepto, agrupados
+    por partida, más los totales por periodo y por partida. Sin consultas por concepto ni por fecha.
+
+    Las columnas son periodos (`agrupacion`: fecha, semana, mes o estimación) y solo se incluyen
+    los últimos `max_columnas` dentro de [desde, hasta]; las anteriores se piden con
+    columnas_anteriores_panel. El acumulado siempre considera todos los avances: se lee de la
+    tabla de acumulados (ver leer_acumulados), no de la matriz.
+    """
+    periodos, hay_anteriores, cantidades = _ventana_panel(
+        contrato_id, conceptos, agrupacion, desde, hasta, None, max_columnas)
+    acumulados = leer_acumulados(contrato_id, [c['id'] for c in conceptos])
+    filas_partida = _filas_por_partida(conceptos)
+    columnas = _columnas_panel(conceptos, filas_partida, cantidades, periodos)
+
+    partidas = {}
+    for i, concepto in enumerate(conceptos):
+        acumulado = acumulados[int(concepto['id'])]
+        subtotal_catalogo = concepto['precio_unitario'] * concepto['cantidad']
+        subtotal_avanzado = concepto['precio_unitario'] * acumulado
+        info = {
+            'concepto': concepto,
+            'acumulado': acumulado,
+            'cantidad_pendiente': concepto['cantidad'] - acumulado,
+            'subtotal_catalogo': subtotal_catalogo,
+            'subtotal_avanzado': subtotal_avanzado,
+            'subtotal_pendiente': subtotal_catalogo - subtotal_avanzado,
+            'cantidades_por_fecha': columnas['cantidades'][i],
+            'subtotales_por_fecha': columnas['subtotales'][i],
+        }
+
+        partida = partidas.setdefault(concepto['partida'], {
+            'nombre_partida': '',
+            'conceptos': [],
+            'subtotal_partida_catalogo': 0.0,
+            'subtotal_partida_avanzado': 0.0,
+            'subtotal_partida_pendiente': 0.0,
+            'subtotales_por_fecha': columnas['partidas'][concepto['partida']],
+        })
+        partida['nombre_partida'] = concepto['nombre_partida']
+        partida['conceptos'].append(info)
+        partida['subtotal_partida_catalogo'] += info['subtotal_catalogo']
+        partida['subtotal_partida_avanzado'] += info['subtotal_avanzado']
+        partida['subtotal_partida_pendiente'] += info['subtotal_pendiente']
+
+    return {
+        'periodos': periodos,
+        'hay_anteriores': hay_anteriores,
+        'partidas': dict(sorted(partidas.items(), key=lambda p: (p[0] is None, p[0] or ''))),
+        'totales_por_fecha': columnas['totales_por_fecha'],
+        'totales_cantidades': columnas['totales_cantidades'],
+    }
+
+
+def columnas_anteriores_panel(contrato_id, conceptos, antes, agrupacion='fecha', desde=None, hasta=None,
+                              max_columnas=MAX_COLUMNAS):
+    """
+    Hasta `max_columnas` periodos anteriores al periodo `antes`, para agregarlos al panel ya
+    mostrado sin recargarlo. Cada renglón se identifica por el id del concepto y cada partida
+    por su clave ('' si no tiene).
+    """
+    periodos, hay_anteriores, cantidades = _ventana_panel(
+        contrato_id, conceptos, agrupacion, desde, hasta, antes, max_columnas)
+    columnas = _columnas_panel(conceptos, _filas_por_partida(conceptos), cantidades, periodos)
+    return {
+        'periodos': [{'clave': p.clave, 'etiqueta': p.etiqueta,
+                      'inicio': p.inicio.isoformat(), 'fin': p.fin.isoformat()} for p in periodos],
+        'hay_anteriores': hay_anteriores,
+        'conceptos': {
+            c['id']: {'cantidades': columnas['cantidades'][i], 'subtotales': columnas['subtotales'][i]}
+            for i, c in enumerate(conceptos)
+        },
+        'partidas': {partida or '': subtotales for partida, subtotales in columnas['partidas'].items()},
+        'totales': columnas['totales_por_fecha'],
+        'totales_cantidades': columnas['totales_cantidades'],
+    }
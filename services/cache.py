@@ -0,0 +1,154 @@
+from flask import g, has_app_context, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict
+from itertools import chain
+import threading
+
+# Tablas de las que dependen las derivaciones por contrato (catálogo base, extraordinarios aprobados,
+# versiones). Cualquier escritura en ellas invalida la caché de la solicitud.
+TABLAS_CATALOGO = {
+    'contrato',
+    'catalogo_version',
+    'concepto_catalogo',
+    'catalogo_base_actual',
+    'marca_catalogo_base',
+    'aprobacion_concepto',
+}
+
+_NO_ENCONTRADO = object()
+
+
+# ============================================
+# Caché LRU del proceso, validada por marca
+# ============================================
+class CacheLRU:
+    """
+    Caché acotada (LRU) compartida por todas las solicitudes del proceso. Cada entrada guarda
+    la "marca" con la que se calculó; si la marca actual es distinta la entrada se considera
+    vencida. El tamaño se toma de `app.config[clave_config]` cuando hay contexto de aplicación.
+    """
+
+    def __init__(self, nombre, tamano_maximo=64, clave_config=None):
+        self.nombre = nombre
+        self.tamano_maximo = tamano_maximo
+        self.clave_config = clave_config
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.descartes = 0
+
+    def _tamano(self):
+        if self.clave_config and has_app_context():
+            return current_app.config.get(self.clave_config, self.tamano_maximo)
+        return self.tamano_maximo
+
+    def obtener(self, clave, marca):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada[0] == marca:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+            return None
+
+    def guardar(self, clave, marca, valor):
+        tamano = self._tamano()
+        with self._lock:
+            self._entradas[clave] = (marca, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > tamano:
+                self._entradas.popitem(last=False)
+                self.descartes += 1
+
+    def descartar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'nombre': self.nombre,
+                'entradas': len(self._entradas),
+                'tamano_maximo': self._tamano(),
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'descartes': self.descartes,
+                'tasa_aciertos': round(self.aciertos / consultas, 4) if consultas else None,
+            }
+
+
+# ============================================
+# Caché por solicitud (vive en flask.g)
+# ============================================
+def memoizar_en_solicitud(espacio, clave, funcion):
+    """
+    Devuelve el resultado de `funcion()` guardado en la solicitud actual bajo (espacio, clave).
+    Fuera de un contexto de aplicación simplemente ejecuta la función.
+    """
+    if not has_app_context():
+        return funcion()
+
+    cache = g.setdefault('_cache_solicitud', {})
+    valor = cache.get((espacio, clave), _NO_ENCONTRADO)
+    if valor is _NO_ENCONTRADO:
+        valor = funcion()
+        cache[(espacio, clave)] = valor
+    return valor
+
+
+def invalidar_cache_solicitud():
+    """Descarta todo lo memoizado en la solicitud actual."""
+    if has_app_context():
+        g.pop('_cache_solicitud', None)
+
+
+def hay_escrituras_pendientes(session):
+    """
+    True si la transacción actual de la sesión ya escribió en las tablas del catálogo.
+    Lo leído en ese estado no debe guardarse en cachés compartidas entre solicitudes,
+    porque la transacción todavía puede deshacerse.
+    """
+    return session.info.get('catalogo_modificado', False)
+
+
+def _registrar_escritura(session):
+    session.info['catalogo_modificado'] = True
+    invalidar_cache_solicitud()
+
+
+def _afecta_catalogo(objetos):
+    return any(obj.__table__.name in TABLAS_CATALOGO for obj in objetos)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidar_tras_flush(session, flush_context):
+    if _afecta_catalogo(chain(session.new, session.dirty, session.deleted)):
+        _registrar_escritura(session)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidar_tras_escritura_masiva(orm_execute_state):
+    # insert()/update()/delete() en bloque no pasan por el flush de la sesión
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        tabla = getattr(orm_execute_state.statement, 'table', None)
+        if tabla is not None and tabla.name in TABLAS_CATALOGO:
+            _registrar_escritura(orm_execute_state.session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _limpiar_tras_commit(session):
+    session.info.pop('catalogo_modificado', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _invalidar_tras_rollback(session, previous_transaction):
+    session.info.pop('catalogo_modificado', None)
+    invalidar_cache_solicitud()
@@ -1,105 +1,878 @@
-from models import CatalogoVersion, CatalogoBaseAcumulado, db
-from sqlalchemy.orm import joinedload
-from datetime import date
+from models import (
+    CatalogoVersion, CatalogoBaseAcumulado, CatalogoBaseActual, ConceptoCatalogo, Contrato, MarcaCatalogoBase, db
+)
+from services.cache import memoizar_en_solicitud, hay_escrituras_pendientes, CacheLRU
+from sqlalchemy import select, delete, insert, update, func, case, and_, or_
+from sqlalchemy.orm import load_only
+from flask import current_app, has_app_context
+from datetime import date, datetime
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
+from collections.abc import Sequence
+from functools import cached_property
 import hashlib
 import json
+import zlib
+
+# Catálogo base por contrato compartido entre solicitudes (ver marca_catalogo_base)
+cache_catalogo_base = CacheLRU('catalogo_base', tamano_maximo=64, clave_config='CATALOGO_BASE_CACHE_TAMANO')
+
+# Columnas de ConceptoCatalogo que se copian al catálogo base vigente
+_COLUMNAS_CONCEPTO = (
+    ConceptoCatalogo.id,
+    ConceptoCatalogo.partida,
+    ConceptoCatalogo.nombre_partida,
+    ConceptoCatalogo.clave_concepto,
+    ConceptoCatalogo.concepto,
+    ConceptoCatalogo.descripcion,
+    ConceptoCatalogo.unidad,
+    ConceptoCatalogo.precio_unitario,
+    ConceptoCatalogo.cantidad,
+    ConceptoCatalogo.estatus,
+)
+
+
+# ============================================
+# Representación en memoria del catálogo base
+# ============================================
+class ConceptoBase(NamedTuple):
+    """
+    Concepto del catálogo base. Es una tupla (sin __dict__ por instancia), pero también se puede
+    leer como diccionario (`c['clave']`, `c.get('clave')`, `dict(c)`) como antes.
+    """
+    id: int
+    partida: Optional[str]
+    nombre_partida: Optional[str]
+    clave: str
+    concepto: Optional[str]
+    descripcion: Optional[str]
+    unidad: Optional[str]
+    precio_unitario: Optional[float]
+    cantidad: Optional[float]
+    subtotal: Optional[float]
+    estatus: Optional[str]
+
+    def __getitem__(self, campo):
+        if isinstance(campo, str):
+            try:
+                return tuple.__getitem__(self, _POSICION_CAMPO[campo])
+            except KeyError:
+                raise KeyError(campo) from None
+        return tuple.__getitem__(self, campo)
+
+    def __contains__(self, campo):
+        return campo in _POSICION_CAMPO
+
+    def get(self, campo, default=None):
+        posicion = _POSICION_CAMPO.get(campo)
+        return default if posicion is None else tuple.__getitem__(self, posicion)
+
+    def keys(self):
+        return self._fields
+
+    @classmethod
+    def desde_dict(cls, datos):
+        """Construye el concepto desde un diccionario (por ejemplo, una instantánea en JSON)."""
+        return cls(*(datos.get(campo) for campo in cls._fields))
+
+
+_POSICION_CAMPO = {campo: i for i, campo in enumerate(ConceptoBase._fields)}
+
+
+class CatalogoBase(Sequence):
+    """
+    Catálogo base de un contrato: secuencia inmutable de ConceptoBase (en el orden de siempre)
+    con índices por clave, por id de concepto y por partida que se arman una sola vez, la primera
+    vez que se piden. Se comparte entre solicitudes vía caché, así que no debe modificarse.
+    """
+
+    def __init__(self, conceptos=()):
+        self._conceptos = tuple(conceptos)
+
+    def __getitem__(self, i):
+        return self._conceptos[i]
+
+    def __len__(self):
+        return len(self._conceptos)
+
+    def __iter__(self):
+        return iter(self._conceptos)
+
+    def __repr__(self):
+        return f"CatalogoBase({len(self._conceptos)} conceptos)"
+
+    @cached_property
+    def por_clave(self):
+        return {c.clave: c for c in self._conceptos}
+
+    @cached_property
+    def por_id(self):
+        return {c.id: c for c in self._conceptos}
+
+    @cached_property
+    def por_partida(self):
+        return self._agrupar(lambda c: c.partida)
+
+    @cached_property
+    def por_nombre_partida(self):
+        return self._agrupar(lambda c: c.nombre_partida)
+
+    def _agrupar(self, llave):
+        grupos = {}
+        for c in self._conceptos:
+            grupos.setdefault(llave(c), []).append(c)
+        return {k: tuple(v) for k, v in grupos.items()}
+
+    def como_dicts(self):
+        """Lista de diccionarios, para serializar a JSON."""
+        return [c._asdict() for c in self._conceptos]
+
+
+def _fila_base(c):
+    """Convierte una fila de ConceptoCatalogo (objeto o tupla) en el registro del catálogo base."""
+    return {
+        'concepto_id': c.id,
+        'partida': c.partida,
+        'nombre_partida': c.nombre_partida,
+        'clave': c.clave_concepto,
+        'concepto': c.concepto,
+        'descripcion': c.descripcion,
+        'unidad': c.unidad,
+        'precio_unitario': c.precio_unitario,
+        'cantidad': c.cantidad,
+        'subtotal': c.cantidad * c.precio_unitario,
+        'estatus': c.estatus
+    }
+
+
+def _conserva_aprobado(clave, estatus_actual, estatus_nuevo):
+    """
+    Regla del catálogo base: si un extraordinario ya fue aprobado ('A'),
+    no se sobrescribe con una versión posterior en estado 'E' o 'R'.
+    """
+    return clave.startswith('E') and estatus_actual == 'A' and estatus_nuevo in ['E', 'R']
+
+
+def _aplicar_conceptos(base, conceptos):
+    """
+    Aplica en orden los conceptos dados sobre `base` ({clave: fila}) respetando la regla
+    de extraordinarios aprobados. Devuelve las claves que cambiaron, en orden de aparición.
+    """
+    cambiadas = {}
+    for c in conceptos:
+        clave = c.clave_concepto
+        if not clave:
+            continue
+
+        actual = base.get(clave)
+        if actual and _conserva_aprobado(clave, actual['estatus'], c.estatus):
+            continue  # mantenemos la versión aprobada
+
+        base[clave] = _fila_base(c)
+        cambiadas[clave] = True
+    return list(cambiadas)
+
+
+def _conceptos_del_contrato(contrato_id, clave=None, version_id=None):
+    """Conceptos de las versiones del contrato como tuplas, en el orden en que se aplican."""
+    consulta = select(*_COLUMNAS_CONCEPTO) \
+        .join(CatalogoVersion, ConceptoCatalogo.version_id == CatalogoVersion.id) \
+        .where(CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True),
+               ConceptoCatalogo.eliminado.isnot(True))
+
+    if clave is not None:
+        consulta = consulta.where(ConceptoCatalogo.clave_concepto == clave)
+    if version_id is not None:
+        consulta = consulta.where(ConceptoCatalogo.version_id == version_id)
+
+    consulta = consulta.order_by(CatalogoVersion.id.asc(), ConceptoCatalogo.id.asc())
+    return db.session.execute(consulta).all()
+
+
+def _candidatos_vigentes(contrato_id, hasta_version_id=None):
+    """
+    Subconsulta (CTE) con las filas del contrato numeradas por clave, de la que se eligen los
+    conceptos vigentes (ver _consultar_conceptos_vigentes y _aprobado_que_prevalece).
+    """
+    clave = ConceptoCatalogo.clave_concepto
+    orden_desc = (ConceptoCatalogo.version_id.desc(), ConceptoCatalogo.id.desc())
+    orden_asc = (ConceptoCatalogo.version_id.asc(), ConceptoCatalogo.id.asc())
+    fija = case((func.coalesce(ConceptoCatalogo.estatus, '').in_(['E', 'R']), 0), else_=1)
+
+    # Las marcas de clave eliminada (versiones en modo 'cambios') no participan: el catálogo base
+    # conserva todas las claves que alguna vez existieron, igual que con versiones completas.
+    # Tampoco las versiones que se siguen importando (ver importar_version_catalogo)
+    filtros = [CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True),
+               clave.isnot(None), clave != '', ConceptoCatalogo.eliminado.isnot(True)]
+    if hasta_version_id is not None:
+        filtros.append(ConceptoCatalogo.version_id <= hasta_version_id)
+
+    return select(
+        *_COLUMNAS_CONCEPTO,
+        fija.label('fija'),
+        func.row_number().over(partition_by=clave, order_by=orden_desc).label('pos'),
+        func.row_number().over(partition_by=(clave, fija), order_by=orden_desc).label('pos_fija'),
+        func.first_value(ConceptoCatalogo.version_id).over(partition_by=clave, order_by=orden_asc)
+            .label('primera_version'),
+        func.first_value(ConceptoCatalogo.id).over(partition_by=clave, order_by=orden_asc).label('primer_id'),
+    ).join(CatalogoVersion, ConceptoCatalogo.version_id == CatalogoVersion.id) \
+        .where(*filtros) \
+        .cte()
+
+
+def _aprobado_que_prevalece(candidatos):
+    """Condición de la última fila fija de la clave cuando es un extraordinario aprobado."""
+    return and_(candidatos.c.fija == 1, candidatos.c.pos_fija == 1, candidatos.c.estatus == 'A',
+                func.substr(candidatos.c.clave_concepto, 1, 1) == 'E')
+
+
+def _consultar_conceptos_vigentes(contrato_id, hasta_version_id=None):
+    """
+    Resuelve en una sola consulta SQL el concepto que gana para cada clave del contrato, sin
+    recorrer en Python todos los conceptos de todas las versiones. Devuelve tuplas (no objetos
+    ORM) en el orden en que cada clave apareció por primera vez. Con `hasta_version_id` solo se
+    consideran las versiones hasta esa (inclusive).
+
+    La regla "gana la última versión, salvo un extraordinario aprobado" equivale a: para cada
+    clave se toma la última fila cuyo estatus no es 'E' ni 'R'; si es un extraordinario 'A', esa
+    fila gana (las posteriores en E/R no lo sobrescriben); si no, gana la última fila.
+    """
+    candidatos = _candidatos_vigentes(contrato_id, hasta_version_id)
+
+    # A lo más dos filas por clave: la última y, si aplica, el extraordinario aprobado que prevalece
+    filas = db.session.execute(
+        select(candidatos).where(or_(candidatos.c.pos == 1, _aprobado_que_prevalece(candidatos)))
+    ).all()
+
+    ganadores = {}
+    for f in filas:
+        if f.clave_concepto not in ganadores or f.pos != 1:
+            ganadores[f.clave_concepto] = f
+
+    return sorted(ganadores.values(), key=lambda f: (f.primera_version, f.primer_id))
+
+
+def _ids_vigentes(contrato_id, hasta_version_id=None):
+    """Subconsulta con los ids de los conceptos vigentes (misma regla que _consultar_conceptos_vigentes)."""
+    candidatos = _candidatos_vigentes(contrato_id, hasta_version_id)
+    aprobado = _aprobado_que_prevalece(candidatos)
+    claves_con_aprobado = select(candidatos.c.clave_concepto).where(aprobado)
+    return select(candidatos.c.id).where(or_(
+        aprobado,
+        and_(candidatos.c.pos == 1, candidatos.c.clave_concepto.not_in(claves_con_aprobado))
+    ))
+
+
+def _leer_catalogo_base_actual(contrato_id):
+    """Devuelve {clave: (id_fila, estatus)} de las filas materializadas del contrato."""
+    filas = db.session.execute(
+        select(CatalogoBaseActual.clave, CatalogoBaseActual.id, CatalogoBaseActual.estatus)
+        .where(CatalogoBaseActual.contrato_id == contrato_id)
+    ).all()
+    return {f.clave: (f.id, f.estatus) for f in filas}
+
+
+def _guardar_filas(contrato_id, base, claves, existentes):
+    """Inserta o actualiza en bloque las filas materializadas de las claves indicadas."""
+    nuevas = []
+    modificadas = []
+    for clave in claves:
+        fila = dict(base[clave], contrato_id=contrato_id)
+        if clave in existentes:
+            fila['id'] = existentes[clave][0]
+            modificadas.append(fila)
+        else:
+            nuevas.append(fila)
+
+    if modificadas:
+        db.session.execute(update(CatalogoBaseActual), modificadas)
+    if nuevas:
+        db.session.execute(insert(CatalogoBaseActual), nuevas)
+
+
+# ===============================
+# Marca del catálogo base
+# ===============================
+def marca_catalogo_base(contrato_id):
+    """
+    Marca barata del estado del catálogo base: (id de la última CatalogoVersion del contrato,
+    contador de cambios). Cambia cada vez que se sube/elimina una versión o se recalcula una clave.
+    """
+    ultima_version = select(func.max(CatalogoVersion.id)) \
+        .where(CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True)) \
+        .scalar_subquery()
+    contador = select(MarcaCatalogoBase.contador_cambios) \
+        .where(MarcaCatalogoBase.contrato_id == contrato_id).scalar_subquery()
+
+    fila = db.session.execute(select(ultima_version, contador)).one()
+    return (fila[0] or 0, fila[1] or 0)
+
+
+def _incrementar_marca(contrato_id):
+    """Incrementa el contador de cambios del contrato en la transacción actual."""
+    resultado = db.session.execute(
+        update(MarcaCatalogoBase)
+        .where(MarcaCatalogoBase.contrato_id == contrato_id)
+        .values(contador_cambios=MarcaCatalogoBase.contador_cambios + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if not resultado.rowcount:
+        db.session.execute(insert(MarcaCatalogoBase).values(contrato_id=contrato_id, contador_cambios=1))
+
+
+# ===============================
+# Mantenimiento del catálogo base vigente
+# ===============================
+def reconstruir_catalogo_base(contrato_id):
+    """
+    Recalcula desde cero las filas de `catalogo_base_actual` de un contrato aplicando
+    todas sus versiones. Se usa para contratos que aún no tienen el catálogo materializado
+    y después de eliminar una versión. No hace commit.
+    """
+    db.session.execute(delete(CatalogoBaseActual).where(CatalogoBaseActual.contrato_id == contrato_id))
+
+    base = {f.clave_concepto: _fila_base(f) for f in _consultar_conceptos_vigentes(contrato_id)}
+    _guardar_filas(contrato_id, base, list(base), {})
+    _incrementar_marca(contrato_id)
+    return len(base)
+
+
+def aplicar_version_catalogo_base(contrato_id, version_id):
+    """
+    Aplica una versión recién importada sobre el catálogo base vigente del contrato.
+    Solo se leen los conceptos de esa versión y las claves/estatus ya materializados.
+    No hace commit.
+    """
+    existentes = _leer_catalogo_base_actual(contrato_id)
+
+    # Si el contrato nunca se materializó, la reconstrucción completa incluye esta versión
+    if not existentes:
+        return reconstruir_catalogo_base(contrato_id)
+
+    base = {clave: {'estatus': estatus} for clave, (_, estatus) in existentes.items()}
+    cambiadas = _aplicar_conceptos(base, _conceptos_del_contrato(contrato_id, version_id=version_id))
+    _guardar_filas(contrato_id, base, cambiadas, existentes)
+    _incrementar_marca(contrato_id)
+    return len(cambiadas)
+
+
+def recalcular_clave_catalogo_base(contrato_id, clave):
+    """
+    Recalcula la fila de una sola clave (por ejemplo, después de cambiar el estatus de un
+    extraordinario). Necesita que los cambios pendientes de la sesión ya estén visibles,
+    lo que el autoflush de la consulta garantiza. No hace commit.
+    """
+    base = {}
+    _aplicar_conceptos(base, _conceptos_del_contrato(contrato_id, clave=clave))
+
+    existentes = {}
+    fila = db.session.execute(
+        select(CatalogoBaseActual.id, CatalogoBaseActual.estatus)
+        .where(CatalogoBaseActual.contrato_id == contrato_id, CatalogoBaseActual.clave == clave)
+    ).first()
+    if fila:
+        existentes[clave] = (fila.id, fila.estatus)
+
+    if clave in base:
+        _guardar_filas(contrato_id, base, [clave], existentes)
+    elif fila:
+        db.session.execute(delete(CatalogoBaseActual).where(CatalogoBaseActual.id == fila.id))
+    _incrementar_marca(contrato_id)
+
 
 # ===============================
 # Generar catálogo base acumulado
 # ===============================
-def generar_catalogo_base(contrato_id):
+def generar_catalogo_base(contrato_id, as_of=None):
     """
     Combina el catálogo original y todos los actualizados para formar un catálogo base consolidado,
     útil como referencia para avances o comparativos.
     Se incluye la versión más reciente de cada concepto, pero si un extraordinario ya fue aprobado ('A'),
     no se sobrescribe con una versión posterior en estado 'E' o 'R'.
+
+    Con `as_of` (id de CatalogoVersion o fecha) se devuelve el catálogo base tal como estaba en ese
+    momento: solo cuentan las versiones hasta ese id, o subidas hasta esa fecha. El estatus de los
+    conceptos se guarda en el mismo renglón, así que el histórico usa el estatus actual.
+
+    Devuelve un CatalogoBase (conceptos ConceptoBase con índices por clave, id y partida). El
+    resultado se memoiza durante la solicitud y en `cache_catalogo_base` entre solicitudes, así
+    que es compartido e inmutable.
+    """
+    if as_of is not None:
+        return _catalogo_base_historico(int(contrato_id), as_of)
+
+    return memoizar_en_solicitud('catalogo_base', int(contrato_id),
+                                 lambda: _catalogo_base_en_cache(int(contrato_id)))
+
+
+def _catalogo_base_en_cache(contrato_id):
+    """
+    Busca el catálogo base en la caché del proceso; si la marca cambió lo vuelve a leer.
+    La marca se lee antes que los conceptos: si otra escritura se cuela entre ambas lecturas,
+    lo peor que pasa es un fallo extra en la siguiente consulta, nunca un dato viejo.
+    """
+    # Dentro de una transacción que ya modificó el catálogo no se usa la caché compartida
+    if hay_escrituras_pendientes(db.session):
+        return CatalogoBase(_leer_catalogo_base(contrato_id))
+
+    marca = marca_catalogo_base(contrato_id)
+    conceptos = cache_catalogo_base.obtener(contrato_id, marca)
+    if conceptos is None:
+        conceptos = CatalogoBase(_leer_catalogo_base(contrato_id))
+        cache_catalogo_base.guardar(contrato_id, marca, conceptos)
+    return conceptos
+
+
+def resolver_version_as_of(contrato_id, as_of):
+    """
+    Id de la última versión del contrato vigente en `as_of` (id de versión o fecha de subida).
+    Devuelve None si en ese momento el contrato todavía no tenía catálogo.
+    """
+    consulta = select(func.max(CatalogoVersion.id)) \
+        .where(CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True))
+    if isinstance(as_of, date):
+        fecha = as_of.date() if isinstance(as_of, datetime) else as_of
+        consulta = consulta.where(CatalogoVersion.fecha_subida <= fecha)
+    else:
+        consulta = consulta.where(CatalogoVersion.id <= int(as_of))
+    return db.session.execute(consulta).scalar()
+
+
+def _catalogo_base_historico(contrato_id, as_of):
+    """
+    Catálogo base en un momento dado. Si `as_of` cae en la última versión se reutiliza el
+    catálogo vigente; si no, se resuelve con la misma consulta SQL limitada a esa versión.
+    """
+    version_id = resolver_version_as_of(contrato_id, as_of)
+    if version_id is None:
+        return CatalogoBase()
+
+    marca = marca_catalogo_base(contrato_id)
+    if version_id == marca[0]:
+        return memoizar_en_solicitud('catalogo_base', contrato_id,
+                                     lambda: _catalogo_base_en_cache(contrato_id))
+
+    def leer():
+        conceptos = CatalogoBase(_registro_catalogo(f) for f in _consultar_conceptos_vigentes(contrato_id, version_id))
+        if not hay_escrituras_pendientes(db.session):
+            cache_catalogo_base.guardar((contrato_id, version_id), marca, conceptos)
+        return conceptos
+
+    def obtener():
+        # Un catálogo vacío en caché también es un acierto
+        conceptos = cache_catalogo_base.obtener((contrato_id, version_id), marca)
+        return conceptos if conceptos is not None else leer()
+
+    return memoizar_en_solicitud('catalogo_base', (contrato_id, version_id), obtener)
+
+
+def conceptos_base_por_id(contrato_id, ids, as_of=None):
+    """
+    {concepto_id: ConceptoBase} de los ids dados según el catálogo base en `as_of` (ver
+    generar_catalogo_base), para mostrar registros ya capturados (avances). Ningún id se pierde:
+    los que ese catálogo no tiene (por ejemplo, un avance con fecha anterior a la subida del
+    catálogo) se toman del catálogo base vigente y, si tampoco están ahí porque otra versión
+    reemplazó el concepto, directamente de ConceptoCatalogo.
+    """
+    ids = set(ids)
+    por_id = generar_catalogo_base(contrato_id, as_of=as_of).por_id
+    conceptos = {i: por_id[i] for i in ids if i in por_id}
+
+    faltantes = ids - conceptos.keys()
+    if faltantes and as_of is not None:
+        vigente = generar_catalogo_base(contrato_id).por_id
+        conceptos.update((i, vigente[i]) for i in faltantes if i in vigente)
+        faltantes -= conceptos.keys()
+    if faltantes:
+        conceptos.update((c.id, _registro_catalogo(c)) for c in obtener_conceptos_por_id(sorted(faltantes)))
+    return conceptos
+
+
+def conceptos_base_por_clave(contrato_id, claves, as_of=None):
+    """
+    {clave: ConceptoBase} de las claves dadas según el catálogo base en `as_of`; las que ese
+    catálogo todavía no tenía se toman del catálogo base vigente (las que no existen se omiten).
+    """
+    claves = set(claves)
+    por_clave = generar_catalogo_base(contrato_id, as_of=as_of).por_clave
+    conceptos = {k: por_clave[k] for k in claves if k in por_clave}
+
+    faltantes = claves - conceptos.keys()
+    if faltantes and as_of is not None:
+        vigente = generar_catalogo_base(contrato_id).por_clave
+        conceptos.update((k, vigente[k]) for k in faltantes if k in vigente)
+    return conceptos
+
+
+def _registro_catalogo(c):
+    """Concepto del catálogo base a partir de una fila de ConceptoCatalogo."""
+    return ConceptoBase(c.id, c.partida, c.nombre_partida, c.clave_concepto, c.concepto, c.descripcion,
+                        c.unidad, c.precio_unitario, c.cantidad, c.cantidad * c.precio_unitario, c.estatus)
+
+
+def _leer_catalogo_base(contrato_id):
+    """
+    Lee el catálogo base de `catalogo_base_actual`, que se mantiene al subir catálogos y al cambiar
+    estatus. Si el contrato todavía no está materializado se resuelve con la consulta SQL sin
+    escribir nada: una lectura nunca debe hacer commit de la transacción de quien la llama. Se
+    materializa con la siguiente versión que se suba o con `flask reconstruir-catalogo-base`.
+    """
+    # Mismas columnas y orden que ConceptoBase
+    consulta = select(
+        CatalogoBaseActual.concepto_id,
+        CatalogoBaseActual.partida,
+        CatalogoBaseActual.nombre_partida,
+        CatalogoBaseActual.clave,
+        CatalogoBaseActual.concepto,
+        CatalogoBaseActual.descripcion,
+        CatalogoBaseActual.unidad,
+        CatalogoBaseActual.precio_unitario,
+        CatalogoBaseActual.cantidad,
+        CatalogoBaseActual.subtotal,
+        CatalogoBaseActual.estatus,
+    ).where(CatalogoBaseActual.contrato_id == contrato_id).order_by(CatalogoBaseActual.id.asc())
+
+    filas = db.session.execute(consulta).all()
+
+    if not filas:
+        tiene_versiones = db.session.execute(
+            select(CatalogoVersion.id)
+            .where(CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True)).limit(1)
+        ).first()
+        if not tiene_versiones:
+            return []
+
+        return [_registro_catalogo(f) for f in _consultar_conceptos_vigentes(contrato_id)]
+
+    return [ConceptoBase._make(f) for f in filas]
+
+
+def obtener_claves_extraordinarios_aprobados(contrato_id):
+    """Conjunto de claves extraordinarias ('E...') que en el catálogo base están aprobadas ('A')."""
+    return memoizar_en_solicitud('extraordinarios_aprobados', int(contrato_id), lambda: frozenset(
+        c.clave for c in generar_catalogo_base(contrato_id)
+        if c.clave.startswith('E') and c.estatus == 'A'
+    ))
+
+
+def obtener_contrato(contrato_id):
+    """Contrato memoizado durante la solicitud (None si no existe)."""
+    return memoizar_en_solicitud('contrato', int(contrato_id), lambda: db.session.get(Contrato, int(contrato_id)))
+
+
+def obtener_version_original(contrato_id):
+    """Versión 'original' del catálogo del contrato, memoizada durante la solicitud."""
+    return memoizar_en_solicitud('version_original', int(contrato_id), lambda: CatalogoVersion.query
+                                 .filter_by(contrato_id=contrato_id, tipo='original')
+                                 .filter(CatalogoVersion.importando.isnot(True))
+                                 .order_by(CatalogoVersion.id.asc()).first())
+
+
+def obtener_version_terminada(version_id):
+    """Versión del catálogo por id; None si no existe o si su importación todavía no termina."""
+    version = db.session.get(CatalogoVersion, version_id)
+    return None if version is None or version.importando else version
+
+
+# ============================================
+# Conceptos de una versión del catálogo
+# ============================================
+# Tamaño de los bloques de ids en consultas IN (SQLite admite 999 parámetros por consulta)
+_TAMANO_BLOQUE_IDS = 900
+
+
+def obtener_version_anterior_id(version):
+    """Id de la versión del contrato inmediatamente anterior a `version` (None si es la primera)."""
+    return db.session.execute(
+        select(func.max(CatalogoVersion.id))
+        .where(CatalogoVersion.contrato_id == version.contrato_id, CatalogoVersion.id < version.id,
+               CatalogoVersion.importando.isnot(True))
+    ).scalar()
+
+
+def _consulta_conceptos(columnas):
+    """ORM completo, o solo esas columnas (más id, clave y eliminado) como filas ligeras."""
+    if columnas is None:
+        return ConceptoCatalogo.query
+    nombres = dict.fromkeys(['id', 'clave_concepto', 'eliminado', *columnas])
+    return db.session.query(*(getattr(ConceptoCatalogo, nombre) for nombre in nombres))
+
+
+def obtener_conceptos_por_id(ids, columnas=None):
+    """Conceptos con esos ids, en el mismo orden, consultados por bloques (ver conceptos_de_version)."""
+    ids = list(ids)
+    por_id = {}
+    for inicio in range(0, len(ids), _TAMANO_BLOQUE_IDS):
+        bloque = ids[inicio:inicio + _TAMANO_BLOQUE_IDS]
+        por_id.update((c.id, c) for c in _consulta_conceptos(columnas).filter(ConceptoCatalogo.id.in_(bloque)))
+    return [por_id[i] for i in ids if i in por_id]
+
+
+def conceptos_de_version(version, columnas=None):
+    """
+    Conceptos que forman una versión del catálogo, como objetos ConceptoCatalogo. Con `columnas`
+    (nombres de atributos) se devuelven filas con solo esas columnas, sin el costo del ORM.
+
+    Una versión 'completo' tiene guardados todos sus conceptos. Una versión 'cambios' solo guarda
+    los conceptos nuevos o modificados y una marca `eliminado` por cada clave que ya no venía en
+    el archivo; el resto se toma del catálogo base vigente antes de importarla. Así las vistas
+    muestran la versión completa sin importar cómo se almacenó.
+    """
+    propios = _consulta_conceptos(columnas).filter(ConceptoCatalogo.version_id == version.id) \
+        .order_by(ConceptoCatalogo.id.asc()).all()
+    if version.modo_almacenamiento != 'cambios':
+        return [c for c in propios if not c.eliminado]
+
+    anterior_id = obtener_version_anterior_id(version)
+    if anterior_id is None:
+        return [c for c in propios if not c.eliminado]
+
+    eliminadas = {c.clave_concepto for c in propios if c.eliminado}
+    cambiados = {}
+    sin_clave = []
+    for c in propios:
+        if c.eliminado:
+            continue
+        if c.clave_concepto:
+            cambiados.setdefault(c.clave_concepto, []).append(c)
+        else:
+            sin_clave.append(c)
+
+    # Mismo orden que el catálogo anterior; los cambios ocupan el lugar de la clave y las nuevas van al final
+    anteriores = obtener_conceptos_por_id((c.id for c in generar_catalogo_base(version.contrato_id, as_of=anterior_id)),
+                                          columnas)
+    conceptos = []
+    for c in anteriores:
+        if c.clave_concepto in eliminadas:
+            continue
+        conceptos.extend(cambiados.pop(c.clave_concepto, [c]))
+    for filas in cambiados.values():
+        conceptos.extend(filas)
+    return conceptos + sin_clave
+
+
+def consulta_conceptos_version(version, columnas):
     """
-    versiones = CatalogoVersion.query.options(joinedload(CatalogoVersion.conceptos)) \
-        .filter_by(contrato_id=contrato_id).order_by(CatalogoVersion.id.asc()).all()
-
-    if not versiones:
-        return []
-
-    conceptos_base = {}
-
-    for version in versiones:
-        for c in version.conceptos:
-            clave = c.clave_concepto
-            estatus = getattr(c, 'estatus', 'A')  # Default a 'A' si no está definido
-
-            if not clave:
-                continue
-
-            if clave not in conceptos_base:
-                conceptos_base[clave] = {
-                    'id': c.id,
-                    'partida': c.partida,
-                    'nombre_partida': c.nombre_partida,
-                    'clave': clave,
-                    'concepto': c.concepto,
-                    'descripcion': c.descripcion,
-                    'unidad': c.unidad,
-                    'precio_unitario': c.precio_unitario,
-                    'cantidad': c.cantidad,
-                    'subtotal': c.cantidad * c.precio_unitario,
-                    'estatus': estatus
-                }
-            else:
-                # Si es extraordinario ya aprobado, no sobrescribir con estado E o R
-                if clave.startswith('E'):
-                    if conceptos_base[clave]['estatus'] == 'A' and estatus in ['E', 'R']:
-                        continue  # mantenemos la versión aprobada
-
-                # Si no está aprobado o no es extraordinario, sobrescribimos
-                conceptos_base[clave] = {
-                    'id': c.id,
-                    'partida': c.partida,
-                    'nombre_partida': c.nombre_partida,
-                    'clave': clave,
-                    'concepto': c.concepto,
-                    'descripcion': c.descripcion,
-                    'unidad': c.unidad,
-                    'precio_unitario': c.precio_unitario,
-                    'cantidad': c.cantidad,
-                    'subtotal': c.cantidad * c.precio_unitario,
-                    'estatus': estatus
-                }
-
-    return list(conceptos_base.values())
+    Select (sin ejecutar) de esas columnas de los conceptos que forman la versión, con la misma
+    regla que conceptos_de_version pero resuelta en SQL, para paginarla o agregarla en la base
+    de datos sin cargar toda la versión. Sin orden: quien la usa decide cómo ordenar.
+    """
+    consulta = select(*(getattr(ConceptoCatalogo, columna) for columna in columnas))
+    propios = and_(ConceptoCatalogo.version_id == version.id, ConceptoCatalogo.eliminado.isnot(True))
+    if version.modo_almacenamiento != 'cambios':
+        return consulta.where(propios)
+
+    anterior_id = obtener_version_anterior_id(version)
+    if anterior_id is None:
+        return consulta.where(propios)
+
+    # Del catálogo anterior, las claves que la versión no cambió ni marcó como eliminadas
+    claves_propias = select(ConceptoCatalogo.clave_concepto) \
+        .where(ConceptoCatalogo.version_id == version.id, ConceptoCatalogo.clave_concepto.isnot(None))
+    heredados = and_(ConceptoCatalogo.id.in_(_ids_vigentes(version.contrato_id, anterior_id)),
+                     ConceptoCatalogo.clave_concepto.not_in(claves_propias))
+    return consulta.where(or_(propios, heredados))
+
+
+# Columnas que se copian al guardar completa una versión 'cambios'
+_COLUMNAS_COPIADAS = ['partida', 'nombre_partida', 'clave_concepto', 'concepto', 'descripcion', 'unidad',
+                      'precio_unitario', 'cantidad', 'subtotal', 'estatus']
+
+
+def obtener_versiones_cambios_siguientes(version):
+    """Versiones 'cambios' del contrato posteriores a `version`, en el orden en que se subieron."""
+    return CatalogoVersion.query \
+        .filter(CatalogoVersion.contrato_id == version.contrato_id, CatalogoVersion.id > version.id,
+                CatalogoVersion.modo_almacenamiento == 'cambios', CatalogoVersion.importando.isnot(True)) \
+        .order_by(CatalogoVersion.id.asc()).all()
+
+
+def guardar_version_completa(version):
+    """
+    Convierte una versión 'cambios' en 'completo': copia a la versión los conceptos que heredaba
+    del catálogo anterior y quita sus marcas de clave eliminada, de modo que deja de depender de
+    las versiones previas (p. ej. antes de eliminar la anterior). Sus propios conceptos conservan
+    el id, porque los avances los referencian. No hace commit.
+    """
+    if version.modo_almacenamiento != 'cambios':
+        return 0
+
+    heredados = [c for c in conceptos_de_version(version, ['version_id', *_COLUMNAS_COPIADAS])
+                 if c.version_id != version.id]
+    db.session.execute(delete(ConceptoCatalogo).where(ConceptoCatalogo.version_id == version.id,
+                                                      ConceptoCatalogo.eliminado.is_(True)))
+    registros = [{'version_id': version.id, **{columna: getattr(c, columna) for columna in _COLUMNAS_COPIADAS}}
+                 for c in heredados]
+    if registros:
+        db.session.execute(insert(ConceptoCatalogo), registros)
+    version.modo_almacenamiento = 'completo'
+    db.session.flush()
+    return len(registros)
+
+
+def totales_partida_version(version):
+    """Número de conceptos y subtotal de cada partida de la versión, agregados en SQL."""
+    conceptos = consulta_conceptos_version(version, ['partida', 'nombre_partida', 'subtotal']).subquery()
+    return db.session.execute(
+        select(
+            conceptos.c.partida,
+            func.max(conceptos.c.nombre_partida).label('nombre_partida'),
+            func.count().label('conceptos'),
+            func.coalesce(func.sum(conceptos.c.subtotal), 0.0).label('subtotal'),
+        ).group_by(conceptos.c.partida).order_by(conceptos.c.partida)
+    ).all()
 
 
 # ============================================
-# Guardar nueva versión del Catálogo Base Acumulado (si cambia el contenido)
+# Instantáneas del Catálogo Base Acumulado
 # ============================================
-def guardar_catalogo_base_si_nuevo(contrato_id, forzar=False):
+# Cada cuántas versiones se guarda el catálogo completo; las demás guardan solo el delta
+CHECKPOINT_CADA = 10
+
+
+def _texto_marca(marca):
+    return f"{marca[0]}:{marca[1]}"
+
+
+def _comprimir(datos):
+    return zlib.compress(json.dumps(datos, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+
+def _descomprimir(contenido):
+    return json.loads(zlib.decompress(contenido).decode('utf-8'))
+
+
+def _checkpoint_cada():
+    if has_app_context():
+        return current_app.config.get('CATALOGO_BASE_CHECKPOINT_CADA', CHECKPOINT_CADA)
+    return CHECKPOINT_CADA
+
+
+def _delta(anterior, actual):
+    """Delta entre dos catálogos {clave: concepto}: conceptos nuevos o cambiados y claves eliminadas."""
+    return {
+        'cambiados': [c for clave, c in actual.items() if anterior.get(clave) != c],
+        'eliminados': sorted(clave for clave in anterior if clave not in actual),
+    }
+
+
+def reconstruir_snapshot_catalogo_base(contrato_id, version):
+    """
+    Reconstruye el contenido de la instantánea `version` del contrato: parte del checkpoint
+    (o del JSON completo de versiones antiguas) más cercano y aplica los deltas siguientes.
+    Devuelve la lista de ConceptoBase ordenada por clave, o None si la versión no existe.
     """
-    Guarda una nueva versión del Catálogo Base Acumulado si su contenido es diferente
-    al de la última versión registrada para el contrato dado.
+    filas = CatalogoBaseAcumulado.query \
+        .filter(CatalogoBaseAcumulado.contrato_id == contrato_id, CatalogoBaseAcumulado.version <= version) \
+        .order_by(CatalogoBaseAcumulado.version.desc())
+
+    cadena = []
+    for fila in filas.yield_per(_checkpoint_cada()):
+        cadena.append(fila)
+        if fila.es_checkpoint or fila.contenido is None:
+            break
+
+    if not cadena or cadena[0].version != version:
+        return None
+
+    conceptos = {}
+    for fila in reversed(cadena):
+        if fila.contenido is None:
+            conceptos = {c['clave']: c for c in json.loads(fila.conceptos_json or '[]')}
+        elif fila.es_checkpoint:
+            conceptos = {c['clave']: c for c in _descomprimir(fila.contenido)['conceptos']}
+        else:
+            delta = _descomprimir(fila.contenido)
+            for clave in delta['eliminados']:
+                conceptos.pop(clave, None)
+            for c in delta['cambiados']:
+                conceptos[c['clave']] = c
+
+    return [ConceptoBase.desde_dict(conceptos[clave]) for clave in sorted(conceptos)]
+
+
+def registrar_snapshot_catalogo_base(contrato_id, forzar=False):
+    """
+    Registra una instantánea del catálogo base después de un cambio (subida de catálogo,
+    cambio de estatus, eliminación de versión). Si el contenido no cambió solo se actualiza la
+    marca de origen de la última instantánea. Se llama desde las rutas que escriben, no desde
+    las vistas, y no hace commit.
     Si `forzar=True`, guarda la versión aunque no haya diferencias.
+
+    El contenido se guarda comprimido: completo cada CATALOGO_BASE_CHECKPOINT_CADA versiones y,
+    en las demás, solo las claves agregadas/cambiadas/eliminadas respecto a la versión anterior.
     """
     conceptos = generar_catalogo_base(contrato_id)
 
     if not conceptos:
         return None
 
-    contenido_json = json.dumps(sorted(conceptos, key=lambda c: c['clave']), sort_keys=True)
+    marca = _texto_marca(marca_catalogo_base(contrato_id))
+    conceptos = [c._asdict() for c in sorted(conceptos, key=lambda c: c.clave)]
+    contenido_json = json.dumps(conceptos, sort_keys=True)
     hash_actual = hashlib.sha256(contenido_json.encode('utf-8')).hexdigest()
 
     ultima_version = CatalogoBaseAcumulado.query.filter_by(contrato_id=contrato_id) \
         .order_by(CatalogoBaseAcumulado.version.desc()).first()
 
     if not forzar and ultima_version and ultima_version.hash_contenido == hash_actual:
+        ultima_version.marca_fuente = marca
         return ultima_version
 
     nueva_version = (ultima_version.version + 1) if ultima_version else 1
 
+    es_checkpoint = ultima_version is None or (nueva_version - 1) % _checkpoint_cada() == 0
+    if es_checkpoint:
+        contenido = _comprimir({'conceptos': conceptos})
+    else:
+        anteriores = reconstruir_snapshot_catalogo_base(contrato_id, ultima_version.version) or []
+        # Los conceptos pasan por JSON para compararlos igual que quedaron guardados
+        actuales = json.loads(contenido_json)
+        contenido = _comprimir(_delta(
+            {c.clave: c._asdict() for c in anteriores},
+            {c['clave']: c for c in actuales}
+        ))
+
     nuevo_catalogo = CatalogoBaseAcumulado(
         contrato_id=contrato_id,
         version=nueva_version,
         hash_contenido=hash_actual,
-        conceptos_json=contenido_json
+        contenido=contenido,
+        es_checkpoint=es_checkpoint,
+        marca_fuente=marca
     )
     db.session.add(nuevo_catalogo)
-    db.session.commit()
+    return nuevo_catalogo
+
+
+def obtener_snapshot_catalogo_base(contrato_id, version=None):
+    """
+    Camino de lectura de la vista del Catálogo Base. Si la última instantánea está al día
+    (su marca de origen coincide con la actual) su contenido es el catálogo base vigente, que
+    ya está en caché, así que no se descomprime nada. Con `version` se reconstruye una
+    instantánea anterior.
+    Si la instantánea no está al día (por ejemplo, datos anteriores a las marcas) se devuelve
+    el catálogo base vigente sin escribir nada; `version` queda en "N/A".
+    """
+    consulta = CatalogoBaseAcumulado.query \
+        .options(load_only(CatalogoBaseAcumulado.version, CatalogoBaseAcumulado.fecha_generacion,
+                           CatalogoBaseAcumulado.marca_fuente)) \
+        .filter_by(contrato_id=contrato_id)
+
+    if version is not None:
+        fila = consulta.filter_by(version=version).first()
+        conceptos = reconstruir_snapshot_catalogo_base(contrato_id, version) if fila else None
+        if not conceptos:
+            return None
+        return SimpleNamespace(version=fila.version, fecha_generacion=fila.fecha_generacion, conceptos=conceptos)
+
+    ultima = consulta.order_by(CatalogoBaseAcumulado.version.desc()).first()
+    conceptos = generar_catalogo_base(contrato_id)
+    if not conceptos:
+        return None
+
+    conceptos = sorted(conceptos, key=lambda c: c.clave)
+    if ultima and ultima.marca_fuente == _texto_marca(marca_catalogo_base(contrato_id)):
+        return SimpleNamespace(version=ultima.version, fecha_generacion=ultima.fecha_generacion, conceptos=conceptos)
 
-    return nuevo_catalogo
\ No newline at end of file
+    return SimpleNamespace(version="N/A", fecha_generacion=date.today(), conceptos=conceptos)
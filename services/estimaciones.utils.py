@@ -9,7 +9,7 @@ def obtener_importes_originales_por_partida(contrato_id):
     version_original = CatalogoVersion.query.filter_by(
         contrato_id=contrato_id,
         tipo='original'
-    ).first()
+    ).filter(CatalogoVersion.importando.isnot(True)).first()
 
     if not version_original:
         return {}
@@ -49,7 +49,7 @@ def obtener_totales_contrato_y_anticipo(contrato_id, porcentaje_anticipo):
     version_original = CatalogoVersion.query.filter_by(
         contrato_id=contrato_id,
         tipo='original'
-    ).first()
+    ).filter(CatalogoVersion.importando.isnot(True)).first()
 
     if not version_original:
         return {
@@ -1,5 +1,6 @@
 from models import ConceptoCatalogo, db
 from sqlalchemy import and_
+from services.catalogo_base import recalcular_clave_catalogo_base, registrar_snapshot_catalogo_base
 
 def actualizar_estatus_revision():
     """
@@ -9,6 +10,7 @@ def actualizar_estatus_revision():
     conceptos = ConceptoCatalogo.query.filter(ConceptoCatalogo.estatus.like("R%")).order_by(ConceptoCatalogo.clave_concepto.asc(), ConceptoCatalogo.id.asc()).all()
 
     conteo_por_clave = {}
+    claves_por_contrato = set()
 
     for concepto in conceptos:
         clave = concepto.clave_concepto
@@ -20,6 +22,13 @@ def actualizar_estatus_revision():
 
         nuevo_estatus = f"R{conteo_por_clave[clave]}"
         concepto.estatus = nuevo_estatus
+        claves_por_contrato.add((concepto.version.contrato_id, clave))
+
+    for contrato_id, clave in claves_por_contrato:
+        recalcular_clave_catalogo_base(contrato_id, clave)
+
+    for contrato_id in {contrato_id for contrato_id, _ in claves_por_contrato}:
+        registrar_snapshot_catalogo_base(contrato_id)
 
     db.session.commit()
     print("✅ Estatus actualizados correctamente.")
\ No newline at end of file
@@ -0,0 +1,161 @@
+from services.avances import leer_acumulados, registrar_avances
+from services.catalogo_base import generar_catalogo_base
+from services.lectura_archivos import COLUMNAS_REPORTE, columna_texto, columna_numero, fila_archivo, tiene_errores
+import os
+import pandas as pd
+
+# Encabezados aceptados (sin distinguir mayúsculas) -> columna
+_ENCABEZADOS = {
+    'clave': 'clave',
+    'clave concepto': 'clave',
+    'cantidad': 'cantidad',
+    'fecha': 'fecha',
+}
+COLUMNAS_REQUERIDAS_AVANCE = ['clave', 'cantidad']
+
+EXTENSIONES_AVANCE = ('.xlsx', '.xlsm', '.xls', '.csv', '.tsv')
+
+# Diferencia permitida al comparar contra la cantidad pendiente del catálogo
+TOLERANCIA_CANTIDAD = 1e-6
+
+
+# ============================================
+# Lectura del archivo
+# ============================================
+def leer_archivo_avances(filepath):
+    """
+    Lee el archivo de avances completo (.xlsx, .xls, .csv o .tsv) con las columnas normalizadas a
+    clave, cantidad y, si viene, fecha. Las filas totalmente vacías se omiten. Lanza ValueError si
+    el formato no se reconoce o faltan columnas.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in ('.csv', '.tsv'):
+        df = pd.read_csv(filepath, sep='\t' if extension == '.tsv' else ',', dtype=str)
+    elif extension in ('.xlsx', '.xlsm', '.xls'):
+        df = pd.read_excel(filepath)
+    else:
+        raise ValueError("Formato no reconocido; sube un archivo " + ", ".join(EXTENSIONES_AVANCE))
+
+    df = df.rename(columns=lambda c: _ENCABEZADOS.get(str(c).strip().lower(), c))
+    if not all(col in df.columns for col in COLUMNAS_REQUERIDAS_AVANCE):
+        raise ValueError("El archivo debe tener las columnas: clave, cantidad (y opcionalmente fecha)")
+    return df.dropna(how='all')
+
+
+def _fechas(serie):
+    """Convierte una columna a fechas: acepta fechas de Excel, AAAA-MM-DD y DD/MM/AAAA (NaT si no)."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    texto = serie.map(lambda v: v.isoformat() if hasattr(v, 'isoformat') else str(v)).str.strip()
+    iso = pd.to_datetime(texto, format='ISO8601', errors='coerce')
+    return iso.fillna(pd.to_datetime(texto, format='%d/%m/%Y', errors='coerce'))
+
+
+# ============================================
+# Validación (todas las filas a la vez)
+# ============================================
+def revisar_avances(df, catalogo_base, acumulados, fecha=None, permitir_excedentes=False):
+    """
+    Resuelve las claves del archivo contra el catálogo base en una sola pasada y revisa todas las
+    filas a la vez. Devuelve (movimientos, reporte): movimientos es un DataFrame con fecha,
+    concepto_id y cantidad ya sumadas por fecha y concepto (solo de filas válidas); el reporte tiene
+    el mismo formato que el de los catálogos (fila, clave, columna, valor, nivel, error).
+
+    Nivel 'error': clave vacía o que no está en el catálogo base, cantidad no numérica o negativa,
+    fecha inválida o faltante (sin columna fecha se usa `fecha`), o cuando lo acumulado más lo del
+    archivo rebasa la cantidad del catálogo (advertencia con `permitir_excedentes`).
+    Nivel 'advertencia': cantidad vacía o 0 (la fila se omite) y clave repetida en la misma fecha
+    (se suman).
+    """
+    clave = columna_texto(df['clave'])
+    cantidad, cantidad_invalida = columna_numero(df['cantidad'])
+
+    if 'fecha' in df.columns:
+        fechas = _fechas(df['fecha'])
+        if fecha is not None:
+            fechas = fechas.fillna(pd.Timestamp(fecha))
+    else:
+        fechas = pd.Series(pd.Timestamp(fecha) if fecha is not None else pd.NaT, index=df.index)
+    fecha_invalida = fechas.isna()
+
+    por_clave = catalogo_base.por_clave
+    concepto = clave.map(lambda k: por_clave.get(k))
+    sin_clave = clave.isin(['', 'nan'])
+    desconocida = ~sin_clave & concepto.isna()
+    negativa = ~cantidad_invalida & (cantidad < 0)
+    vacia = ~cantidad_invalida & (cantidad.isna() | (cantidad == 0))
+
+    validas = ~(sin_clave | desconocida | cantidad_invalida | negativa | vacia | fecha_invalida)
+    filas = pd.DataFrame({
+        'fecha': fechas[validas].dt.date,
+        'concepto_id': concepto[validas].map(lambda c: c.id),
+        'cantidad': cantidad[validas],
+    })
+    repetida = validas & filas.duplicated(['fecha', 'concepto_id'], keep='first').reindex(df.index, fill_value=False)
+
+    # Pendiente = cantidad del catálogo - acumulado; se revisa contra lo que trae todo el archivo
+    total_archivo = filas.groupby('concepto_id')['cantidad'].sum()
+    pendiente = pd.Series({i: (catalogo_base.por_id[i].cantidad or 0.0) - acumulados.get(i, 0.0)
+                           for i in total_archivo.index}, dtype=float)
+    excedidos = total_archivo.index[(total_archivo - pendiente.reindex(total_archivo.index)) > TOLERANCIA_CANTIDAD]
+    excede = validas & concepto.map(lambda c: c is not None and c.id in excedidos)
+    # En el reporte se indica cuánto quedaba pendiente de cada concepto excedido
+    valor_excede = columna_texto(df['cantidad'])[excede] \
+        + concepto[excede].map(lambda c: f" (pendiente {pendiente[c.id]:,.2f})")
+
+    revisiones = [
+        (sin_clave, 'clave', 'error', 'Falta la clave', None),
+        (desconocida, 'clave', 'error', 'La clave no está en el catálogo base del contrato', None),
+        (cantidad_invalida, 'cantidad', 'error', 'Cantidad no numérica', None),
+        (negativa, 'cantidad', 'error', 'Cantidad negativa', None),
+        (fecha_invalida, 'fecha', 'error',
+         'Fecha inválida' if 'fecha' in df.columns else 'Falta la fecha del avance', None),
+        (excede, 'cantidad', 'advertencia' if permitir_excedentes else 'error',
+         'Con este archivo el avance acumulado rebasa la cantidad del catálogo', valor_excede),
+        (vacia, 'cantidad', 'advertencia', 'Cantidad vacía o 0 (se omite)', None),
+        (repetida, 'clave', 'advertencia', 'Clave repetida en la misma fecha (se suman)', None),
+    ]
+    reporte = pd.concat([_reporte_avances(df, mascara, columna, nivel, error, clave, valores)
+                         for mascara, columna, nivel, error, valores in revisiones if mascara.any()]
+                        or [pd.DataFrame(columns=COLUMNAS_REPORTE)], ignore_index=True)
+    reporte = reporte.sort_values('fila', kind='stable', ignore_index=True)[COLUMNAS_REPORTE]
+
+    movimientos = filas.groupby(['fecha', 'concepto_id'], as_index=False, sort=True)['cantidad'].sum()
+    return movimientos, reporte
+
+
+def _reporte_avances(df, mascara, columna, nivel, error, clave, valores=None):
+    filas = df[mascara]
+    if valores is None:
+        valores = filas[columna].map(lambda v: '' if pd.isna(v) else str(v)) if columna in df.columns \
+            else pd.Series('', index=filas.index)
+    return pd.DataFrame({
+        'fila': fila_archivo(filas.index.to_series()),
+        'clave': clave[mascara],
+        'columna': columna,
+        'valor': valores,
+        'nivel': nivel,
+        'error': error,
+    })
+
+
+# ============================================
+# Importación
+# ============================================
+def importar_avances(contrato_id, df, fecha=None, permitir_excedentes=False):
+    """
+    Valida el archivo contra el catálogo base y los acumulados del contrato y, si no hay errores,
+    registra un avance por fecha con todos sus detalles en bloque (ver registrar_avances). No hace
+    commit. Devuelve (avances creados, reporte); con errores no registra nada y los avances van vacíos.
+    """
+    catalogo_base = generar_catalogo_base(contrato_id)
+    movimientos, reporte = revisar_avances(df, catalogo_base, leer_acumulados(contrato_id), fecha,
+                                           permitir_excedentes)
+    if tiene_errores(reporte):
+        return [], reporte
+
+    cantidades_por_fecha = {
+        fecha_avance: dict(zip(grupo['concepto_id'], grupo['cantidad']))
+        for fecha_avance, grupo in movimientos.groupby('fecha', sort=True)
+    }
+    return registrar_avances(contrato_id, cantidades_por_fecha, catalogo_base), reporte
@@ -0,0 +1,565 @@
+from models import db, CatalogoVersion, ConceptoCatalogo, AprobacionConcepto, RevisionConcepto
+from services.catalogo_base import (
+    aplicar_version_catalogo_base, reconstruir_catalogo_base, registrar_snapshot_catalogo_base,
+    obtener_version_original, obtener_version_anterior_id, generar_catalogo_base
+)
+from services.lectura_archivos import COLUMNAS_REPORTE, columna_texto, columna_numero, fila_archivo, tiene_errores
+from services.prefiniquitos import comparar_versiones_catalogo
+from services.trabajos import tarea
+from sqlalchemy import insert, select, delete, func
+from flask import current_app, has_app_context
+from werkzeug.utils import secure_filename
+from datetime import date
+from itertools import islice
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import pandas as pd
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_REQUERIDAS = [
+    'numero partida',
+    'nombre partida',
+    'clave concepto',
+    'descripcion concepto',
+    'unidad',
+    'precio unitario',
+    'cantidad',
+    'subtotal'
+]
+
+# Columnas de texto del archivo -> columna de ConceptoCatalogo
+_COLUMNAS_TEXTO = {
+    'clave concepto': 'clave_concepto',
+    'numero partida': 'partida',
+    'nombre partida': 'nombre_partida',
+    'descripcion concepto': 'descripcion',
+    'unidad': 'unidad',
+}
+
+# Filas que se leen, validan e insertan a la vez al importar
+TAMANO_BLOQUE = 2000
+
+# Columnas que deciden si un concepto cambió respecto al catálogo base (versiones en modo 'cambios')
+COLUMNAS_COMPARADAS = [
+    'partida', 'nombre_partida', 'descripcion', 'unidad', 'precio_unitario', 'cantidad', 'subtotal'
+]
+
+CARPETA_UPLOADS = 'uploads'
+EXTENSIONES_CATALOGO = ('.xlsx', '.xlsm', '.xls', '.csv', '.tsv')
+_TAMANO_LECTURA = 1024 * 1024  # bytes por lectura al guardar el archivo subido
+
+# Diferencia permitida entre el subtotal capturado y P.U. x cantidad
+TOLERANCIA_SUBTOTAL = 0.01
+
+MENSAJE_ERROR_NUMERICO = (
+    "Error al convertir valores numéricos. Revisa que los precios, cantidades y subtotales sean válidos."
+)
+
+
+class ErroresValidacion(ValueError):
+    """El archivo trae filas inválidas; `reporte` es el reporte completo (ver revisar_conceptos)."""
+
+    def __init__(self, reporte):
+        self.reporte = reporte
+        errores = int((reporte['nivel'] == 'error').sum())
+        super().__init__(f"{MENSAJE_ERROR_NUMERICO} Se encontraron {errores} errores; "
+                         "descarga el reporte para verlos todos.")
+
+
+def _reporte(df, mascara, columna, nivel, error, clave):
+    filas = df[mascara]
+    return pd.DataFrame({
+        'fila': fila_archivo(filas.index.to_series()),
+        'clave': clave[mascara],
+        'columna': columna,
+        'valor': filas[columna].map(lambda v: '' if pd.isna(v) else str(v)),
+        'nivel': nivel,
+        'error': error,
+    })
+
+
+def revisar_conceptos(df, claves_vistas=None):
+    """
+    Convierte el DataFrame del catálogo a las columnas de ConceptoCatalogo y revisa todas sus
+    filas a la vez (sin detenerse en la primera). Devuelve (conceptos, reporte), donde el reporte
+    tiene una fila por problema: fila del archivo, clave, columna, valor, nivel y descripción.
+
+    Nivel 'error' (la versión no se puede importar): precio, cantidad o subtotal no numéricos.
+    Nivel 'advertencia' (se importa igual): falta la partida, la clave se repite en el archivo o
+    el subtotal no coincide con P.U. x cantidad.
+
+    `claves_vistas` (un set) acumula las claves de bloques anteriores para detectar repetidas
+    en todo el archivo. Lanza ValueError si faltan columnas.
+    """
+    if not all(col in df.columns for col in COLUMNAS_REQUERIDAS):
+        raise ValueError("El archivo debe tener las siguientes columnas: " + ", ".join(COLUMNAS_REQUERIDAS))
+
+    precio_unitario, pu_invalido = columna_numero(df['precio unitario'], limpiar_moneda=True)
+    cantidad, cantidad_invalida = columna_numero(df['cantidad'])
+    subtotal, subtotal_invalido = columna_numero(df['subtotal'], limpiar_moneda=True)
+
+    # El subtotal solo se valida donde viene capturado
+    subtotal_capturado = df['subtotal'].notna()
+    subtotal_invalido &= subtotal_capturado
+
+    conceptos = pd.DataFrame({destino: columna_texto(df[origen]) for origen, destino in _COLUMNAS_TEXTO.items()})
+    conceptos['precio_unitario'] = precio_unitario
+    conceptos['cantidad'] = cantidad
+    # Sin subtotal en el archivo se calcula con precio unitario x cantidad
+    calculado = precio_unitario * cantidad
+    conceptos['subtotal'] = subtotal.where(subtotal_capturado, calculado)
+
+    clave = conceptos['clave_concepto']
+    con_clave = clave.ne('') & clave.ne('nan')
+    repetida = con_clave & clave.duplicated(keep='first')
+    if claves_vistas is not None:
+        repetida |= con_clave & clave.isin(claves_vistas)
+        claves_vistas.update(clave[con_clave])
+
+    sin_partida = conceptos['partida'].isin(['', 'nan'])
+    subtotal_distinto = subtotal_capturado & ~(pu_invalido | cantidad_invalida | subtotal_invalido) \
+        & ((subtotal - calculado).abs() > TOLERANCIA_SUBTOTAL)
+
+    revisiones = [
+        (pu_invalido, 'precio unitario', 'error', 'Precio unitario no numérico'),
+        (cantidad_invalida, 'cantidad', 'error', 'Cantidad no numérica'),
+        (subtotal_invalido, 'subtotal', 'error', 'Subtotal no numérico'),
+        (sin_partida, 'numero partida', 'advertencia', 'Falta el número de partida'),
+        (repetida, 'clave concepto', 'advertencia', 'Clave repetida en el archivo (cuenta la última)'),
+        (subtotal_distinto, 'subtotal', 'advertencia', 'El subtotal no coincide con P.U. x cantidad'),
+    ]
+    reporte = pd.concat([_reporte(df, mascara, columna, nivel, error, clave)
+                         for mascara, columna, nivel, error in revisiones if mascara.any()]
+                        or [pd.DataFrame(columns=COLUMNAS_REPORTE)], ignore_index=True)
+    return conceptos, reporte.sort_values('fila', kind='stable', ignore_index=True)[COLUMNAS_REPORTE]
+
+
+def preparar_conceptos(df):
+    """
+    Valida y convierte el DataFrame del catálogo a las columnas de ConceptoCatalogo, columna por
+    columna en lugar de fila por fila. Lanza ValueError si hay columnas faltantes o
+    ErroresValidacion (también ValueError) si hay valores numéricos inválidos.
+    """
+    conceptos, reporte = revisar_conceptos(df)
+    if tiene_errores(reporte):
+        raise ErroresValidacion(reporte[reporte['nivel'] == 'error'])
+    return conceptos
+
+
+def insertar_conceptos(version_id, conceptos):
+    """Inserta en bloque (un solo executemany) los conceptos preparados para la versión dada."""
+    if conceptos.empty:
+        return 0
+
+    registros = conceptos.assign(version_id=version_id).to_dict('records')
+    db.session.execute(insert(ConceptoCatalogo), registros)
+    return len(registros)
+
+
+# ============================================
+# Aprobaciones de extraordinarios nuevos
+# ============================================
+def registrar_aprobaciones_extraordinarios(contrato_id, conceptos):
+    """
+    Crea la AprobacionConcepto (en elaboración) y su primera RevisionConcepto para cada clave
+    extraordinaria ('E...') del archivo que todavía no tiene aprobación en el contrato. Usa una sola
+    consulta IN para las existentes y dos inserciones en bloque; no hace commit, para quedar en la
+    misma transacción que los conceptos. Si una clave se repite en el archivo cuenta la primera.
+    """
+    extraordinarios = conceptos[conceptos['clave_concepto'].str.lower().str.startswith('e')] \
+        .drop_duplicates('clave_concepto', keep='first')
+    if extraordinarios.empty:
+        return 0
+
+    claves = extraordinarios['clave_concepto'].tolist()
+    existentes = set(db.session.execute(
+        select(AprobacionConcepto.clave_concepto)
+        .where(AprobacionConcepto.contrato_id == contrato_id, AprobacionConcepto.clave_concepto.in_(claves))
+    ).scalars())
+
+    nuevos = extraordinarios[~extraordinarios['clave_concepto'].isin(existentes)]
+    if nuevos.empty:
+        return 0
+
+    aprobaciones = [
+        {
+            'contrato_id': contrato_id,
+            'clave_concepto': fila['clave_concepto'],
+            'estado': 'elaboracion',
+            'precio_unitario': fila['precio_unitario'],
+            'descripcion': fila['descripcion'],
+        }
+        for fila in nuevos[['clave_concepto', 'precio_unitario', 'descripcion']].to_dict('records')
+    ]
+    # RETURNING sin orden garantizado (así el INSERT va en lotes); se empata por clave
+    ids = dict(db.session.execute(
+        insert(AprobacionConcepto).returning(AprobacionConcepto.clave_concepto, AprobacionConcepto.id),
+        aprobaciones
+    ).all())
+
+    hoy = date.today()
+    db.session.execute(insert(RevisionConcepto), [
+        {
+            'aprobacion_id': ids[aprobacion['clave_concepto']],
+            'numero_revision': 1,
+            'fecha_registro': hoy,
+            'precio_unitario': aprobacion['precio_unitario'],
+            'comentario': 'Registro inicial desde catálogo',
+            'estado': 'elaboracion',
+        }
+        for aprobacion in aprobaciones
+    ])
+    return len(aprobaciones)
+
+
+# ============================================
+# Almacenamiento de archivos por contenido
+# ============================================
+def guardar_archivo_por_contenido(archivo, carpeta=CARPETA_UPLOADS):
+    """
+    Guarda el archivo subido como `<carpeta>/<sha256><extensión>`, calculando el hash mientras se
+    escribe a disco (sin cargar el archivo en memoria). El mismo contenido siempre termina en la
+    misma ruta, así que subirlo de nuevo no deja copias. Devuelve (ruta, hash).
+    """
+    extension = os.path.splitext(secure_filename(archivo.filename or ''))[1].lower()
+    os.makedirs(carpeta, exist_ok=True)
+
+    digest = hashlib.sha256()
+    descriptor, temporal = tempfile.mkstemp(dir=carpeta, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as destino:
+            for bloque in iter(lambda: archivo.stream.read(_TAMANO_LECTURA), b''):
+                digest.update(bloque)
+                destino.write(bloque)
+
+        hash_archivo = digest.hexdigest()
+        ruta = os.path.join(carpeta, hash_archivo + extension)
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    return ruta, hash_archivo
+
+
+def buscar_archivo_subido(hash_archivo, carpeta=CARPETA_UPLOADS):
+    """Ruta del archivo guardado con ese hash (ver guardar_archivo_por_contenido) o None."""
+    if not re.fullmatch(r'[0-9a-f]{64}', hash_archivo or ''):
+        return None
+    for extension in EXTENSIONES_CATALOGO:
+        ruta = os.path.join(carpeta, hash_archivo + extension)
+        if os.path.exists(ruta):
+            return ruta
+    return None
+
+
+def buscar_version_importada(contrato_id, hash_archivo):
+    """
+    Versión del contrato que ya se importó, o que se está importando, desde un archivo con ese
+    mismo contenido (o None). El hash se guarda al crear la versión y, si la importación falla o se
+    interrumpe, la versión se descarta con todo y hash (ver descartar_version_parcial).
+    """
+    return CatalogoVersion.query.filter_by(contrato_id=contrato_id, hash_archivo=hash_archivo) \
+        .order_by(CatalogoVersion.id.asc()).first()
+
+
+# ============================================
+# Lectura por bloques (memoria acotada)
+# ============================================
+def _tamano_bloque():
+    if has_app_context():
+        return current_app.config.get('CATALOGO_IMPORTACION_BLOQUE', TAMANO_BLOQUE)
+    return TAMANO_BLOQUE
+
+
+def _validar_encabezados(columnas):
+    if not all(col in columnas for col in COLUMNAS_REQUERIDAS):
+        raise ValueError("El archivo debe tener las siguientes columnas: " + ", ".join(COLUMNAS_REQUERIDAS))
+
+
+def leer_bloques(filepath, tamano_bloque=None):
+    """
+    Abre el catálogo (.xlsx en modo solo lectura, .csv o .tsv) y valida los encabezados de
+    inmediato; devuelve un generador de DataFrames de a lo más `tamano_bloque` filas, de modo que
+    nunca se tiene el archivo completo en memoria. Las filas totalmente vacías se omiten.
+    Lanza ValueError si faltan columnas; otros errores de lectura se propagan tal cual.
+    """
+    tamano_bloque = tamano_bloque or _tamano_bloque()
+    extension = os.path.splitext(filepath)[1].lower()
+
+    if extension in ('.csv', '.tsv'):
+        separador = '\t' if extension == '.tsv' else ','
+        _validar_encabezados(pd.read_csv(filepath, sep=separador, nrows=0).columns)
+        # Todo como texto: la conversión numérica la hace preparar_conceptos igual para cada bloque
+        return _bloques_csv(filepath, separador, tamano_bloque)
+
+    if extension in ('.xlsx', '.xlsm'):
+        libro = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            encabezados = next(libro.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+        finally:
+            libro.close()
+        _validar_encabezados(encabezados)
+        return _bloques_excel(filepath, list(encabezados), tamano_bloque)
+
+    # Otros formatos (p. ej. .xls): pandas lee el libro completo
+    df = pd.read_excel(filepath)
+    _validar_encabezados(df.columns)
+    return (df.iloc[i:i + tamano_bloque] for i in range(0, len(df), tamano_bloque))
+
+
+def _bloques_csv(filepath, separador, tamano_bloque):
+    with pd.read_csv(filepath, sep=separador, dtype=str, chunksize=tamano_bloque) as lector:
+        yield from lector
+
+
+def _bloques_excel(filepath, encabezados, tamano_bloque):
+    # El libro se abre hasta que se pide el primer bloque y se cierra al terminar o al cerrar el generador
+    libro = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        hoja = libro.worksheets[0]
+        # El índice es la posición de la fila bajo los encabezados, para ubicarla en el reporte de validación
+        filas = ((i, f) for i, f in enumerate(hoja.iter_rows(min_row=2, values_only=True))
+                 if any(v is not None for v in f))
+        while True:
+            bloque = list(islice(filas, tamano_bloque))
+            if not bloque:
+                break
+            df = pd.DataFrame([f for _, f in bloque], index=[i for i, _ in bloque], columns=encabezados,
+                              dtype=object)
+            # Celdas vacías como NaN, igual que pd.read_excel
+            yield df.where(df.notna(), float('nan'))
+    finally:
+        libro.close()
+
+
+def validar_archivo(filepath):
+    """Valida que el archivo se pueda abrir y tenga las columnas requeridas, sin leer las filas."""
+    leer_bloques(filepath).close()
+
+
+def importar_catalogo(contrato_id, version_id, bloques, progreso=None, catalogo_anterior=None):
+    """
+    Valida e inserta bloque por bloque los conceptos de la versión y registra las aprobaciones
+    de los extraordinarios nuevos. `progreso(filas_procesadas)` se llama después de cada bloque.
+    No hace commit (salvo que lo haga `progreso`).
+
+    Todas las filas se revisan en la misma pasada: si algún bloque trae errores ya no se inserta
+    nada más, pero se siguen revisando los bloques restantes y al final se lanza
+    ErroresValidacion con el reporte completo; quien llama debe hacer rollback o
+    descartar_version_parcial. Devuelve (total de filas, reporte de advertencias).
+
+    Con `catalogo_anterior` (ver leer_catalogo_anterior) la versión se guarda en modo 'cambios':
+    solo se insertan los conceptos nuevos o modificados y, al final, una marca `eliminado` por cada
+    clave del catálogo anterior que no venía en el archivo.
+    """
+    procesadas = 0
+    claves_archivo = set()
+    claves_vistas = set()
+    reportes = []
+    con_errores = False
+    try:
+        for bloque in bloques:
+            conceptos, reporte = revisar_conceptos(bloque.dropna(how='all'), claves_vistas)
+            if not reporte.empty:
+                reportes.append(reporte)
+            con_errores = con_errores or tiene_errores(reporte)
+
+            if not con_errores:
+                if catalogo_anterior is not None:
+                    claves_archivo.update(conceptos['clave_concepto'])
+                    insertar_conceptos(version_id, filtrar_cambios(conceptos, catalogo_anterior))
+                else:
+                    insertar_conceptos(version_id, conceptos)
+                registrar_aprobaciones_extraordinarios(contrato_id, conceptos)
+
+            procesadas += len(conceptos)
+            if progreso:
+                progreso(procesadas)
+    finally:
+        # Cierra el libro de Excel aunque la importación se interrumpa
+        bloques.close()
+
+    reporte = pd.concat(reportes, ignore_index=True) if reportes else pd.DataFrame(columns=COLUMNAS_REPORTE)
+    if con_errores:
+        raise ErroresValidacion(reporte)
+
+    if catalogo_anterior is not None:
+        insertar_claves_eliminadas(version_id, catalogo_anterior.index.difference(list(claves_archivo)))
+    return procesadas, reporte
+
+
+# ============================================
+# Reporte de validación
+# ============================================
+def ruta_reporte_validacion(hash_archivo, carpeta=CARPETA_UPLOADS):
+    """El reporte de un archivo se guarda junto a él: `<carpeta>/<hash>.errores.csv`."""
+    return os.path.join(carpeta, f"{hash_archivo}.errores.csv")
+
+
+def guardar_reporte_validacion(hash_archivo, reporte, carpeta=CARPETA_UPLOADS):
+    """Escribe el reporte como CSV (UTF-8 con BOM para que Excel respete los acentos); sin filas lo borra."""
+    ruta = ruta_reporte_validacion(hash_archivo, carpeta)
+    if reporte.empty:
+        if os.path.exists(ruta):
+            os.remove(ruta)
+        return None
+    reporte.to_csv(ruta, index=False, encoding='utf-8-sig')
+    return ruta
+
+
+def buscar_reporte_validacion(hash_archivo, carpeta=CARPETA_UPLOADS):
+    """Ruta del reporte de validación del archivo con ese hash, o None si no hay."""
+    if not re.fullmatch(r'[0-9a-f]{64}', hash_archivo or ''):
+        return None
+    ruta = ruta_reporte_validacion(hash_archivo, carpeta)
+    return ruta if os.path.exists(ruta) else None
+
+
+# ============================================
+# Versiones en modo 'cambios'
+# ============================================
+def leer_catalogo_anterior(version):
+    """
+    Columnas comparadas de los conceptos del catálogo base vigente antes de `version`, en un
+    DataFrame indexado por clave. Se lee una vez por importación, antes del primer bloque.
+    """
+    anterior_id = obtener_version_anterior_id(version)
+    ids = [c.id for c in generar_catalogo_base(version.contrato_id, as_of=anterior_id)] if anterior_id else []
+
+    columnas = [ConceptoCatalogo.clave_concepto] + [getattr(ConceptoCatalogo, col) for col in COLUMNAS_COMPARADAS]
+    filas = []
+    for inicio in range(0, len(ids), 900):
+        filas.extend(db.session.execute(
+            select(*columnas).where(ConceptoCatalogo.id.in_(ids[inicio:inicio + 900]))
+        ).all())
+
+    return pd.DataFrame(filas, columns=['clave_concepto', *COLUMNAS_COMPARADAS]).set_index('clave_concepto')
+
+
+def filtrar_cambios(conceptos, catalogo_anterior):
+    """Conceptos preparados cuya clave es nueva o que difieren del catálogo anterior en alguna columna."""
+    anteriores = catalogo_anterior.reindex(conceptos['clave_concepto'])
+    anteriores.index = conceptos.index
+
+    iguales = conceptos['clave_concepto'].isin(catalogo_anterior.index)
+    for columna in COLUMNAS_COMPARADAS:
+        nuevo, anterior = conceptos[columna], anteriores[columna]
+        iguales &= (nuevo == anterior) | (nuevo.isna() & anterior.isna())
+    return conceptos[~iguales]
+
+
+def insertar_claves_eliminadas(version_id, claves):
+    """Inserta en bloque las marcas de las claves que la versión ya no trae."""
+    registros = [{'version_id': version_id, 'clave_concepto': clave, 'eliminado': True} for clave in claves]
+    if registros:
+        db.session.execute(insert(ConceptoCatalogo), registros)
+    return len(registros)
+
+
+def descartar_version_parcial(contrato_id, version_id, ultima_aprobacion_id=0):
+    """
+    Elimina una versión cuya importación falló después de confirmar algunos bloques: sus
+    conceptos, la versión (y con ella el hash del archivo, que así se puede volver a subir) y las aprobaciones de extraordinarios creadas por la importación
+    (id mayor a `ultima_aprobacion_id`) cuya clave ya no aparece en otro catálogo del contrato.
+    Reconstruye el catálogo base por si alguien lo materializó con los conceptos parciales.
+    No hace commit.
+    """
+    db.session.execute(delete(ConceptoCatalogo).where(ConceptoCatalogo.version_id == version_id))
+    db.session.execute(delete(CatalogoVersion).where(CatalogoVersion.id == version_id))
+
+    claves_vigentes = select(ConceptoCatalogo.clave_concepto) \
+        .join(CatalogoVersion, ConceptoCatalogo.version_id == CatalogoVersion.id) \
+        .where(CatalogoVersion.contrato_id == contrato_id)
+    huerfanas = db.session.execute(
+        select(AprobacionConcepto.id).where(
+            AprobacionConcepto.contrato_id == contrato_id,
+            AprobacionConcepto.id > ultima_aprobacion_id,
+            AprobacionConcepto.clave_concepto.not_in(claves_vigentes)
+        )
+    ).scalars().all()
+    if huerfanas:
+        db.session.execute(delete(RevisionConcepto).where(RevisionConcepto.aprobacion_id.in_(huerfanas)))
+        db.session.execute(delete(AprobacionConcepto).where(AprobacionConcepto.id.in_(huerfanas)))
+
+    reconstruir_catalogo_base(contrato_id)
+
+
+# ============================================
+# Trabajo en segundo plano: subir catálogo
+# ============================================
+def obtener_ultima_aprobacion_id():
+    """Id de la última AprobacionConcepto (0 si no hay), para descartar después las que cree una importación."""
+    return db.session.execute(select(func.max(AprobacionConcepto.id))).scalar() or 0
+
+
+def _descartar_importacion_interrumpida(contrato_id, version_id, ultima_aprobacion_id=0, **_):
+    """Limpieza de un trabajo 'subir_catalogo' que no terminó: descarta la versión a medias."""
+    if db.session.get(CatalogoVersion, version_id) is not None:
+        descartar_version_parcial(contrato_id, version_id, ultima_aprobacion_id)
+
+
+@tarea('subir_catalogo', al_interrumpir=_descartar_importacion_interrumpida)
+def importar_version_catalogo(avance, contrato_id, version_id, filepath, hash_archivo=None,
+                              ultima_aprobacion_id=None):
+    """
+    Importa el archivo a la versión ya creada, actualiza el catálogo base y, si es un catálogo
+    actualizado, deja calculada su comparación contra el original. Cada bloque se confirma al reportar
+    el avance, pero la versión sigue marcada como `importando` (y ninguna consulta la ve) hasta que
+    se aplica al catálogo base, en el mismo commit; si algo falla antes, la versión se descarta completa.
+    La versión ya trae el `hash_archivo` desde que se creó, para que el mismo archivo no se vuelva a
+    importar mientras este trabajo corre; si la importación falla, se descarta junto con la versión.
+    """
+    if ultima_aprobacion_id is None:
+        ultima_aprobacion_id = obtener_ultima_aprobacion_id()
+    version = db.session.get(CatalogoVersion, version_id)
+    hash_archivo = hash_archivo or version.hash_archivo
+
+    try:
+        catalogo_anterior = None
+        if version.modo_almacenamiento == 'cambios':
+            avance.paso('Leyendo catálogo base anterior')
+            catalogo_anterior = leer_catalogo_anterior(version)
+
+        avance.paso('Importando conceptos')
+        total, advertencias = importar_catalogo(contrato_id, version_id, leer_bloques(filepath), progreso=avance,
+                                                catalogo_anterior=catalogo_anterior)
+
+        avance.paso('Actualizando catálogo base')
+        version.importando = False
+        aplicar_version_catalogo_base(contrato_id, version_id)
+        registrar_snapshot_catalogo_base(contrato_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        descartar_version_parcial(contrato_id, version_id, ultima_aprobacion_id)
+        db.session.commit()
+        if isinstance(e, ErroresValidacion) and hash_archivo:
+            guardar_reporte_validacion(hash_archivo, e.reporte)
+        raise
+
+    if hash_archivo:
+        guardar_reporte_validacion(hash_archivo, advertencias)
+
+    if version.tipo == 'actualizado':
+        version_original = obtener_version_original(contrato_id)
+        if version_original:
+            # Solo se calcula (queda en caché); se guarda como prefiniquito si el usuario lo congela.
+            # La importación ya quedó confirmada: si falla, la comparación se calcula al abrirla
+            avance.paso('Calculando prefiniquito')
+            try:
+                comparar_versiones_catalogo(version_original, version)
+            except Exception:
+                logger.exception("No se pudo precalcular la comparación de la versión %s", version_id)
+                db.session.rollback()
+
+    mensaje = f"Catálogo cargado correctamente ({total} conceptos)."
+    if not advertencias.empty:
+        mensaje += f" Se encontraron {len(advertencias)} advertencias; descarga el reporte para revisarlas."
+    return mensaje
@@ -0,0 +1,44 @@
+import pandas as pd
+
+# Columnas del reporte de validación de un archivo importado (se descarga como CSV)
+COLUMNAS_REPORTE = ['fila', 'clave', 'columna', 'valor', 'nivel', 'error']
+
+
+# ============================================
+# Conversión de columnas (toda la columna a la vez)
+# ============================================
+def columna_texto(serie):
+    """Igual que str(valor).strip() celda por celda (las celdas vacías quedan como 'nan')."""
+    return serie.map(str).str.strip()
+
+
+def columna_numero(serie, limpiar_moneda=False):
+    """
+    Convierte una columna a float como lo hacía float(str(valor)...) por celda: con
+    `limpiar_moneda` se quitan '$' y ','. Devuelve (valores, máscara de celdas inválidas);
+    las celdas vacías (NaN) se aceptan y quedan como NaN.
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype(float), pd.Series(False, index=serie.index)
+
+    texto = serie.map(str)
+    if limpiar_moneda:
+        texto = texto.str.replace(r'[$,]', '', regex=True)
+    texto = texto.str.strip()
+
+    valores = pd.to_numeric(texto, errors='coerce')
+    invalidos = valores.isna() & (texto.str.lower() != 'nan')
+    return valores.astype(float), invalidos
+
+
+def fila_archivo(indice):
+    """Número de fila en el archivo (la fila 1 son los encabezados)."""
+    return indice + 2
+
+
+# ============================================
+# Reporte de validación
+# ============================================
+def tiene_errores(reporte):
+    """True si el reporte de validación trae algún problema de nivel 'error', que impide importar."""
+    return bool((reporte['nivel'] == 'error').any())
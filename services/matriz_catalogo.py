@@ -0,0 +1,218 @@
+from models import db, CatalogoVersion, ConceptoCatalogo
+from services.catalogo_base import marca_catalogo_base
+from services.cache import CacheLRU
+from sqlalchemy import select
+from typing import NamedTuple
+import math
+import numpy as np
+import pandas as pd
+
+# Matrices concepto × versión ya calculadas, por contrato; vencen si cambia el catálogo base
+cache_matrices = CacheLRU('matriz_catalogo', tamano_maximo=8, clave_config='CATALOGO_MATRIZ_CACHE_TAMANO')
+
+CAMPOS_MATRIZ = ('precio_unitario', 'cantidad', 'subtotal')
+
+TAMANO_PAGINA = 200
+
+_COLUMNAS_VERSION = ['version_id', 'nombre', 'tipo', 'fecha_subida', 'modo_almacenamiento']
+_COLUMNAS_CONCEPTO = [
+    'id', 'clave_concepto', 'partida', 'nombre_partida', 'descripcion', 'unidad',
+    'precio_unitario', 'cantidad', 'subtotal', 'estatus', 'eliminado'
+]
+
+
+class MatrizCatalogo(NamedTuple):
+    """
+    Evolución de los conceptos de un contrato en todas sus versiones. Los arreglos son densos
+    (claves × versiones) con NaN donde la clave no forma parte de esa versión.
+    """
+    contrato_id: int
+    versiones: list          # dicts con id, nombre, tipo, fecha_subida, modo_almacenamiento
+    conceptos: pd.DataFrame  # una fila por clave: clave, partida, nombre_partida, descripcion, unidad
+    precio_unitario: np.ndarray
+    cantidad: np.ndarray
+    subtotal: np.ndarray
+    partidas: pd.DataFrame   # una fila por partida: partida, nombre_partida, conceptos
+    subtotal_partida: np.ndarray  # partidas × versiones
+    total_version: np.ndarray
+
+
+def _leer_filas(contrato_id):
+    """Todas las versiones del contrato con sus conceptos (y marcas de eliminado) en una sola consulta."""
+    consulta = select(
+        CatalogoVersion.id.label('version_id'), CatalogoVersion.nombre, CatalogoVersion.tipo,
+        CatalogoVersion.fecha_subida, CatalogoVersion.modo_almacenamiento,
+        *(getattr(ConceptoCatalogo, columna) for columna in _COLUMNAS_CONCEPTO)
+    ).select_from(CatalogoVersion) \
+        .outerjoin(ConceptoCatalogo, ConceptoCatalogo.version_id == CatalogoVersion.id) \
+        .where(CatalogoVersion.contrato_id == contrato_id, CatalogoVersion.importando.isnot(True)) \
+        .order_by(CatalogoVersion.id.asc(), ConceptoCatalogo.id.asc())
+    # Por la conexión (Core) y no por la sesión: son muchas filas y no se necesita el procesamiento del ORM
+    return pd.DataFrame(db.session.connection().execute(consulta).all(),
+                        columns=_COLUMNAS_VERSION + _COLUMNAS_CONCEPTO)
+
+
+def _posiciones(tabla, forma):
+    """Arreglo denso con la posición (fila de `tabla`) de cada celda clave × versión, -1 si no hay."""
+    posiciones = np.full(forma, -1, dtype=np.int64)
+    posiciones[tabla['fila'].to_numpy(), tabla['columna'].to_numpy()] = np.arange(len(tabla))
+    return posiciones
+
+
+def _ultima_hasta(posiciones):
+    """Para cada celda, la posición de la última celda con datos en esa fila hasta esa versión (inclusive)."""
+    columnas = np.where(posiciones >= 0, np.arange(posiciones.shape[1]), -1)
+    ultima_columna = np.maximum.accumulate(columnas, axis=1)
+    filas = np.arange(posiciones.shape[0])[:, None]
+    return np.where(ultima_columna >= 0, posiciones[filas, np.maximum(ultima_columna, 0)], -1)
+
+
+def _tomar(tabla, posiciones, columna):
+    """Valores de `columna` de `tabla` en las posiciones dadas (NaN donde la posición es -1)."""
+    valores = np.append(tabla[columna].to_numpy(dtype=float), np.nan)
+    return valores[posiciones]
+
+
+def calcular_matriz_catalogo(contrato_id):
+    """
+    Matriz de precio unitario, cantidad y subtotal de cada clave en cada versión del contrato,
+    con subtotales por partida y el total de cada versión.
+
+    Sale de una sola consulta y se pivota con numpy, sin reconstruir versión por versión. Cada
+    columna es la versión completa, como la muestra `conceptos_de_version`: las versiones en modo
+    'cambios' toman del catálogo base vigente antes de ellas las claves que no cambiaron (con la
+    regla de extraordinarios aprobados) y excluyen las que marcan como eliminadas. Si una clave se
+    repite en una versión cuenta la última fila.
+    """
+    filas = _leer_filas(contrato_id)
+    versiones = filas.drop_duplicates('version_id')[_COLUMNAS_VERSION].rename(columns={'version_id': 'id'})
+    columna_version = pd.Index(versiones['id'])
+
+    conceptos = filas[filas['clave_concepto'].notna() & (filas['clave_concepto'] != '')].copy()
+    claves = pd.Index(pd.unique(conceptos['clave_concepto']))
+    conceptos['fila'] = claves.get_indexer(conceptos['clave_concepto'])
+    conceptos['columna'] = columna_version.get_indexer(conceptos['version_id'])
+    forma = (len(claves), len(columna_version))
+
+    eliminado = conceptos['eliminado'].fillna(False).astype(bool)
+    vivos = conceptos[~eliminado]
+    ultimos = vivos.drop_duplicates(['fila', 'columna'], keep='last').reset_index(drop=True)
+    fijos = vivos[~vivos['estatus'].fillna('').isin(['E', 'R'])] \
+        .drop_duplicates(['fila', 'columna'], keep='last').reset_index(drop=True)
+
+    propios = _posiciones(ultimos, forma)
+    eliminadas = np.zeros(forma, dtype=bool)
+    marcas = conceptos[eliminado]
+    eliminadas[marcas['fila'].to_numpy(), marcas['columna'].to_numpy()] = True
+
+    # Catálogo base vigente hasta cada versión: gana la última fila, salvo que la última fila fija
+    # (estatus distinto de E/R) sea un extraordinario aprobado
+    ultima = _ultima_hasta(propios)
+    ultima_fija = _ultima_hasta(_posiciones(fijos, forma))
+    estatus_fijo = np.append(fijos['estatus'].fillna('').to_numpy(dtype=object), '')[ultima_fija]
+    extraordinario = np.array([clave.startswith('E') for clave in claves], dtype=bool)[:, None]
+    usa_fija = (estatus_fijo == 'A') & extraordinario
+
+    # Las versiones 'cambios' parten del catálogo base hasta la versión anterior
+    base_anterior = np.full(forma, -1, dtype=np.int64)
+    base_fija_anterior = np.full(forma, -1, dtype=np.int64)
+    usa_fija_anterior = np.zeros(forma, dtype=bool)
+    base_anterior[:, 1:] = ultima[:, :-1]
+    base_fija_anterior[:, 1:] = ultima_fija[:, :-1]
+    usa_fija_anterior[:, 1:] = usa_fija[:, :-1]
+
+    solo_cambios = (versiones['modo_almacenamiento'] == 'cambios').to_numpy()[None, :]
+    heredada = solo_cambios & (propios < 0) & ~eliminadas & (base_anterior >= 0)
+    heredada_fija = heredada & usa_fija_anterior
+    heredada_ultima = heredada & ~usa_fija_anterior
+
+    matrices = {}
+    for campo in CAMPOS_MATRIZ:
+        valores = _tomar(ultimos, propios, campo)
+        valores[heredada_ultima] = _tomar(ultimos, base_anterior, campo)[heredada_ultima]
+        valores[heredada_fija] = _tomar(fijos, base_fija_anterior, campo)[heredada_fija]
+        matrices[campo] = valores
+
+    # Datos descriptivos de cada clave: los de su última aparición
+    descripcion = ultimos.drop_duplicates('fila', keep='last').set_index('fila') \
+        .reindex(range(len(claves)))[['partida', 'nombre_partida', 'descripcion', 'unidad']]
+    descripcion.insert(0, 'clave', claves)
+    descripcion = descripcion.reset_index(drop=True)
+
+    # Subtotales por partida (agrupando cada clave en su partida más reciente)
+    partida = descripcion['partida'].fillna('')
+    por_partida = pd.DataFrame(np.nan_to_num(matrices['subtotal'])).groupby(partida.to_numpy(), sort=True).sum()
+    partidas = descripcion.assign(partida=partida).groupby('partida', sort=True) \
+        .agg(nombre_partida=('nombre_partida', 'last'), conceptos=('clave', 'size')).reset_index()
+
+    return MatrizCatalogo(
+        contrato_id=contrato_id,
+        versiones=versiones.to_dict('records'),
+        conceptos=descripcion,
+        precio_unitario=matrices['precio_unitario'],
+        cantidad=matrices['cantidad'],
+        subtotal=matrices['subtotal'],
+        partidas=partidas,
+        subtotal_partida=por_partida.reindex(partidas['partida']).to_numpy().reshape(len(partidas), forma[1]),
+        total_version=np.nansum(matrices['subtotal'], axis=0),
+    )
+
+
+def obtener_matriz_catalogo(contrato_id):
+    """Matriz memoizada en `cache_matrices` mientras el catálogo del contrato no cambie."""
+    marca = marca_catalogo_base(contrato_id)
+    matriz = cache_matrices.obtener(contrato_id, marca)
+    if matriz is None:
+        matriz = calcular_matriz_catalogo(contrato_id)
+        cache_matrices.guardar(contrato_id, marca, matriz)
+    return matriz
+
+
+def matriz_a_csv(matriz):
+    """
+    CSV ancho con una fila por clave y, por cada versión, sus columnas de precio unitario,
+    cantidad y subtotal. Al final van los subtotales por partida y el total por versión.
+    """
+    encabezados = [f"{v['nombre']} (#{v['id']}) {campo}" for v in matriz.versiones for campo in CAMPOS_MATRIZ]
+    # Intercalar PU, cantidad y subtotal de cada versión
+    valores = np.stack([matriz.precio_unitario, matriz.cantidad, matriz.subtotal], axis=2) \
+        .reshape(len(matriz.conceptos), -1)
+    tabla = pd.concat([matriz.conceptos, pd.DataFrame(valores, columns=encabezados)], axis=1)
+
+    resumen = np.full((len(matriz.partidas) + 1, len(encabezados)), np.nan)
+    resumen[:-1, 2::3] = matriz.subtotal_partida
+    resumen[-1, 2::3] = matriz.total_version
+    resumen = pd.concat([
+        pd.DataFrame({
+            'clave': [f"Subtotal partida {p}" for p in matriz.partidas['partida']] + ['Total'],
+            'partida': list(matriz.partidas['partida']) + [None],
+            'nombre_partida': list(matriz.partidas['nombre_partida']) + [None],
+        }),
+        pd.DataFrame(resumen, columns=encabezados)
+    ], axis=1)
+
+    return pd.concat([tabla, resumen], ignore_index=True).to_csv(index=False)
+
+
+def pagina_matriz(matriz, campo='subtotal', partida=None, pagina=1, tamano_pagina=TAMANO_PAGINA):
+    """
+    Una página de renglones de la matriz para la plantilla, opcionalmente solo de una partida.
+    Cada renglón es {'concepto': dict, 'valores': [valor o None por versión]}.
+    Devuelve (renglones, página ajustada, total de páginas, total de renglones).
+    """
+    valores = getattr(matriz, campo if campo in CAMPOS_MATRIZ else 'subtotal')
+    indices = np.arange(len(matriz.conceptos))
+    if partida is not None:
+        indices = indices[(matriz.conceptos['partida'].fillna('') == partida).to_numpy()]
+
+    total = len(indices)
+    paginas = max(1, math.ceil(total / tamano_pagina))
+    pagina = min(max(1, pagina), paginas)
+    indices = indices[(pagina - 1) * tamano_pagina:pagina * tamano_pagina]
+
+    conceptos = matriz.conceptos.iloc[indices]
+    conceptos = conceptos.astype(object).where(conceptos.notna(), None).to_dict('records')
+    bloque = valores[indices].astype(object)
+    bloque[np.isnan(valores[indices])] = None
+    renglones = [{'concepto': c, 'valores': list(v)} for c, v in zip(conceptos, bloque)]
+    return renglones, pagina, paginas, total
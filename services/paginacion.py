@@ -0,0 +1,64 @@
+from models import db
+from sqlalchemy import select, func, or_
+from typing import NamedTuple, Optional
+
+TAMANO_PAGINA = 100
+
+
+class PaginaKeyset(NamedTuple):
+    """
+    Una página de una consulta paginada por llave (keyset). `primero` y `ultimo` son la llave de
+    la primera y la última fila; la página anterior se pide con antes=primero y la siguiente con
+    despues=ultimo.
+    """
+    filas: list
+    total: int
+    primero: Optional[int]
+    ultimo: Optional[int]
+    hay_anterior: bool
+    hay_siguiente: bool
+
+
+def filtro_texto(texto, *columnas):
+    """Condición "alguna de las columnas contiene el texto" (sin distinguir mayúsculas), o None si no hay texto."""
+    texto = (texto or '').strip()
+    if not texto:
+        return None
+    for especial in ('\\', '%', '_'):
+        texto = texto.replace(especial, '\\' + especial)
+    patron = f'%{texto}%'
+    return or_(*(columna.ilike(patron, escape='\\') for columna in columnas))
+
+
+def paginar_keyset(consulta, llave, despues=None, antes=None, tamano=TAMANO_PAGINA):
+    """
+    Pagina `consulta` (un select ya filtrado) ordenando por la columna `llave`, que debe ser
+    única (normalmente el id). En vez de OFFSET se filtra `llave > despues` (o `< antes`), así
+    cada página cuesta lo mismo sin importar qué tan adelante esté y usa el índice de la llave.
+    El total de filas se cuenta con la misma consulta en SQL.
+    """
+    total = db.session.execute(select(func.count()).select_from(consulta.order_by(None).subquery())).scalar()
+
+    if antes is not None:
+        # Página anterior: las `tamano` filas previas en orden inverso, y luego se voltean
+        filas = db.session.execute(consulta.where(llave < antes).order_by(llave.desc()).limit(tamano + 1)).all()
+        hay_anterior = len(filas) > tamano
+        filas = filas[:tamano][::-1]
+        hay_siguiente = True
+    else:
+        if despues is not None:
+            consulta = consulta.where(llave > despues)
+        filas = db.session.execute(consulta.order_by(llave.asc()).limit(tamano + 1)).all()
+        hay_siguiente = len(filas) > tamano
+        filas = filas[:tamano]
+        hay_anterior = despues is not None
+
+    clave = llave.key
+    return PaginaKeyset(
+        filas=filas,
+        total=total,
+        primero=getattr(filas[0], clave) if filas else None,
+        ultimo=getattr(filas[-1], clave) if filas else None,
+        hay_anterior=hay_anterior and bool(filas),
+        hay_siguiente=hay_siguiente and bool(filas),
+    )
@@ -1,88 +1,220 @@
 from datetime import date
 from models import db, Contrato, Prefiniquito, DetallePrefiniquito, ConceptoCatalogo, CatalogoVersion
-from sqlalchemy.orm import joinedload
-
-def generar_prefiniquito(contrato_id, version_original_id, version_actualizada_id):
-    contrato = Contrato.query.get(contrato_id)
-    if not contrato:
-        raise ValueError("Contrato no encontrado")
-
-    original = CatalogoVersion.query.options(joinedload(CatalogoVersion.conceptos)).get(version_original_id)
-    actualizada = CatalogoVersion.query.options(joinedload(CatalogoVersion.conceptos)).get(version_actualizada_id)
+from services.catalogo_base import conceptos_de_version, marca_catalogo_base, obtener_version_original
+from services.cache import CacheLRU, hay_escrituras_pendientes
+from services.paginacion import filtro_texto
+from sqlalchemy import insert, select, func
+from typing import NamedTuple
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Comparaciones entre versiones calculadas bajo demanda, por (versión A, versión B)
+cache_comparaciones = CacheLRU('comparacion_versiones', tamano_maximo=32, clave_config='PREFINIQUITO_CACHE_TAMANO')
+
+# Columnas de cada versión que se cruzan por clave
+_COLUMNAS_VERSION = [
+    'id', 'clave_concepto', 'partida', 'nombre_partida', 'descripcion', 'unidad',
+    'precio_unitario', 'cantidad', 'subtotal'
+]
+_COLUMNAS_NUMERICAS = ['precio_unitario', 'cantidad', 'subtotal']
+_COLUMNAS_DESCRIPTIVAS = ['partida', 'nombre_partida', 'descripcion', 'unidad']
+
+
+def _tabla_version(version):
+    """Conceptos de la versión como DataFrame, uno por clave (si se repite, cuenta el último)."""
+    # Versiones completas aunque se hayan guardado solo con los cambios
+    conceptos = pd.DataFrame(
+        [tuple(getattr(c, columna) for columna in _COLUMNAS_VERSION)
+         for c in conceptos_de_version(version, columnas=_COLUMNAS_VERSION)],
+        columns=_COLUMNAS_VERSION
+    )
+    return conceptos.drop_duplicates('clave_concepto', keep='last')
+
+
+def comparar_versiones(conceptos_original, conceptos_actualizados):
+    """
+    Cruza las dos versiones por clave en un solo merge (outer) y calcula los renglones del
+    prefiniquito ordenados por clave. Un concepto que falta en una versión cuenta con precio,
+    cantidad y subtotal 0; la descripción, partida y unidad se toman de la versión actualizada
+    y, si no está ahí, de la original.
+
+    tipo_cambio: 'nuevo' si solo está en la actualizada, 'modificado' si cambió el precio o la
+    cantidad, 'sin cambio' en cualquier otro caso (incluidas las claves que ya no vienen).
+    """
+    cruce = conceptos_original.merge(conceptos_actualizados, on='clave_concepto', how='outer',
+                                     suffixes=('_original', '_actualizado'), indicator=True) \
+        .sort_values('clave_concepto', kind='stable', ignore_index=True)
+
+    en_original = cruce['_merge'] != 'right_only'
+    en_actualizada = cruce['_merge'] != 'left_only'
+
+    detalles = pd.DataFrame({'clave_concepto': cruce['clave_concepto']})
+    detalles['concepto_id'] = cruce['id_actualizado'].where(en_actualizada, cruce['id_original']).astype('Int64')
+    for columna in _COLUMNAS_DESCRIPTIVAS:
+        detalles[columna] = cruce[f'{columna}_actualizado'].where(en_actualizada, cruce[f'{columna}_original'])
+
+    for columna in _COLUMNAS_NUMERICAS:
+        cruce[f'{columna}_original'] = cruce[f'{columna}_original'].astype(float).fillna(0)
+        cruce[f'{columna}_actualizado'] = cruce[f'{columna}_actualizado'].astype(float).fillna(0)
+
+    detalles['precio_unitario_original'] = cruce['precio_unitario_original']
+    detalles['cantidad_original'] = cruce['cantidad_original']
+    detalles['subtotal_original'] = cruce['subtotal_original']
+    detalles['precio_unitario_actualizado'] = cruce['precio_unitario_actualizado']
+    detalles['cantidad_actualizada'] = cruce['cantidad_actualizado']
+    detalles['subtotal_actualizado'] = cruce['subtotal_actualizado']
+    detalles['diferencia_cantidad'] = detalles['cantidad_actualizada'] - detalles['cantidad_original']
+    detalles['diferencia_subtotal'] = detalles['subtotal_actualizado'] - detalles['subtotal_original']
+
+    cambio = (detalles['precio_unitario_original'] != detalles['precio_unitario_actualizado']) | \
+             (detalles['cantidad_original'] != detalles['cantidad_actualizada'])
+    detalles['tipo_cambio'] = 'sin cambio'
+    detalles.loc[en_original & en_actualizada & cambio, 'tipo_cambio'] = 'modificado'
+    detalles.loc[~en_original, 'tipo_cambio'] = 'nuevo'
+    return detalles
+
+
+class ComparacionCatalogo(NamedTuple):
+    """
+    Prefiniquito calculado entre dos versiones, sin guardar. Tiene los mismos totales que
+    Prefiniquito y sus `detalles` los mismos campos que DetallePrefiniquito, así que las vistas
+    lo pueden usar igual. Se comparte desde `cache_comparaciones`: no se debe modificar.
+    """
+    contrato_id: int
+    version_original_id: int
+    version_actualizada_id: int
+    total_original: float
+    total_actualizado: float
+    diferencia_total: float
+    detalles: tuple
+
+
+def _calcular_comparacion(version_original, version_actualizada):
+    detalles = comparar_versiones(_tabla_version(version_original), _tabla_version(version_actualizada))
+    detalles = detalles.astype(object).where(detalles.notna(), None)
+
+    total_original = float(sum(detalles['subtotal_original']))
+    total_actualizado = float(sum(detalles['subtotal_actualizado']))
+    return ComparacionCatalogo(
+        contrato_id=version_actualizada.contrato_id,
+        version_original_id=version_original.id,
+        version_actualizada_id=version_actualizada.id,
+        total_original=total_original,
+        total_actualizado=total_actualizado,
+        diferencia_total=total_actualizado - total_original,
+        detalles=tuple(detalles.itertuples(index=False, name='DetalleComparacion')),
+    )
 
-    conceptos_original = {c.clave_concepto: c for c in original.conceptos}
-    conceptos_actualizados = {c.clave_concepto: c for c in actualizada.conceptos}
 
+def comparar_versiones_catalogo(version_original, version_actualizada):
+    """
+    Compara dos versiones cualesquiera del mismo contrato (p. ej. R3 contra R5) bajo demanda.
+    El resultado se guarda en `cache_comparaciones` por (versión A, versión B) y vence con la
+    marca del catálogo base del contrato; nada se escribe en la base de datos (ver
+    congelar_comparacion).
+    """
+    if version_original.contrato_id != version_actualizada.contrato_id:
+        raise ValueError("Las versiones a comparar deben ser del mismo contrato")
+
+    clave = (version_original.id, version_actualizada.id)
+    if hay_escrituras_pendientes(db.session):
+        return _calcular_comparacion(version_original, version_actualizada)
+
+    marca = marca_catalogo_base(version_actualizada.contrato_id)
+    comparacion = cache_comparaciones.obtener(clave, marca)
+    if comparacion is None:
+        comparacion = _calcular_comparacion(version_original, version_actualizada)
+        cache_comparaciones.guardar(clave, marca, comparacion)
+    return comparacion
+
+
+def obtener_comparacion_vigente(contrato_id):
+    """Catálogo original contra la última versión del contrato (None si todavía no hay actualizado)."""
+    original = obtener_version_original(contrato_id)
+    ultima = CatalogoVersion.query.filter_by(contrato_id=contrato_id) \
+        .filter(CatalogoVersion.importando.isnot(True)).order_by(CatalogoVersion.id.desc()).first()
+    if not original or not ultima or ultima.id == original.id:
+        return None
+    return comparar_versiones_catalogo(original, ultima)
+
+
+def congelar_comparacion(comparacion):
+    """
+    Guarda la comparación como Prefiniquito con todos sus renglones (una sola inserción en
+    bloque) y hace commit. Devuelve el id del prefiniquito.
+    """
     nuevo = Prefiniquito(
-        contrato_id=contrato_id,
-        version_original_id=version_original_id,
-        version_actualizada_id=version_actualizada_id,
+        contrato_id=comparacion.contrato_id,
+        version_original_id=comparacion.version_original_id,
+        version_actualizada_id=comparacion.version_actualizada_id,
         fecha_generacion=date.today(),
-        total_original=0,
-        total_actualizado=0,
-        diferencia_total=0
+        total_original=comparacion.total_original,
+        total_actualizado=comparacion.total_actualizado,
+        diferencia_total=comparacion.diferencia_total
     )
     db.session.add(nuevo)
     db.session.flush()
 
-    total_original = 0
-    total_actualizado = 0
-
-    claves_combinadas = set(conceptos_original.keys()) | set(conceptos_actualizados.keys())
-
-    for clave in sorted(claves_combinadas):
-        print(f"🛠 Procesando concepto: {clave}")  # 👈 Línea añadida para depuración
-
-        orig = conceptos_original.get(clave)
-        act = conceptos_actualizados.get(clave)
-
-        precio_unitario_original = orig.precio_unitario if orig else 0
-        cantidad_original = orig.cantidad if orig else 0
-        subtotal_original = orig.subtotal if orig else 0
-
-        precio_unitario_actualizado = act.precio_unitario if act else 0
-        cantidad_actualizada = act.cantidad if act else 0
-        subtotal_actualizado = act.subtotal if act else 0
-
-        total_original += subtotal_original
-        total_actualizado += subtotal_actualizado
-
-        diferencia_cantidad = cantidad_actualizada - cantidad_original
-        diferencia_subtotal = subtotal_actualizado - subtotal_original
-
-        if orig and act:
-            tipo_cambio = 'modificado' if (
-                precio_unitario_original != precio_unitario_actualizado or
-                cantidad_original != cantidad_actualizada
-            ) else 'sin cambio'
-        elif act and not orig:
-            tipo_cambio = 'nuevo'
-        else:
-            tipo_cambio = 'sin cambio'
-
-        detalle = DetallePrefiniquito(
-            prefiniquito_id=nuevo.id,
-            concepto_id=act.id if act else (orig.id if orig else None),
-            partida=act.partida if act else (orig.partida if orig else ''),
-            nombre_partida=act.nombre_partida if act else (orig.nombre_partida if orig else ''),
-            clave_concepto=clave,
-            descripcion=act.descripcion if act else (orig.descripcion if orig else ''),
-            unidad=act.unidad if act else (orig.unidad if orig else ''),
-            precio_unitario_original=precio_unitario_original,
-            cantidad_original=cantidad_original,
-            subtotal_original=subtotal_original,
-            precio_unitario_actualizado=precio_unitario_actualizado,
-            cantidad_actualizada=cantidad_actualizada,
-            subtotal_actualizado=subtotal_actualizado,
-            diferencia_cantidad=diferencia_cantidad,
-            diferencia_subtotal=diferencia_subtotal,
-            tipo_cambio=tipo_cambio
-        )
-        db.session.add(detalle)
-
-    nuevo.total_original = total_original
-    nuevo.total_actualizado = total_actualizado
-    nuevo.diferencia_total = total_actualizado - total_original
+    registros = [dict(d._asdict(), prefiniquito_id=nuevo.id) for d in comparacion.detalles]
+    if registros:
+        db.session.execute(insert(DetallePrefiniquito), registros)
+
+    logger.debug("Prefiniquito %s del contrato %s: %d conceptos", nuevo.id, comparacion.contrato_id, len(registros))
 
     db.session.commit()
-    return nuevo.id
\ No newline at end of file
+    return nuevo.id
+
+
+def generar_prefiniquito(contrato_id, version_original_id, version_actualizada_id):
+    contrato = Contrato.query.get(contrato_id)
+    if not contrato:
+        raise ValueError("Contrato no encontrado")
+
+    original = CatalogoVersion.query.get(version_original_id)
+    actualizada = CatalogoVersion.query.get(version_actualizada_id)
+    return congelar_comparacion(comparar_versiones_catalogo(original, actualizada))
+
+
+# ============================================
+# Consulta paginada de prefiniquitos congelados
+# ============================================
+TIPOS_CAMBIO = ('modificado', 'nuevo', 'sin cambio')
+
+_COLUMNAS_DETALLE = [
+    'id', 'partida', 'nombre_partida', 'clave_concepto', 'descripcion', 'unidad',
+    'precio_unitario_original', 'cantidad_original', 'subtotal_original',
+    'precio_unitario_actualizado', 'cantidad_actualizada', 'subtotal_actualizado',
+    'diferencia_cantidad', 'diferencia_subtotal', 'tipo_cambio'
+]
+
+
+def consulta_detalles_prefiniquito(prefiniquito_id, partida=None, tipo_cambio=None, texto=None):
+    """Select (sin ejecutar ni ordenar) de los renglones del prefiniquito, con los filtros dados."""
+    consulta = select(*(getattr(DetallePrefiniquito, columna) for columna in _COLUMNAS_DETALLE)) \
+        .where(DetallePrefiniquito.prefiniquito_id == prefiniquito_id)
+    if partida is not None:
+        consulta = consulta.where(DetallePrefiniquito.partida == partida)
+    if tipo_cambio in TIPOS_CAMBIO:
+        consulta = consulta.where(DetallePrefiniquito.tipo_cambio == tipo_cambio)
+    condicion = filtro_texto(texto, DetallePrefiniquito.clave_concepto, DetallePrefiniquito.descripcion)
+    if condicion is not None:
+        consulta = consulta.where(condicion)
+    return consulta
+
+
+def totales_partida_prefiniquito(prefiniquito_id):
+    """Renglones y subtotales original, actualizado y diferencia por partida, agregados en SQL."""
+    return db.session.execute(
+        select(
+            DetallePrefiniquito.partida,
+            func.max(DetallePrefiniquito.nombre_partida).label('nombre_partida'),
+            func.count().label('conceptos'),
+            func.coalesce(func.sum(DetallePrefiniquito.subtotal_original), 0.0).label('subtotal_original'),
+            func.coalesce(func.sum(DetallePrefiniquito.subtotal_actualizado), 0.0).label('subtotal_actualizado'),
+            func.coalesce(func.sum(DetallePrefiniquito.diferencia_subtotal), 0.0).label('diferencia_subtotal'),
+        ).where(DetallePrefiniquito.prefiniquito_id == prefiniquito_id)
+        .group_by(DetallePrefiniquito.partida)
+        .order_by(DetallePrefiniquito.partida)
+    ).all()
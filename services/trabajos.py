@@ -0,0 +1,158 @@
+from models import db, TrabajoSegundoPlano
+from flask import current_app
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# tipo de trabajo -> función que lo ejecuta (ver @tarea)
+_TAREAS = {}
+# tipo de trabajo -> función que deshace lo que dejó a medias un trabajo interrumpido
+_LIMPIEZAS = {}
+
+ESTADOS_ACTIVOS = ('pendiente', 'en_proceso')
+
+_ejecutor = None
+_lock_ejecutor = threading.Lock()
+
+
+def tarea(tipo, al_interrumpir=None):
+    """
+    Registra la función que ejecuta los trabajos de `tipo`. La función recibe un AvanceTrabajo
+    seguido de los parámetros con los que se encoló y puede devolver un mensaje de resultado.
+    `al_interrumpir` recibe esos mismos parámetros (sin el AvanceTrabajo) y deshace lo que haya
+    quedado a medias si el proceso terminó con el trabajo en curso (ver recuperar_trabajos_interrumpidos).
+    """
+    def registrar(funcion):
+        _TAREAS[tipo] = funcion
+        if al_interrumpir:
+            _LIMPIEZAS[tipo] = al_interrumpir
+        return funcion
+    return registrar
+
+
+class AvanceTrabajo:
+    """
+    Reporta el avance de un trabajo en su fila de `trabajo_segundo_plano`. Cada reporte hace
+    commit, así que también confirma lo que el trabajo haya escrito hasta ese momento.
+    Se puede usar directamente como callback `progreso(filas_procesadas)`.
+    """
+
+    def __init__(self, trabajo):
+        self.trabajo = trabajo
+
+    def paso(self, descripcion):
+        self.trabajo.paso = descripcion
+        db.session.commit()
+
+    def __call__(self, filas_procesadas):
+        self.trabajo.filas_procesadas = filas_procesadas
+        db.session.commit()
+
+
+def _obtener_ejecutor(app):
+    global _ejecutor
+    with _lock_ejecutor:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=app.config.get('TRABAJOS_MAX_HILOS', 2),
+                                           thread_name_prefix='trabajo')
+        return _ejecutor
+
+
+def encolar_trabajo(tipo, contrato_id=None, **parametros):
+    """
+    Registra el trabajo en la base de datos (commit incluido) y lo manda al pool de hilos; la
+    solicitud no espera a que termine. Con TRABAJOS_EN_SEGUNDO_PLANO = False se ejecuta en el
+    momento, lo que sirve para pruebas y comandos.
+    Los parámetros deben poder serializarse a JSON; `contrato_id` también se le pasa a la tarea.
+    """
+    if tipo not in _TAREAS:
+        raise ValueError(f"Tipo de trabajo desconocido: {tipo}")
+    if contrato_id is not None:
+        parametros['contrato_id'] = contrato_id
+
+    trabajo = TrabajoSegundoPlano(
+        tipo=tipo,
+        estado='pendiente',
+        contrato_id=contrato_id,
+        parametros=json.dumps(parametros),
+        filas_procesadas=0
+    )
+    db.session.add(trabajo)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    if app.config.get('TRABAJOS_EN_SEGUNDO_PLANO', True):
+        _obtener_ejecutor(app).submit(_ejecutar, app, trabajo.id)
+    else:
+        _ejecutar(app, trabajo.id)
+        db.session.refresh(trabajo)
+    return trabajo
+
+
+def _ejecutar(app, trabajo_id):
+    # Cada trabajo corre en su propio contexto de aplicación (y por lo tanto su propia sesión)
+    with app.app_context():
+        trabajo = db.session.get(TrabajoSegundoPlano, trabajo_id)
+        trabajo.estado = 'en_proceso'
+        trabajo.fecha_inicio = datetime.now()
+        db.session.commit()
+
+        try:
+            mensaje = _TAREAS[trabajo.tipo](AvanceTrabajo(trabajo), **json.loads(trabajo.parametros or '{}'))
+        except Exception as e:
+            logger.exception("Error en el trabajo %s (%s)", trabajo_id, trabajo.tipo)
+            db.session.rollback()
+            trabajo = db.session.get(TrabajoSegundoPlano, trabajo_id)
+            trabajo.estado = 'error'
+            trabajo.mensaje = str(e)
+        else:
+            trabajo.estado = 'terminado'
+            trabajo.mensaje = mensaje
+
+        trabajo.paso = None
+        trabajo.fecha_fin = datetime.now()
+        db.session.commit()
+
+
+def recuperar_trabajos_interrumpidos():
+    """
+    Marca como 'error' los trabajos que quedaron pendientes o en proceso porque el proceso que los
+    ejecutaba terminó (los hilos no sobreviven a un reinicio) y aplica la limpieza registrada para
+    su tipo. Debe llamarse al iniciar la aplicación, cuando ninguno puede seguir corriendo.
+    Confirma cada trabajo por separado. Devuelve cuántos se recuperaron.
+    """
+    trabajos = TrabajoSegundoPlano.query.filter(TrabajoSegundoPlano.estado.in_(ESTADOS_ACTIVOS)) \
+        .order_by(TrabajoSegundoPlano.id.asc()).all()
+    for trabajo in trabajos:
+        limpieza = _LIMPIEZAS.get(trabajo.tipo)
+        try:
+            if limpieza:
+                limpieza(**json.loads(trabajo.parametros or '{}'))
+        except Exception:
+            logger.exception("No se pudo limpiar el trabajo interrumpido %s (%s)", trabajo.id, trabajo.tipo)
+            db.session.rollback()
+
+        trabajo.estado = 'error'
+        trabajo.mensaje = "El trabajo se interrumpió (la aplicación se reinició); vuelve a intentarlo."
+        trabajo.paso = None
+        trabajo.fecha_fin = datetime.now()
+        db.session.commit()
+    return len(trabajos)
+
+
+def estado_trabajo(trabajo):
+    """Diccionario con el estado del trabajo, para la consulta de avance."""
+    return {
+        'id': trabajo.id,
+        'tipo': trabajo.tipo,
+        'estado': trabajo.estado,
+        'paso': trabajo.paso,
+        'filas_procesadas': trabajo.filas_procesadas or 0,
+        'mensaje': trabajo.mensaje,
+        'contrato_id': trabajo.contrato_id,
+        'terminado': trabajo.estado in ('terminado', 'error'),
+    }
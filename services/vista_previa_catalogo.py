@@ -0,0 +1,135 @@
+from services.catalogo_base import generar_catalogo_base, marca_catalogo_base, ConceptoBase
+from services.importacion_catalogo import (
+    leer_bloques, revisar_conceptos, tiene_errores, ErroresValidacion, COLUMNAS_REQUERIDAS, COLUMNAS_REPORTE
+)
+from services.cache import CacheLRU
+import math
+import pandas as pd
+
+# Vistas previas calculadas, por (contrato, hash del archivo); vencen si cambia el catálogo base
+cache_vista_previa = CacheLRU('vista_previa_catalogo', tamano_maximo=16,
+                              clave_config='CATALOGO_VISTA_PREVIA_CACHE_TAMANO')
+
+TAMANO_PAGINA = 100
+
+TIPOS_CAMBIO = ('nuevo', 'modificado', 'eliminado')
+
+# Columnas de texto que, si cambian, cuentan como "otros cambios"
+_COLUMNAS_DATOS = ('partida', 'nombre_partida', 'descripcion', 'unidad')
+
+
+def _distinto(nuevo, anterior):
+    """Compara dos columnas celda por celda tratando NaN/None como iguales entre sí."""
+    return ~((nuevo == anterior) | (nuevo.isna() & anterior.isna()))
+
+
+def _leer_archivo(filepath):
+    """
+    Todos los conceptos del archivo ya convertidos y el reporte de validación, revisados en la
+    misma pasada que la importación. Lanza ErroresValidacion si hay errores.
+    """
+    claves_vistas = set()
+    bloques = []
+    reportes = []
+    for bloque in leer_bloques(filepath):
+        conceptos, reporte = revisar_conceptos(bloque.dropna(how='all'), claves_vistas)
+        bloques.append(conceptos)
+        if not reporte.empty:
+            reportes.append(reporte)
+
+    reporte = pd.concat(reportes, ignore_index=True) if reportes else pd.DataFrame(columns=COLUMNAS_REPORTE)
+    if tiene_errores(reporte):
+        raise ErroresValidacion(reporte)
+    if not bloques:
+        bloques = [revisar_conceptos(pd.DataFrame(columns=COLUMNAS_REQUERIDAS))[0]]
+    return pd.concat(bloques, ignore_index=True), reporte
+
+
+def calcular_vista_previa(contrato_id, filepath):
+    """
+    Compara el archivo contra el catálogo base vigente sin escribir nada en la base de datos.
+    El cruce es un merge de pandas por clave (hash join), no un recorrido fila por fila.
+
+    Devuelve {'resumen': {...}, 'cambios': DataFrame, 'advertencias': DataFrame} donde `cambios`
+    solo trae las claves nuevas, modificadas o que ya no vienen en el archivo, ordenadas por
+    clave. Si una clave se repite en el archivo cuenta la última, igual que en el catálogo base.
+    Lanza ErroresValidacion si el archivo no se podría importar.
+    """
+    archivo, advertencias = _leer_archivo(filepath)
+    archivo = archivo[archivo['clave_concepto'] != ''].drop_duplicates('clave_concepto', keep='last')
+
+    base = pd.DataFrame(list(generar_catalogo_base(contrato_id)), columns=list(ConceptoBase._fields)) \
+        .rename(columns={'clave': 'clave_concepto'}) \
+        .drop(columns=['id', 'concepto', 'estatus'])
+
+    cruce = archivo.merge(base, on='clave_concepto', how='outer', suffixes=('_nuevo', '_anterior'),
+                          indicator=True, sort=True)
+
+    en_ambos = cruce['_merge'] == 'both'
+    cambio_precio = en_ambos & _distinto(cruce['precio_unitario_nuevo'], cruce['precio_unitario_anterior'])
+    cambio_cantidad = en_ambos & _distinto(cruce['cantidad_nuevo'], cruce['cantidad_anterior'])
+    cambio_datos = pd.Series(False, index=cruce.index)
+    for columna in _COLUMNAS_DATOS:
+        cambio_datos |= _distinto(cruce[f'{columna}_nuevo'], cruce[f'{columna}_anterior'])
+    cambio_datos &= en_ambos
+
+    tipo = pd.Series('sin cambio', index=cruce.index)
+    tipo[cambio_precio | cambio_cantidad | cambio_datos] = 'modificado'
+    tipo[cruce['_merge'] == 'left_only'] = 'nuevo'
+    tipo[cruce['_merge'] == 'right_only'] = 'eliminado'
+
+    cruce['tipo_cambio'] = tipo
+    cruce['cambio_precio'] = cambio_precio
+    cruce['cambio_cantidad'] = cambio_cantidad
+    cruce['cambio_datos'] = cambio_datos
+    cruce['diferencia_subtotal'] = cruce['subtotal_nuevo'].fillna(0) - cruce['subtotal_anterior'].fillna(0)
+
+    resumen = {
+        'conceptos_archivo': len(archivo),
+        'conceptos_base': len(base),
+        'nuevos': int((tipo == 'nuevo').sum()),
+        'eliminados': int((tipo == 'eliminado').sum()),
+        'modificados': int((tipo == 'modificado').sum()),
+        'cambios_precio': int(cambio_precio.sum()),
+        'cambios_cantidad': int(cambio_cantidad.sum()),
+        'otros_cambios': int((cambio_datos & ~cambio_precio & ~cambio_cantidad).sum()),
+        'sin_cambio': int((tipo == 'sin cambio').sum()),
+        'total_base': float(base['subtotal'].sum()),
+        'total_archivo': float(archivo['subtotal'].sum()),
+    }
+    resumen['diferencia_total'] = resumen['total_archivo'] - resumen['total_base']
+
+    cambios = cruce[tipo != 'sin cambio'].drop(columns=['_merge']).reset_index(drop=True)
+    resumen['advertencias'] = len(advertencias)
+    return {'resumen': resumen, 'cambios': cambios, 'advertencias': advertencias}
+
+
+def obtener_vista_previa(contrato_id, hash_archivo, filepath):
+    """Vista previa memoizada en `cache_vista_previa` mientras el catálogo base no cambie."""
+    clave = (int(contrato_id), hash_archivo)
+    marca = marca_catalogo_base(contrato_id)
+    vista = cache_vista_previa.obtener(clave, marca)
+    if vista is None:
+        vista = calcular_vista_previa(contrato_id, filepath)
+        cache_vista_previa.guardar(clave, marca, vista)
+    return vista
+
+
+def pagina_vista_previa(vista, pagina=1, tipo=None, tamano_pagina=TAMANO_PAGINA):
+    """
+    Una página de los cambios de la vista previa, opcionalmente solo de un tipo.
+    Devuelve (filas como diccionarios, página ajustada, total de páginas, total de filas).
+    """
+    cambios = vista['cambios']
+    if tipo in TIPOS_CAMBIO:
+        cambios = cambios[cambios['tipo_cambio'] == tipo]
+
+    total = len(cambios)
+    paginas = max(1, math.ceil(total / tamano_pagina))
+    pagina = min(max(1, pagina), paginas)
+    inicio = (pagina - 1) * tamano_pagina
+
+    filas = cambios.iloc[inicio:inicio + tamano_pagina]
+    # NaN -> None para que la plantilla los muestre vacíos
+    filas = filas.astype(object).where(filas.notna(), None).to_dict('records')
+    return filas, pagina, paginas, total
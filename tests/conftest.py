@@ -0,0 +1,94 @@
+import io
+import os
+import tempfile
+
+# La aplicación lee DATABASE_URL al importarse: las pruebas usan una base de datos temporal
+_CARPETA_BASE_DATOS = tempfile.mkdtemp(prefix='fact-pruebas-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_CARPETA_BASE_DATOS, 'pruebas.db')}"
+
+import pandas as pd
+import pytest
+
+from app import app as aplicacion
+from models import db, Empresa, Cliente, Centro, Contrato, CatalogoVersion, ConceptoCatalogo
+from services.catalogo_base import aplicar_version_catalogo_base, cache_catalogo_base
+from services.matriz_catalogo import cache_matrices
+from services.prefiniquitos import cache_comparaciones
+from services.vista_previa_catalogo import cache_vista_previa
+
+COLUMNAS_ARCHIVO_CATALOGO = [
+    'numero partida', 'nombre partida', 'clave concepto', 'descripcion concepto',
+    'unidad', 'precio unitario', 'cantidad', 'subtotal'
+]
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Aplicación con la base de datos vacía, trabajos en la misma solicitud y uploads/ en tmp_path."""
+    aplicacion.config.update(TESTING=True, TRABAJOS_EN_SEGUNDO_PLANO=False, CATALOGO_BASE_CHECKPOINT_CADA=10,
+                             CATALOGO_IMPORTACION_BLOQUE=2000)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('uploads')
+
+    # Los ids se repiten entre pruebas, así que las cachés del proceso no deben sobrevivir
+    for cache in (cache_catalogo_base, cache_matrices, cache_comparaciones, cache_vista_previa):
+        cache.limpiar()
+
+    with aplicacion.app_context():
+        db.drop_all()
+        db.create_all()
+        yield aplicacion
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def contrato(app):
+    """Contrato vacío (sin catálogos) con su cliente, centro y empresa."""
+    db.session.add_all([Empresa(nombre='Terminus'), Cliente(nombre='Cliente', razon_social='Cliente', rfc='XAXX010101000'),
+                        Centro(centro='Centro', codigo_centro='001')])
+    db.session.flush()
+    nuevo = Contrato(nombre='Contrato de prueba', contrato='CT-001', cliente_id=1, centro_id=1, empresa_id=1)
+    db.session.add(nuevo)
+    db.session.commit()
+    return nuevo
+
+
+def crear_version(contrato_id, conceptos, tipo='actualizado', modo='completo', aplicar=True):
+    """
+    Crea una versión del catálogo con `conceptos` (dicts con clave y, opcionalmente, cantidad,
+    precio_unitario, estatus, partida o eliminado) y la aplica al catálogo base. Hace commit.
+    """
+    version = CatalogoVersion(contrato_id=contrato_id, tipo=tipo, nombre=f'Catálogo {tipo}', modo_almacenamiento=modo)
+    db.session.add(version)
+    db.session.flush()
+    for c in conceptos:
+        cantidad = c.get('cantidad', 1.0)
+        precio_unitario = c.get('precio_unitario', 10.0)
+        db.session.add(ConceptoCatalogo(
+            version_id=version.id, clave_concepto=c['clave'], partida=c.get('partida', '1'),
+            nombre_partida=c.get('nombre_partida', 'Partida 1'), descripcion=c.get('descripcion', c['clave']),
+            unidad='m2', precio_unitario=precio_unitario, cantidad=cantidad,
+            subtotal=(cantidad or 0) * precio_unitario, estatus=c.get('estatus', 'E'), eliminado=c.get('eliminado', False)
+        ))
+    db.session.flush()
+    if aplicar:
+        aplicar_version_catalogo_base(contrato_id, version.id)
+    db.session.commit()
+    return version
+
+
+def archivo_catalogo(filas, extension='xlsx'):
+    """Archivo de catálogo en memoria (filas con las columnas de COLUMNAS_ARCHIVO_CATALOGO)."""
+    df = pd.DataFrame(filas, columns=COLUMNAS_ARCHIVO_CATALOGO)
+    contenido = io.BytesIO()
+    if extension == 'csv':
+        contenido.write(df.to_csv(index=False).encode('utf-8'))
+    else:
+        df.to_excel(contenido, index=False)
+    contenido.seek(0)
+    return contenido, f'catalogo.{extension}'
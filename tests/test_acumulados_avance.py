@@ -0,0 +1,113 @@
+from datetime import date
+
+import pytest
+
+from conftest import crear_version
+from models import db, AvanceObra, AcumuladoAvance, DetalleAvance
+from services.avances import calcular_panel_avances, leer_acumulados, registrar_avances, reconstruir_acumulados_avance
+from services.catalogo_base import generar_catalogo_base
+
+
+def acumulados_completos(contrato_id):
+    """{concepto_id: (cantidad, subtotal)} de la tabla de acumulados."""
+    return {a.concepto_id: (a.cantidad_acumulada, a.subtotal_acumulado)
+            for a in AcumuladoAvance.query.filter_by(contrato_id=contrato_id)}
+
+
+def acumulados_desde_detalles(contrato_id):
+    """Lo mismo calculado desde cero con los detalles de avance que existen."""
+    sumas = {}
+    for d in DetalleAvance.query.join(AvanceObra).filter(AvanceObra.contrato_id == contrato_id):
+        cantidad, subtotal = sumas.get(d.concepto_id, (0.0, 0.0))
+        sumas[d.concepto_id] = (cantidad + d.cantidad_avance, subtotal + d.subtotal_avance)
+    return sumas
+
+
+def sin_ceros(acumulados):
+    return {i: valores for i, valores in acumulados.items() if valores != pytest.approx((0.0, 0.0))}
+
+
+@pytest.fixture
+def conceptos(contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 100.0, 'precio_unitario': 2.0},
+                                {'clave': 'C2', 'cantidad': 100.0, 'precio_unitario': 3.0},
+                                {'clave': 'C3', 'cantidad': 100.0, 'precio_unitario': 5.0}], tipo='original')
+    return generar_catalogo_base(contrato.id).por_clave
+
+
+def test_registrar_suma_al_acumulado(contrato, conceptos):
+    c1, c2 = conceptos['C1'].id, conceptos['C2'].id
+    registrar_avances(contrato.id, {date(2025, 1, 1): {c1: 2.0, c2: 1.0}, date(2025, 1, 2): {c1: 3.0}})
+    db.session.commit()
+    registrar_avances(contrato.id, {date(2025, 1, 3): {c1: 1.5, c2: 0.0}})
+    db.session.commit()
+
+    assert acumulados_completos(contrato.id) == {c1: (6.5, 13.0), c2: (1.0, 3.0)}
+    assert leer_acumulados(contrato.id, [c1, c2, conceptos['C3'].id]) == {c1: 6.5, c2: 1.0, conceptos['C3'].id: 0.0}
+    assert acumulados_completos(contrato.id) == acumulados_desde_detalles(contrato.id)
+
+
+def test_eliminar_avance_descuenta_del_acumulado(client, contrato, conceptos):
+    c1, c2, c3 = (conceptos[k].id for k in ('C1', 'C2', 'C3'))
+    _, segundo = registrar_avances(contrato.id, {date(2025, 1, 1): {c1: 2.0, c2: 4.0},
+                                                date(2025, 1, 2): {c1: 3.0, c3: 1.0}})
+    db.session.commit()
+    segundo_id = segundo.id
+
+    client.post(f'/avances/eliminar_avance/{segundo_id}')
+    db.session.expire_all()
+
+    assert db.session.get(AvanceObra, segundo_id) is None
+    assert sin_ceros(acumulados_completos(contrato.id)) == {c1: (2.0, 4.0), c2: (4.0, 12.0)}
+    assert sin_ceros(acumulados_completos(contrato.id)) == acumulados_desde_detalles(contrato.id)
+
+    # Reconstruir desde los detalles da el mismo libro
+    assert reconstruir_acumulados_avance(contrato.id) == 2
+    db.session.commit()
+    assert acumulados_completos(contrato.id) == {c1: (2.0, 4.0), c2: (4.0, 12.0)}
+
+
+def test_guardar_desde_el_formulario_y_concepto_ajeno(client, contrato, conceptos):
+    c1 = conceptos['C1'].id
+    respuesta = client.post(f'/avances/guardar/{contrato.id}', data={
+        'fecha': '2025-02-01', 'concepto_id[]': [str(c1)], f'cantidad_{c1}': '4'})
+    assert respuesta.status_code == 200
+    db.session.expire_all()
+    assert acumulados_completos(contrato.id) == {c1: (4.0, 8.0)}
+
+    # Un concepto fuera del catálogo base no registra nada (ni toca el acumulado)
+    with pytest.raises(ValueError):
+        registrar_avances(contrato.id, {date(2025, 2, 2): {c1: 1.0, 999: 1.0}})
+    db.session.rollback()
+    assert acumulados_completos(contrato.id) == {c1: (4.0, 8.0)}
+    assert AvanceObra.query.count() == 1
+
+
+def test_leer_acumulados_de_muchos_conceptos(contrato, conceptos):
+    c1, c3 = conceptos['C1'].id, conceptos['C3'].id
+    registrar_avances(contrato.id, {date(2025, 3, 1): {c1: 2.0, c3: 1.0}})
+    db.session.commit()
+
+    # Más ids que parámetros admite una consulta: se filtran en SQL por bloques
+    ids = list(range(10_000, 12_000)) + [c3, c1, c1]
+    acumulados = leer_acumulados(contrato.id, ids)
+    assert len(acumulados) == 2002
+    assert (acumulados[c1], acumulados[c3], acumulados[10_000]) == (2.0, 1.0, 0.0)
+    assert leer_acumulados(contrato.id) == {c1: 2.0, c3: 1.0}
+
+
+def test_panel_toma_el_acumulado_de_la_tabla(contrato, conceptos):
+    c1 = conceptos['C1'].id
+    registrar_avances(contrato.id, {date(2025, 3, 1): {c1: 2.0}, date(2025, 3, 2): {c1: 3.0}})
+    db.session.commit()
+    # Un acumulado que ya no cuadra con los detalles (p. ej. cargado de un sistema anterior)
+    AcumuladoAvance.query.filter_by(contrato_id=contrato.id, concepto_id=c1).one().cantidad_acumulada = 7.0
+    db.session.commit()
+
+    base = [c._asdict() for c in generar_catalogo_base(contrato.id)]
+    panel = calcular_panel_avances(contrato.id, base)
+    info = {i['concepto']['clave']: i for p in panel['partidas'].values() for i in p['conceptos']}
+    assert (info['C1']['acumulado'], info['C1']['cantidad_pendiente'], info['C1']['subtotal_avanzado']) == \
+        (7.0, 93.0, 14.0)
+    assert info['C2']['acumulado'] == 0.0
+    assert info['C1']['cantidades_por_fecha'] == {'2025-03-01': 2.0, '2025-03-02': 3.0}
@@ -0,0 +1,91 @@
+from conftest import crear_version
+from models import db, ConceptoCatalogo
+from services.cache import hay_escrituras_pendientes, invalidar_cache_solicitud
+from services.catalogo_base import (
+    generar_catalogo_base, marca_catalogo_base, recalcular_clave_catalogo_base, cache_catalogo_base
+)
+
+
+# ============================================
+# Caché por solicitud y eventos de la sesión
+# ============================================
+def test_se_memoiza_durante_la_solicitud(contrato):
+    crear_version(contrato.id, [{'clave': 'C1'}], tipo='original')
+
+    assert generar_catalogo_base(contrato.id) is generar_catalogo_base(contrato.id)
+
+
+def test_una_escritura_en_el_catalogo_invalida_la_solicitud(contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 1.0}], tipo='original')
+    antes = generar_catalogo_base(contrato.id)
+    assert not hay_escrituras_pendientes(db.session)
+
+    concepto = ConceptoCatalogo.query.filter_by(clave_concepto='C1').one()
+    concepto.cantidad = 5.0
+    recalcular_clave_catalogo_base(contrato.id, 'C1')
+    assert hay_escrituras_pendientes(db.session)
+
+    # Dentro de la transacción se ve lo pendiente, pero no se guarda en la caché compartida
+    pendiente = generar_catalogo_base(contrato.id)
+    assert pendiente is not antes and pendiente.por_clave['C1'].cantidad == 5.0
+    assert cache_catalogo_base.obtener(contrato.id, marca_catalogo_base(contrato.id)) is None
+
+    db.session.commit()
+    assert not hay_escrituras_pendientes(db.session)
+    assert generar_catalogo_base(contrato.id).por_clave['C1'].cantidad == 5.0
+
+
+def test_el_rollback_descarta_lo_leido_en_la_transaccion(contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 1.0}], tipo='original')
+
+    concepto = ConceptoCatalogo.query.filter_by(clave_concepto='C1').one()
+    concepto.cantidad = 5.0
+    recalcular_clave_catalogo_base(contrato.id, 'C1')
+    assert generar_catalogo_base(contrato.id).por_clave['C1'].cantidad == 5.0
+
+    db.session.rollback()
+    assert not hay_escrituras_pendientes(db.session)
+    assert generar_catalogo_base(contrato.id).por_clave['C1'].cantidad == 1.0
+
+
+# ============================================
+# Caché del proceso validada por la marca
+# ============================================
+def test_la_cache_del_proceso_se_reutiliza_mientras_la_marca_no_cambie(contrato):
+    crear_version(contrato.id, [{'clave': 'C1'}, {'clave': 'C2'}], tipo='original')
+
+    primero = generar_catalogo_base(contrato.id)
+    invalidar_cache_solicitud()
+    aciertos = cache_catalogo_base.aciertos
+    assert generar_catalogo_base(contrato.id) is primero
+    assert cache_catalogo_base.aciertos == aciertos + 1
+
+
+def test_la_marca_cambia_con_cada_escritura(contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 1.0}], tipo='original')
+    marcas = [marca_catalogo_base(contrato.id)]
+
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 2.0}])
+    marcas.append(marca_catalogo_base(contrato.id))
+
+    recalcular_clave_catalogo_base(contrato.id, 'C1')
+    db.session.commit()
+    marcas.append(marca_catalogo_base(contrato.id))
+
+    assert len(set(marcas)) == 3
+
+
+def test_una_version_nueva_vence_la_entrada_en_cache(contrato):
+    original = crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 1.0}], tipo='original')
+    assert generar_catalogo_base(contrato.id).por_clave['C1'].cantidad == 1.0
+
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 2.0}, {'clave': 'C2'}])
+    invalidar_cache_solicitud()
+    base = generar_catalogo_base(contrato.id)
+    assert base.por_clave['C1'].cantidad == 2.0 and 'C2' in base.por_clave
+
+    # El histórico se guarda aparte y también se reutiliza
+    anterior = generar_catalogo_base(contrato.id, as_of=original.id)
+    invalidar_cache_solicitud()
+    assert generar_catalogo_base(contrato.id, as_of=original.id) is anterior
+    assert anterior.por_clave['C1'].cantidad == 1.0 and 'C2' not in anterior.por_clave
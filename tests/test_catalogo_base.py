@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+from conftest import crear_version
+from models import db, CatalogoVersion, CatalogoBaseActual, ConceptoCatalogo
+from services.catalogo_base import (
+    generar_catalogo_base, reconstruir_catalogo_base, recalcular_clave_catalogo_base
+)
+
+
+def catalogo_base_recorriendo_versiones(contrato_id, hasta_version_id=None):
+    """La regla original, en Python: se recorren todas las versiones y gana la última fila de cada clave,
+    salvo que un extraordinario aprobado ('A') vuelva a venir en 'E' o 'R'."""
+    versiones = CatalogoVersion.query.filter_by(contrato_id=contrato_id).order_by(CatalogoVersion.id.asc()).all()
+    base = {}
+    for version in versiones:
+        if hasta_version_id is not None and version.id > hasta_version_id:
+            break
+        for c in sorted(version.conceptos, key=lambda c: c.id):
+            clave = c.clave_concepto
+            if not clave or c.eliminado:
+                continue
+            if clave in base and clave.startswith('E') and base[clave]['estatus'] == 'A' and c.estatus in ['E', 'R']:
+                continue
+            base[clave] = {
+                'id': c.id, 'partida': c.partida, 'nombre_partida': c.nombre_partida, 'clave': clave,
+                'concepto': c.concepto, 'descripcion': c.descripcion, 'unidad': c.unidad,
+                'precio_unitario': c.precio_unitario, 'cantidad': c.cantidad,
+                'subtotal': c.cantidad * c.precio_unitario, 'estatus': c.estatus,
+            }
+    return list(base.values())
+
+
+def versiones_aleatorias(contrato_id, semilla, total=6):
+    azar = random.Random(semilla)
+    claves = [f'C{i}' for i in range(25)] + ['E.1', 'E.2', 'E.3', 'E.4']
+    versiones = []
+    for n in range(total):
+        versiones.append(crear_version(contrato_id, [
+            {'clave': clave, 'cantidad': float(azar.randint(0, 9)), 'precio_unitario': float(azar.randint(1, 50)),
+             'partida': str(azar.randint(1, 3)), 'estatus': azar.choice(['E', 'R', 'A', 'R1', None])}
+            for clave in azar.sample(claves, 18)
+        ], tipo='original' if n == 0 else 'actualizado'))
+    return versiones
+
+
+@pytest.mark.parametrize('semilla', [1, 2, 3])
+def test_regla_sql_igual_a_recorrer_las_versiones(contrato, semilla):
+    versiones = versiones_aleatorias(contrato.id, semilla)
+
+    assert generar_catalogo_base(contrato.id).como_dicts() == catalogo_base_recorriendo_versiones(contrato.id)
+    for version in versiones:
+        assert generar_catalogo_base(contrato.id, as_of=version.id).como_dicts() == \
+            catalogo_base_recorriendo_versiones(contrato.id, version.id)
+
+    # La reconstrucción desde cero da lo mismo que aplicar versión por versión
+    reconstruir_catalogo_base(contrato.id)
+    db.session.commit()
+    assert generar_catalogo_base(contrato.id).como_dicts() == catalogo_base_recorriendo_versiones(contrato.id)
+
+
+def test_extraordinario_aprobado_prevalece_sobre_elaboracion_y_revision(contrato):
+    crear_version(contrato.id, [{'clave': 'E.1', 'precio_unitario': 100.0, 'estatus': 'A'},
+                                {'clave': 'C1', 'precio_unitario': 5.0, 'estatus': 'A'}], tipo='original')
+    crear_version(contrato.id, [{'clave': 'E.1', 'precio_unitario': 120.0, 'estatus': 'E'},
+                                {'clave': 'C1', 'precio_unitario': 6.0, 'estatus': 'E'}])
+    crear_version(contrato.id, [{'clave': 'E.1', 'precio_unitario': 130.0, 'estatus': 'R'}])
+
+    base = generar_catalogo_base(contrato.id).por_clave
+    assert (base['E.1'].precio_unitario, base['E.1'].estatus) == (100.0, 'A')
+    # Solo los extraordinarios conservan la versión aprobada
+    assert (base['C1'].precio_unitario, base['C1'].estatus) == (6.0, 'E')
+
+    # Una revisión con otra numeración (R1) o una nueva aprobación sí sustituyen al aprobado
+    crear_version(contrato.id, [{'clave': 'E.1', 'precio_unitario': 140.0, 'estatus': 'R1'}])
+    assert generar_catalogo_base(contrato.id).por_clave['E.1'].precio_unitario == 140.0
+    assert generar_catalogo_base(contrato.id).como_dicts() == catalogo_base_recorriendo_versiones(contrato.id)
+
+
+def test_cambio_de_estatus_recalcula_la_clave(contrato):
+    crear_version(contrato.id, [{'clave': 'E.1', 'precio_unitario': 100.0, 'estatus': 'E'}], tipo='original')
+    crear_version(contrato.id, [{'clave': 'E.1', 'precio_unitario': 120.0, 'estatus': 'E'}])
+
+    primero = ConceptoCatalogo.query.filter_by(clave_concepto='E.1').order_by(ConceptoCatalogo.id.asc()).first()
+    primero.estatus = 'A'
+    segundo = ConceptoCatalogo.query.filter_by(clave_concepto='E.1').order_by(ConceptoCatalogo.id.desc()).first()
+    segundo.estatus = 'R'
+    recalcular_clave_catalogo_base(contrato.id, 'E.1')
+    db.session.commit()
+
+    assert generar_catalogo_base(contrato.id).por_clave['E.1'].precio_unitario == 100.0
+    assert generar_catalogo_base(contrato.id).como_dicts() == catalogo_base_recorriendo_versiones(contrato.id)
+    assert db.session.query(CatalogoBaseActual).filter_by(clave='E.1').one().concepto_id == primero.id
+
+
+def test_lectura_sin_materializar_no_escribe_ni_confirma(contrato):
+    crear_version(contrato.id, [{'clave': 'C1'}, {'clave': 'C2'}], tipo='original', aplicar=False)
+    crear_version(contrato.id, [{'clave': 'C2', 'cantidad': 3.0}], aplicar=False)
+
+    # Un cambio pendiente de quien llama no debe quedar confirmado por la lectura
+    version = CatalogoVersion(contrato_id=contrato.id, tipo='actualizado', nombre='Pendiente')
+    db.session.add(version)
+
+    assert generar_catalogo_base(contrato.id).como_dicts() == catalogo_base_recorriendo_versiones(contrato.id)
+    db.session.rollback()
+
+    assert CatalogoVersion.query.filter_by(nombre='Pendiente').count() == 0
+    assert db.session.query(CatalogoBaseActual).count() == 0
@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+
+from conftest import crear_version
+from models import db, AvanceObra, CatalogoVersion, DetalleAvance
+from services.avances import registrar_avances
+from services.catalogo_base import generar_catalogo_base, conceptos_base_por_id, conceptos_base_por_clave
+
+
+def test_por_id_y_por_clave_resuelven_todo_lo_capturado(contrato):
+    v1 = crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 1.0}], tipo='original')
+    original_c1 = generar_catalogo_base(contrato.id).por_clave['C1'].id
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 2.0}, {'clave': 'C2'}])
+    nuevo_c1 = generar_catalogo_base(contrato.id).por_clave['C1'].id
+    c2 = generar_catalogo_base(contrato.id).por_clave['C2'].id
+
+    # Como estaba en v1, más lo que v1 todavía no tenía (C2 y el C1 que lo reemplazó)
+    conceptos = conceptos_base_por_id(contrato.id, [original_c1, nuevo_c1, c2], as_of=v1.id)
+    assert {i: c.cantidad for i, c in conceptos.items()} == {original_c1: 1.0, nuevo_c1: 2.0, c2: 1.0}
+    # Sin as_of, el concepto reemplazado se toma directo del catálogo
+    assert conceptos_base_por_id(contrato.id, [original_c1])[original_c1].cantidad == 1.0
+
+    por_clave = conceptos_base_por_clave(contrato.id, ['C1', 'C2', 'NO'], as_of=v1.id)
+    assert {k: c.cantidad for k, c in por_clave.items()} == {'C1': 1.0, 'C2': 1.0}
+
+
+def test_detalle_de_avance_muestra_todos_sus_conceptos(client, contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'descripcion': 'Excavación v1'}], tipo='original')
+    c1 = generar_catalogo_base(contrato.id).por_clave['C1'].id
+    # Avance con fecha anterior a la subida del catálogo (se captura en retrospectiva)
+    avance, = registrar_avances(contrato.id, {date.today() - timedelta(days=30): {c1: 1.0}})
+    db.session.commit()
+    assert avance.version_catalogo_id == CatalogoVersion.query.one().id
+
+    crear_version(contrato.id, [{'clave': 'C1', 'descripcion': 'Excavación v2'}])
+    # Un avance anterior a guardar la versión del catálogo
+    legado = AvanceObra(contrato_id=contrato.id, fecha=date(2020, 1, 1), numero_version=2)
+    db.session.add(legado)
+    db.session.flush()
+    db.session.add(DetalleAvance(avance_id=legado.id, concepto_id=c1, cantidad_avance=2.0, subtotal_avance=20.0))
+    db.session.commit()
+
+    # Se ve como estaba cuando se capturó
+    assert 'Excavación v1' in client.get(f'/avances/detalle/{avance.id}').get_data(as_text=True)
+    assert 'Excavación v1' in client.get(f'/avances/detalle/{legado.id}').get_data(as_text=True)
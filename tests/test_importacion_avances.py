@@ -0,0 +1,99 @@
+import hashlib
+import io
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from conftest import crear_version
+from models import db, AvanceObra, DetalleAvance
+from services.avances import leer_acumulados
+from services.catalogo_base import generar_catalogo_base
+from services.importacion_avances import importar_avances
+
+
+def archivo_avances(filas, columnas=('clave', 'cantidad', 'fecha'), extension='csv'):
+    df = pd.DataFrame(filas, columns=list(columnas))
+    contenido = io.BytesIO()
+    if extension == 'csv':
+        contenido.write(df.to_csv(index=False).encode('utf-8'))
+    else:
+        df.to_excel(contenido, index=False)
+    contenido.seek(0)
+    return contenido, f'avances.{extension}'
+
+
+def importar(client, contrato_id, archivo, **formulario):
+    return client.post(f'/avances/importar/{contrato_id}', data={'archivo': archivo, **formulario},
+                       content_type='multipart/form-data')
+
+
+@pytest.fixture
+def catalogo(contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 10.0, 'precio_unitario': 2.0},
+                                {'clave': 'C2', 'cantidad': 5.0, 'precio_unitario': 3.0}], tipo='original')
+    return generar_catalogo_base(contrato.id)
+
+
+@pytest.mark.parametrize('extension', ['csv', 'xlsx'])
+def test_un_avance_por_fecha_con_claves_sumadas(client, contrato, catalogo, extension):
+    archivo = archivo_avances([['C1', 2, '2025-03-01'], ['C2', 1, '01/03/2025'], ['C1', 1.5, '2025-03-01'],
+                               ['C1', 4, '2025-03-08'], ['C2', 0, '2025-03-08']], extension=extension)
+    respuesta = importar(client, contrato.id, archivo)
+    assert respuesta.status_code == 200
+    db.session.expire_all()
+
+    avances = AvanceObra.query.order_by(AvanceObra.fecha).all()
+    assert [a.fecha for a in avances] == [date(2025, 3, 1), date(2025, 3, 8)]
+    c1, c2 = catalogo.por_clave['C1'].id, catalogo.por_clave['C2'].id
+    detalles = {(d.avance_id, d.concepto_id): (d.cantidad_avance, d.subtotal_avance) for d in DetalleAvance.query}
+    assert detalles == {(avances[0].id, c1): (3.5, 7.0), (avances[0].id, c2): (1.0, 3.0),
+                        (avances[1].id, c1): (4.0, 8.0)}
+    assert leer_acumulados(contrato.id) == {c1: 7.5, c2: 1.0}
+
+
+def test_errores_se_reportan_todos_y_no_se_registra_nada(client, contrato, catalogo):
+    contenido, nombre = archivo_avances([['C1', 'dos', '2025-03-01'], ['X9', 1, '2025-03-01'],
+                                         ['C2', -1, '2025-03-01'], ['C2', 1, '31/02/2025'], ['', 1, '2025-03-01'],
+                                         ['C1', 1, '2025-03-01']])
+    hash_archivo = hashlib.sha256(contenido.getvalue()).hexdigest()
+
+    respuesta = importar(client, contrato.id, (contenido, nombre))
+    assert respuesta.status_code == 400
+    assert AvanceObra.query.count() == 0 and leer_acumulados(contrato.id) == {}
+
+    # El reporte trae todas las filas con problemas, no solo la primera
+    descarga = client.get(f'/subir_catalogo/reporte/{hash_archivo}')
+    reporte = pd.read_csv(io.BytesIO(descarga.data), encoding='utf-8-sig')
+    assert reporte[['fila', 'columna', 'nivel']].values.tolist() == [
+        [2, 'cantidad', 'error'], [3, 'clave', 'error'], [4, 'cantidad', 'error'], [5, 'fecha', 'error'],
+        [6, 'clave', 'error'],
+    ]
+
+
+def test_excedentes_se_rechazan_salvo_que_se_permitan(client, contrato, catalogo):
+    c1 = catalogo.por_clave['C1'].id
+    # Ya hay 8 de 10 acumulados en C1; el archivo trae 3 más en dos filas
+    df = pd.DataFrame({'clave': ['C1', 'C1'], 'cantidad': ['1', '2']})
+    importar_avances(contrato.id, pd.DataFrame({'clave': ['C1'], 'cantidad': ['8']}), date(2025, 3, 1))
+    db.session.commit()
+
+    avances, reporte = importar_avances(contrato.id, df, date(2025, 3, 2))
+    errores = reporte[reporte['nivel'] == 'error']
+    assert avances == [] and errores['valor'].tolist() == ['1 (pendiente 2.00)', '2 (pendiente 2.00)']
+    db.session.rollback()
+
+    avances, reporte = importar_avances(contrato.id, df, date(2025, 3, 2), permitir_excedentes=True)
+    db.session.commit()
+    assert len(avances) == 1 and set(reporte['nivel']) == {'advertencia'}
+    assert leer_acumulados(contrato.id) == {c1: 11.0}
+
+
+def test_sin_columna_fecha_se_usa_la_del_formulario(client, contrato, catalogo):
+    archivo = archivo_avances([['C1', 1], ['C2', 2]], columnas=('clave', 'cantidad'))
+    assert importar(client, contrato.id, archivo).status_code == 400  # falta la fecha
+
+    archivo = archivo_avances([['C1', 1], ['C2', 2]], columnas=('clave', 'cantidad'))
+    assert importar(client, contrato.id, archivo, fecha='2025-04-01').status_code == 200
+    db.session.expire_all()
+    assert [a.fecha for a in AvanceObra.query] == [date(2025, 4, 1)]
@@ -0,0 +1,252 @@
+import hashlib
+import io
+import json
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from conftest import archivo_catalogo, crear_version
+from models import db, AprobacionConcepto, CatalogoVersion, ConceptoCatalogo, RevisionConcepto, TrabajoSegundoPlano
+from services.avances import registrar_avances
+from services.catalogo_base import generar_catalogo_base, marca_catalogo_base
+from services.matriz_catalogo import obtener_matriz_catalogo
+from services.importacion_catalogo import (
+    importar_catalogo, leer_bloques, ErroresValidacion, buscar_reporte_validacion, buscar_version_importada
+)
+from services.trabajos import AvanceTrabajo, recuperar_trabajos_interrumpidos
+
+
+def fila(clave, precio_unitario=10.0, cantidad=1.0, partida=1):
+    return [partida, 'Partida 1', clave, f'Concepto {clave}', 'm2', precio_unitario, cantidad, None]
+
+
+def guardar_csv(tmp_path, filas):
+    contenido, _ = archivo_catalogo(filas, extension='csv')
+    ruta = tmp_path / 'catalogo.csv'
+    ruta.write_bytes(contenido.getvalue())
+    return str(ruta)
+
+
+def nueva_version(contrato_id, **campos):
+    version = CatalogoVersion(contrato_id=contrato_id, tipo='original', nombre='Catálogo Original', **campos)
+    db.session.add(version)
+    db.session.commit()
+    return version
+
+
+@pytest.mark.parametrize('extension', ['csv', 'xlsx'])
+def test_errores_de_todos_los_bloques_en_un_solo_reporte(tmp_path, contrato, extension):
+    filas = [fila('C1'), fila('C2', precio_unitario='abc'), fila('C3'), fila('C4'),
+             fila('C5'), fila('C6', cantidad='x'), fila('C1', partida=None)]
+    contenido, nombre = archivo_catalogo(filas, extension=extension)
+    ruta = tmp_path / nombre
+    ruta.write_bytes(contenido.getvalue())
+    version = nueva_version(contrato.id)
+
+    procesadas = []
+    with pytest.raises(ErroresValidacion) as error:
+        importar_catalogo(contrato.id, version.id, leer_bloques(str(ruta), tamano_bloque=2), progreso=procesadas.append)
+
+    reporte = error.value.reporte
+    # Las filas se numeran como en el archivo (la 1 son los encabezados), aunque vengan en bloques distintos
+    assert reporte[['fila', 'clave', 'columna', 'nivel']].values.tolist() == [
+        [3, 'C2', 'precio unitario', 'error'],
+        [7, 'C6', 'cantidad', 'error'],
+        [8, 'C1', 'numero partida', 'advertencia'],
+        [8, 'C1', 'clave concepto', 'advertencia'],
+    ]
+    assert procesadas == [2, 4, 6, 7]
+    # Con el primer error ya no se inserta nada más
+    assert ConceptoCatalogo.query.filter_by(version_id=version.id).count() == 0
+
+
+def test_advertencias_no_impiden_importar(tmp_path, contrato):
+    ruta = guardar_csv(tmp_path, [fila('C1'), fila('C2'), fila('C3'), fila('C1', precio_unitario=20.0)])
+    version = nueva_version(contrato.id)
+
+    total, advertencias = importar_catalogo(contrato.id, version.id, leer_bloques(ruta, tamano_bloque=3))
+
+    assert total == 4
+    assert advertencias[['fila', 'error']].values.tolist() == [[5, 'Clave repetida en el archivo (cuenta la última)']]
+    assert ConceptoCatalogo.query.filter_by(version_id=version.id).count() == 4
+
+
+def test_subida_con_errores_descarta_la_version_y_deja_el_reporte(app, client, contrato):
+    app.config['CATALOGO_IMPORTACION_BLOQUE'] = 2
+    # El error está en el último bloque: los anteriores ya se habían confirmado con el avance
+    filas = [fila('C1'), fila('C2'), fila('C3'), fila('C4'), fila('C5', cantidad='muchos')]
+    contenido, nombre = archivo_catalogo(filas)
+    hash_archivo = hashlib.sha256(contenido.getvalue()).hexdigest()
+
+    respuesta = client.post('/subir_catalogo', data={'contrato_id': str(contrato.id), 'archivo': (contenido, nombre)},
+                            content_type='multipart/form-data')
+    assert respuesta.status_code == 200
+    db.session.expire_all()
+
+    trabajo = TrabajoSegundoPlano.query.one()
+    assert trabajo.estado == 'error'
+    assert CatalogoVersion.query.count() == 0 and ConceptoCatalogo.query.count() == 0
+    assert buscar_version_importada(contrato.id, hash_archivo) is None
+
+    assert buscar_reporte_validacion(hash_archivo) is not None
+    descarga = client.get(f'/subir_catalogo/reporte/{hash_archivo}')
+    reporte = pd.read_csv(io.BytesIO(descarga.data), encoding='utf-8-sig')
+    assert reporte[['fila', 'clave', 'nivel']].values.tolist() == [[6, 'C5', 'error']]
+
+
+def test_importacion_interrumpida_no_cuenta_como_importada(client, contrato):
+    contenido, nombre = archivo_catalogo([fila('C1'), fila('E.1')])
+    hash_archivo = hashlib.sha256(contenido.getvalue()).hexdigest()
+
+    # Una importación que se quedó a medias cuando la aplicación se detuvo
+    version = nueva_version(contrato.id, hash_archivo=hash_archivo, importando=True)
+    db.session.add_all([
+        ConceptoCatalogo(version_id=version.id, clave_concepto='C1', precio_unitario=10.0, cantidad=1.0, subtotal=10.0),
+        AprobacionConcepto(contrato_id=contrato.id, clave_concepto='E.1', estado='elaboracion'),
+        TrabajoSegundoPlano(tipo='subir_catalogo', estado='en_proceso', contrato_id=contrato.id, parametros=json.dumps({
+            'contrato_id': contrato.id, 'version_id': version.id, 'filepath': 'uploads/x.xlsx',
+            'hash_archivo': hash_archivo, 'ultima_aprobacion_id': 0,
+        })),
+    ])
+    db.session.commit()
+    assert buscar_version_importada(contrato.id, hash_archivo).importando
+
+    assert recuperar_trabajos_interrumpidos() == 1
+    assert buscar_version_importada(contrato.id, hash_archivo) is None
+    assert TrabajoSegundoPlano.query.one().estado == 'error'
+    assert CatalogoVersion.query.count() == 0 and ConceptoCatalogo.query.count() == 0
+    assert AprobacionConcepto.query.count() == 0
+
+    # El mismo archivo se puede volver a subir y ahora sí queda registrado
+    client.post('/subir_catalogo', data={'contrato_id': str(contrato.id), 'archivo': (contenido, nombre)},
+                content_type='multipart/form-data')
+    db.session.expire_all()
+    importada = buscar_version_importada(contrato.id, hash_archivo)
+    assert importada is not None
+    assert ConceptoCatalogo.query.filter_by(version_id=importada.id).count() == 2
+
+
+def test_version_a_medias_no_se_ve_mientras_se_importa(app, client, contrato, monkeypatch):
+    app.config['CATALOGO_IMPORTACION_BLOQUE'] = 2
+    original = crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 1.0}], tipo='original')
+    original.fecha_subida = date(2025, 1, 1)
+    db.session.commit()
+    c1 = generar_catalogo_base(contrato.id).por_clave['C1'].id
+    marca = marca_catalogo_base(contrato.id)
+
+    # Lo que ve otra solicitud cada vez que el trabajo confirma un bloque
+    vistas = []
+    reportar = AvanceTrabajo.__call__
+
+    def reportar_y_observar(avance, filas_procesadas):
+        reportar(avance, filas_procesadas)
+        with app.app_context():
+            version_id = db.session.execute(db.select(db.func.max(CatalogoVersion.id))).scalar()
+            avance_obra, = registrar_avances(contrato.id, {date(2025, 1, filas_procesadas): {c1: 0.1}})
+            vistas.append({
+                'marca': marca_catalogo_base(contrato.id),
+                'base': {c.clave: c.cantidad for c in generar_catalogo_base(contrato.id)},
+                'matriz': [v['id'] for v in obtener_matriz_catalogo(contrato.id).versiones],
+                'version_avance': avance_obra.version_catalogo_id,
+                'conceptos': client.get(f'/catalogo_conceptos/{version_id}').status_code,
+                'historial': f'/catalogo_conceptos/{version_id}' in
+                             client.get(f'/catalogos_por_contrato/{contrato.id}').get_data(as_text=True),
+            })
+            db.session.rollback()
+
+    monkeypatch.setattr(AvanceTrabajo, '__call__', reportar_y_observar)
+    contenido, nombre = archivo_catalogo([fila('C1', cantidad=5.0), fila('C2'), fila('C3'), fila('C4')])
+    client.post('/subir_catalogo', data={'contrato_id': str(contrato.id), 'archivo': (contenido, nombre)},
+                content_type='multipart/form-data')
+    db.session.expire_all()
+
+    assert len(vistas) == 2
+    for vista in vistas:
+        assert vista == {'marca': marca, 'base': {'C1': 1.0}, 'matriz': [original.id],
+                         'version_avance': original.id, 'conceptos': 404, 'historial': False}
+    # Al terminar ya se ve completa
+    assert TrabajoSegundoPlano.query.one().estado == 'terminado'
+    assert {c.clave: c.cantidad for c in generar_catalogo_base(contrato.id)} == \
+        {'C1': 5.0, 'C2': 1.0, 'C3': 1.0, 'C4': 1.0}
+
+
+def test_falla_al_precalcular_la_comparacion_no_descarta_la_importacion(client, contrato, monkeypatch):
+    crear_version(contrato.id, [{'clave': 'C1'}], tipo='original')
+
+    def comparacion_fallida(original, actualizada):
+        raise RuntimeError('sin memoria')
+
+    monkeypatch.setattr('services.importacion_catalogo.comparar_versiones_catalogo', comparacion_fallida)
+    contenido, nombre = archivo_catalogo([fila('C1', cantidad=2.0), fila('C2')])
+    hash_archivo = hashlib.sha256(contenido.getvalue()).hexdigest()
+    client.post('/subir_catalogo', data={'contrato_id': str(contrato.id), 'archivo': (contenido, nombre)},
+                content_type='multipart/form-data')
+    db.session.expire_all()
+
+    assert TrabajoSegundoPlano.query.one().estado == 'terminado'
+    importada = buscar_version_importada(contrato.id, hash_archivo)
+    assert importada is not None and importada.tipo == 'actualizado'
+    assert {c.clave: c.cantidad for c in generar_catalogo_base(contrato.id)} == {'C1': 2.0, 'C2': 1.0}
+
+
+def test_mismo_archivo_mientras_se_importa(app, client, contrato, monkeypatch):
+    app.config['CATALOGO_IMPORTACION_BLOQUE'] = 2
+    contenido, nombre = archivo_catalogo([fila('C1'), fila('C2'), fila('C3')])
+    datos = contenido.getvalue()
+
+    def subir():
+        return client.post('/subir_catalogo', content_type='multipart/form-data',
+                           data={'contrato_id': str(contrato.id), 'archivo': (io.BytesIO(datos), nombre)})
+
+    # El mismo archivo se vuelve a subir cuando el primer bloque ya está confirmado
+    respuestas = []
+    reportar = AvanceTrabajo.__call__
+
+    def reportar_y_resubir(avance, filas_procesadas):
+        reportar(avance, filas_procesadas)
+        if not respuestas:
+            with app.app_context():
+                respuestas.append(subir().get_data(as_text=True))
+
+    monkeypatch.setattr(AvanceTrabajo, '__call__', reportar_y_resubir)
+    subir()
+    db.session.expire_all()
+
+    assert 'ya se está importando' in respuestas[0]
+    assert TrabajoSegundoPlano.query.count() == 1 and CatalogoVersion.query.count() == 1
+    assert ConceptoCatalogo.query.count() == 3
+
+    # Ya importado, se reconoce como tal
+    monkeypatch.setattr(AvanceTrabajo, '__call__', reportar)
+    assert 'ya se había importado' in subir().get_data(as_text=True)
+
+
+def test_aprobaciones_solo_para_extraordinarios_nuevos(client, contrato):
+    def subir(filas):
+        client.post('/subir_catalogo', data={'contrato_id': str(contrato.id), 'archivo': archivo_catalogo(filas)},
+                    content_type='multipart/form-data')
+        db.session.expire_all()
+
+    subir([fila('C1'), fila('E.1', precio_unitario=50.0)])
+    aprobada = AprobacionConcepto.query.filter_by(clave_concepto='E.1').one()
+    aprobada.estado = 'A'
+    db.session.add(RevisionConcepto(aprobacion_id=aprobada.id, numero_revision=2, estado='A', precio_unitario=55.0))
+    db.session.commit()
+
+    # El actualizado vuelve a traer E.1 (con otro precio) junto con dos extraordinarios nuevos
+    subir([fila('C1'), fila('E.1', precio_unitario=70.0), fila('E.2', precio_unitario=20.0),
+           fila('E.3', precio_unitario=30.0), fila('E.3', precio_unitario=31.0)])
+
+    aprobaciones = {a.clave_concepto: a for a in AprobacionConcepto.query.filter_by(contrato_id=contrato.id)}
+    assert set(aprobaciones) == {'E.1', 'E.2', 'E.3'}
+    for clave, precio in (('E.2', 20.0), ('E.3', 30.0)):  # si se repite, cuenta la primera fila
+        nueva = aprobaciones[clave]
+        assert (nueva.estado, nueva.precio_unitario) == ('elaboracion', precio)
+        assert [(r.numero_revision, r.precio_unitario) for r in nueva.revisiones] == [(1, precio)]
+
+    # La que ya existía queda igual
+    existente = aprobaciones['E.1']
+    assert (existente.id, existente.estado, existente.precio_unitario) == (aprobada.id, 'A', 50.0)
+    assert sorted((r.numero_revision, r.precio_unitario) for r in existente.revisiones) == [(1, 50.0), (2, 55.0)]
+    assert RevisionConcepto.query.count() == 4
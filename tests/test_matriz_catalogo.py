@@ -0,0 +1,56 @@
+import numpy as np
+
+from conftest import crear_version
+from services.catalogo_base import conceptos_de_version
+from services.matriz_catalogo import calcular_matriz_catalogo
+
+
+def columna_matriz(matriz, j):
+    """{clave: (precio unitario, cantidad, subtotal)} de la columna `j`, sin las claves que no están."""
+    return {
+        clave: (matriz.precio_unitario[i, j], matriz.cantidad[i, j], matriz.subtotal[i, j])
+        for i, clave in enumerate(matriz.conceptos['clave'])
+        if not np.isnan(matriz.cantidad[i, j])
+    }
+
+
+def valores_de_version(version):
+    # Si la clave se repite cuenta la última fila, igual que en la matriz
+    return {c.clave_concepto: (c.precio_unitario, c.cantidad, c.subtotal) for c in conceptos_de_version(version)}
+
+
+def test_cada_columna_es_la_version_completa(contrato):
+    versiones = [
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 1.0}, {'clave': 'B', 'cantidad': 2.0},
+                                    {'clave': 'C', 'cantidad': 3.0},
+                                    {'clave': 'E1', 'cantidad': 5.0, 'precio_unitario': 20.0, 'estatus': 'A'}],
+                      tipo='original'),
+        # Completa: ya no trae C y el extraordinario aprobado vuelve a venir en elaboración
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 4.0}, {'clave': 'B', 'cantidad': 2.0},
+                                    {'clave': 'E1', 'cantidad': 9.0, 'precio_unitario': 20.0}]),
+        # Solo cambios: A cambia, B se elimina, D es nueva
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 6.0}, {'clave': 'B', 'eliminado': True},
+                                    {'clave': 'D', 'cantidad': 7.0}], modo='cambios'),
+        # Solo cambios: elimina el extraordinario y vuelve a traer B
+        crear_version(contrato.id, [{'clave': 'E1', 'eliminado': True}, {'clave': 'B', 'cantidad': 8.0}],
+                      modo='cambios'),
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 10.0}, {'clave': 'F', 'cantidad': 1.0}]),
+        crear_version(contrato.id, [{'clave': 'F', 'cantidad': 2.0}], modo='cambios'),
+    ]
+
+    matriz = calcular_matriz_catalogo(contrato.id)
+    assert [v['id'] for v in matriz.versiones] == [v.id for v in versiones]
+    for j, version in enumerate(versiones):
+        assert columna_matriz(matriz, j) == valores_de_version(version), f'versión {j + 1}'
+
+    # La versión 'cambios' hereda del catálogo base: C aunque la versión anterior no la traía y
+    # el extraordinario aprobado en lugar de su fila posterior en elaboración
+    tercera = columna_matriz(matriz, 2)
+    assert set(tercera) == {'A', 'C', 'D', 'E1'}
+    assert (tercera['A'][1], tercera['C'][1], tercera['E1'][1]) == (6.0, 3.0, 5.0)
+    assert set(columna_matriz(matriz, 3)) == {'A', 'B', 'C', 'D'}
+    # Después de una completa, el catálogo base sigue teniendo las claves que ella ya no traía
+    assert {clave: cantidad for clave, (_, cantidad, _) in columna_matriz(matriz, 5).items()} == \
+        {'A': 10.0, 'B': 8.0, 'C': 3.0, 'D': 7.0, 'E1': 5.0, 'F': 2.0}
+    assert matriz.total_version.tolist() == [
+        sum(subtotal for _, _, subtotal in valores_de_version(v).values()) for v in versiones]
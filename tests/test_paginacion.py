@@ -0,0 +1,87 @@
+import pytest
+
+from conftest import crear_version
+from models import ConceptoCatalogo
+from services.catalogo_base import conceptos_de_version, consulta_conceptos_version, totales_partida_version
+from services.paginacion import paginar_keyset, filtro_texto
+
+COLUMNAS = ['id', 'clave_concepto', 'partida', 'subtotal']
+
+
+@pytest.fixture
+def version_cambios(contrato):
+    """v1 completa con 25 claves en dos partidas; v2 solo con cambios (modifica, elimina y agrega)."""
+    crear_version(contrato.id, [{'clave': f'A{i:02d}', 'cantidad': float(i), 'partida': '1' if i % 2 else '2'}
+                                for i in range(1, 26)], tipo='original')
+    return crear_version(contrato.id, [
+        {'clave': 'A03', 'cantidad': 30.0, 'partida': '1'},
+        {'clave': 'A10', 'cantidad': 100.0, 'partida': '2'},
+        {'clave': 'A04', 'eliminado': True},
+        {'clave': 'A17', 'eliminado': True},
+        {'clave': 'B01', 'cantidad': 2.0, 'partida': '2'},
+        {'clave': 'B02', 'cantidad': 3.0, 'partida': '3'},
+    ], modo='cambios')
+
+
+def paginas_hacia_adelante(consulta, tamano):
+    paginas, despues = [], None
+    while True:
+        pagina = paginar_keyset(consulta, ConceptoCatalogo.id, despues=despues, tamano=tamano)
+        paginas.append(pagina)
+        if not pagina.hay_siguiente:
+            return paginas
+        despues = pagina.ultimo
+
+
+def test_recorrer_las_paginas_en_ambos_sentidos(version_cambios):
+    esperados = sorted(c.id for c in conceptos_de_version(version_cambios))
+    assert len(esperados) == 25  # 25 - 2 eliminadas + 2 nuevas
+
+    consulta = consulta_conceptos_version(version_cambios, COLUMNAS)
+    paginas = paginas_hacia_adelante(consulta, tamano=7)
+
+    assert [len(p.filas) for p in paginas] == [7, 7, 7, 4]
+    assert [f.id for p in paginas for f in p.filas] == esperados
+    assert all(p.total == 25 for p in paginas)
+    assert [(p.hay_anterior, p.hay_siguiente) for p in paginas] == \
+        [(False, True), (True, True), (True, True), (True, False)]
+
+    # De regreso con `antes` se obtienen las mismas páginas
+    for pagina, anterior in zip(paginas[1:], paginas[:-1]):
+        regreso = paginar_keyset(consulta, ConceptoCatalogo.id, antes=pagina.primero, tamano=7)
+        assert regreso.filas == anterior.filas
+        assert (regreso.primero, regreso.ultimo) == (anterior.primero, anterior.ultimo)
+        assert regreso.hay_anterior == anterior.hay_anterior and regreso.hay_siguiente
+
+    # Antes de la primera fila o después de la última no hay nada
+    for vacia in (paginar_keyset(consulta, ConceptoCatalogo.id, antes=esperados[0], tamano=7),
+                  paginar_keyset(consulta, ConceptoCatalogo.id, despues=esperados[-1], tamano=7)):
+        assert (vacia.filas, vacia.primero, vacia.hay_anterior, vacia.hay_siguiente) == ([], None, False, False)
+
+
+def test_filtros_con_paginacion(version_cambios):
+    esperados = sorted(c.id for c in conceptos_de_version(version_cambios)
+                       if c.partida == '2' and 'a1' in c.clave_concepto.lower())
+
+    consulta = consulta_conceptos_version(version_cambios, COLUMNAS) \
+        .where(ConceptoCatalogo.partida == '2') \
+        .where(filtro_texto('a1', ConceptoCatalogo.clave_concepto, ConceptoCatalogo.descripcion))
+    paginas = paginas_hacia_adelante(consulta, tamano=2)
+
+    assert [f.id for p in paginas for f in p.filas] == esperados
+    assert paginas[0].total == len(esperados) == 5  # A10, A12, A14, A16, A18
+    assert len(paginas) == 3
+
+
+def test_totales_por_partida_de_toda_la_version(version_cambios):
+    esperados = {}
+    for c in conceptos_de_version(version_cambios):
+        conceptos, subtotal = esperados.get(c.partida, (0, 0.0))
+        esperados[c.partida] = (conceptos + 1, subtotal + c.subtotal)
+
+    totales = totales_partida_version(version_cambios)
+    assert {t.partida: (t.conceptos, t.subtotal) for t in totales} == esperados
+    assert [t.partida for t in totales] == ['1', '2', '3']
+    # Cuadra con la suma de todas las páginas
+    paginas = paginas_hacia_adelante(consulta_conceptos_version(version_cambios, COLUMNAS), tamano=7)
+    assert sum(t.subtotal for t in totales) == pytest.approx(sum(f.subtotal for p in paginas for f in p.filas))
@@ -0,0 +1,133 @@
+import json
+from datetime import date
+
+import pytest
+
+from conftest import crear_version
+from models import db, AvanceObra, Estimacion
+from services.avances import calcular_panel_avances, columnas_anteriores_panel, matriz_avances, registrar_avances
+from services.catalogo_base import generar_catalogo_base
+
+
+@pytest.fixture
+def conceptos(contrato):
+    crear_version(contrato.id, [{'clave': 'C1', 'cantidad': 100.0, 'precio_unitario': 2.0},
+                                {'clave': 'C2', 'cantidad': 100.0, 'precio_unitario': 3.0, 'partida': '2'}],
+                  tipo='original')
+    return generar_catalogo_base(contrato.id).por_clave
+
+
+def test_columnas_anteriores_respetan_la_ventana(app, client, contrato, conceptos):
+    app.config['AVANCES_PANEL_MAX_COLUMNAS'] = 2
+    c1 = conceptos['C1'].id
+    registrar_avances(contrato.id, {date(2025, 1, dia): {c1: float(dia)} for dia in (1, 2, 3, 4, 5, 6)})
+    db.session.commit()
+
+    # La URL de las columnas anteriores se pasa a JavaScript tal cual, sin escapar los '&'
+    pagina = client.get(f'/avances/panel/{contrato.id}?desde=2025-01-02&hasta=2025-01-05').get_data(as_text=True)
+    linea = next(linea for linea in pagina.splitlines() if 'const urlColumnas' in linea)
+    url_columnas = json.loads(linea.split('=', 1)[1].strip().rstrip(';'))
+    assert url_columnas == f'/avances/panel/{contrato.id}/columnas?agrupacion=fecha&desde=2025-01-02&hasta=2025-01-05'
+
+    respuesta = client.get(f'/avances/panel/{contrato.id}/columnas',
+                           query_string={'agrupacion': 'fecha', 'desde': '2025-01-02', 'hasta': '2025-01-05',
+                                         'antes': '2025-01-04'})
+    assert respuesta.status_code == 200
+    datos = respuesta.get_json()
+    # Antes del 4 y sin salirse de la ventana: el 1 de enero no aparece
+    assert [p['clave'] for p in datos['periodos']] == ['2025-01-02', '2025-01-03']
+    assert datos['hay_anteriores'] is False
+    assert datos['conceptos'][str(c1)]['cantidades'] == {'2025-01-02': 2.0, '2025-01-03': 3.0}
+    assert datos['totales'] == {'2025-01-02': 4.0, '2025-01-03': 6.0}
+
+    assert client.get(f'/avances/panel/{contrato.id}/columnas').status_code == 400
+
+
+def base_panel(contrato_id):
+    return [c._asdict() for c in generar_catalogo_base(contrato_id)]
+
+
+def test_matriz_concepto_por_fecha(contrato, conceptos):
+    c1, c2 = conceptos['C1'].id, conceptos['C2'].id
+    registrar_avances(contrato.id, {date(2025, 1, 2): {c1: 1.0, c2: 2.0}, date(2025, 1, 1): {c1: 3.0}})
+    registrar_avances(contrato.id, {date(2025, 1, 2): {c1: 0.5}})  # otro avance el mismo día se suma
+    db.session.add(AvanceObra(contrato_id=contrato.id, fecha=date(2025, 1, 5), numero_version=1))  # sin detalles
+    db.session.commit()
+
+    matriz = matriz_avances(contrato.id)
+    assert matriz.fechas == [date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 5)]
+    assert matriz.cantidades.loc[c1].tolist() == [3.0, 1.5, 0.0]
+    assert matriz.cantidades.loc[c2].tolist() == [0.0, 2.0, 0.0]
+
+
+@pytest.mark.parametrize('agrupacion, columnas', [
+    ('fecha', {'2025-01-06': 1.0, '2025-01-12': 2.0, '2025-01-13': 4.0, '2025-02-03': 8.0}),
+    # Lunes 6 y domingo 12 son la misma semana ISO
+    ('semana', {'2025-S02': 3.0, '2025-S03': 4.0, '2025-S06': 8.0}),
+    ('mes', {'2025-01': 7.0, '2025-02': 8.0}),
+])
+def test_agrupar_por_periodo(contrato, conceptos, agrupacion, columnas):
+    c1 = conceptos['C1'].id
+    registrar_avances(contrato.id, {date(2025, 1, 6): {c1: 1.0}, date(2025, 1, 12): {c1: 2.0},
+                                    date(2025, 1, 13): {c1: 4.0}, date(2025, 2, 3): {c1: 8.0}})
+    db.session.commit()
+
+    panel = calcular_panel_avances(contrato.id, base_panel(contrato.id), agrupacion=agrupacion)
+    assert [p.clave for p in panel['periodos']] == list(columnas)
+    concepto, = panel['partidas']['1']['conceptos']
+    assert concepto['cantidades_por_fecha'] == columnas
+    assert concepto['acumulado'] == 15.0
+    assert panel['totales_por_fecha'] == {clave: cantidad * 2.0 for clave, cantidad in columnas.items()}
+
+
+def test_agrupar_por_estimacion_y_fechas_fuera_de_periodo(contrato, conceptos):
+    c1, c2 = conceptos['C1'].id, conceptos['C2'].id
+    db.session.add_all([
+        Estimacion(contrato_id=contrato.id, numero_estimacion=2,
+                   fecha_inicio_trab_est=date(2025, 1, 16), fecha_fin_trab_est=date(2025, 1, 31)),
+        Estimacion(contrato_id=contrato.id, numero_estimacion=1,
+                   fecha_inicio_trab_est=date(2025, 1, 1), fecha_fin_trab_est=date(2025, 1, 15)),
+        Estimacion(contrato_id=contrato.id, numero_estimacion=3),  # sin periodo: no cuenta
+    ])
+    registrar_avances(contrato.id, {date(2025, 1, 3): {c1: 1.0}, date(2025, 1, 15): {c1: 2.0, c2: 1.0},
+                                    date(2025, 1, 20): {c1: 4.0}, date(2025, 2, 10): {c2: 5.0}})
+    db.session.commit()
+    primera, segunda = Estimacion.query.filter(Estimacion.numero_estimacion < 3).order_by(Estimacion.fecha_inicio_trab_est)
+
+    panel = calcular_panel_avances(contrato.id, base_panel(contrato.id), agrupacion='estimacion')
+    assert [(p.clave, p.etiqueta) for p in panel['periodos']] == [
+        (f'E{primera.id}', 'Est. 1'), (f'E{segunda.id}', 'Est. 2'), ('2025-02-10', '10/02/2025 (sin estimación)')]
+    assert panel['totales_cantidades'] == {f'E{primera.id}': 4.0, f'E{segunda.id}': 4.0, '2025-02-10': 5.0}
+    assert panel['partidas']['2']['subtotales_por_fecha'] == \
+        {f'E{primera.id}': 3.0, f'E{segunda.id}': 0.0, '2025-02-10': 15.0}
+
+
+def test_ventana_y_columnas_anteriores(contrato, conceptos):
+    c1, c2 = conceptos['C1'].id, conceptos['C2'].id
+    registrar_avances(contrato.id, {date(2025, 1, dia): {c1: 1.0, c2: float(dia)} for dia in range(1, 11)})
+    db.session.commit()
+    base = base_panel(contrato.id)
+    ventana = {'desde': date(2025, 1, 2), 'hasta': date(2025, 1, 9), 'max_columnas': 3}
+
+    # Solo las últimas columnas de la ventana; el acumulado considera todos los avances
+    panel = calcular_panel_avances(contrato.id, base, **ventana)
+    assert [p.clave for p in panel['periodos']] == ['2025-01-07', '2025-01-08', '2025-01-09']
+    assert panel['hay_anteriores'] is True
+    assert panel['partidas']['2']['conceptos'][0]['acumulado'] == 55.0
+
+    # Las anteriores se piden de tres en tres hasta el inicio de la ventana
+    claves, antes = [], panel['periodos'][0].clave
+    while True:
+        anteriores = columnas_anteriores_panel(contrato.id, base, antes, **ventana)
+        claves = [p['clave'] for p in anteriores['periodos']] + claves
+        assert anteriores['conceptos'][c2]['cantidades'] == {
+            p['clave']: float(date.fromisoformat(p['clave']).day) for p in anteriores['periodos']}
+        assert anteriores['partidas']['2'] == {clave: cantidad * 3.0 for clave, cantidad
+                                              in anteriores['conceptos'][c2]['cantidades'].items()}
+        if not anteriores['hay_anteriores']:
+            break
+        antes = anteriores['periodos'][0]['clave']
+    assert claves == ['2025-01-02', '2025-01-03', '2025-01-04', '2025-01-05', '2025-01-06']
+
+    # Un periodo que no está en la ventana no trae columnas
+    assert columnas_anteriores_panel(contrato.id, base, '2025-01-10', **ventana)['periodos'] == []
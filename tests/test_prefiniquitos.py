@@ -0,0 +1,115 @@
+from datetime import date
+
+import pytest
+
+from conftest import crear_version
+from models import db, ConceptoCatalogo, DetallePrefiniquito, Prefiniquito
+from services.prefiniquitos import comparar_versiones_catalogo, congelar_comparacion
+
+
+def ultimo_id(version, clave):
+    return ConceptoCatalogo.query.filter_by(version_id=version.id, clave_concepto=clave) \
+        .order_by(ConceptoCatalogo.id.desc()).first().id
+
+
+def renglon(clave, concepto_id, descripcion, original, actualizado, tipo_cambio):
+    """Renglón esperado del prefiniquito; `original` y `actualizado` son (precio unitario, cantidad)."""
+    (pu_o, cant_o), (pu_a, cant_a) = original, actualizado
+    return {
+        'clave_concepto': clave, 'concepto_id': concepto_id, 'partida': '1', 'nombre_partida': 'Partida 1',
+        'descripcion': descripcion, 'unidad': 'm2',
+        'precio_unitario_original': pu_o, 'cantidad_original': cant_o, 'subtotal_original': pu_o * cant_o,
+        'precio_unitario_actualizado': pu_a, 'cantidad_actualizada': cant_a, 'subtotal_actualizado': pu_a * cant_a,
+        'diferencia_cantidad': cant_a - cant_o, 'diferencia_subtotal': pu_a * cant_a - pu_o * cant_o,
+        'tipo_cambio': tipo_cambio,
+    }
+
+
+def test_comparar_versiones_contra_renglones_calculados_a_mano(contrato):
+    original = crear_version(contrato.id, [
+        {'clave': 'A', 'precio_unitario': 10.0, 'cantidad': 1.0},
+        {'clave': 'A', 'precio_unitario': 10.0, 'cantidad': 3.0},   # repetida: cuenta la última
+        {'clave': 'B', 'precio_unitario': 5.0, 'cantidad': 2.0},
+        {'clave': 'C', 'precio_unitario': 4.0, 'cantidad': 1.0, 'descripcion': 'Solo en el original'},
+        {'clave': 'D', 'precio_unitario': 2.0, 'cantidad': 2.0},
+    ], tipo='original')
+    actualizada = crear_version(contrato.id, [
+        {'clave': 'A', 'precio_unitario': 10.0, 'cantidad': 3.0},
+        {'clave': 'B', 'precio_unitario': 5.0, 'cantidad': 9.0},
+        {'clave': 'B', 'precio_unitario': 6.0, 'cantidad': 2.0},    # repetida: cuenta la última
+        {'clave': 'D', 'precio_unitario': 2.0, 'cantidad': 5.0},
+        {'clave': 'N', 'precio_unitario': 7.0, 'cantidad': 2.0},
+    ])
+
+    comparacion = comparar_versiones_catalogo(original, actualizada)
+
+    esperados = [
+        renglon('A', ultimo_id(actualizada, 'A'), 'A', (10.0, 3.0), (10.0, 3.0), 'sin cambio'),
+        renglon('B', ultimo_id(actualizada, 'B'), 'B', (5.0, 2.0), (6.0, 2.0), 'modificado'),
+        # Ya no viene: el lado que falta cuenta como 0 y no se marca como cambio
+        renglon('C', ultimo_id(original, 'C'), 'Solo en el original', (4.0, 1.0), (0.0, 0.0), 'sin cambio'),
+        renglon('D', ultimo_id(actualizada, 'D'), 'D', (2.0, 2.0), (2.0, 5.0), 'modificado'),
+        renglon('N', ultimo_id(actualizada, 'N'), 'N', (0.0, 0.0), (7.0, 2.0), 'nuevo'),
+    ]
+    assert [d._asdict() for d in comparacion.detalles] == esperados
+    assert comparacion.total_original == pytest.approx(30.0 + 10.0 + 4.0 + 4.0)
+    assert comparacion.total_actualizado == pytest.approx(30.0 + 12.0 + 10.0 + 14.0)
+    assert comparacion.diferencia_total == pytest.approx(comparacion.total_actualizado - comparacion.total_original)
+
+
+@pytest.fixture
+def versiones_con_fecha(contrato):
+    """Tres versiones subidas el 1 de enero, de febrero y de marzo de 2025."""
+    versiones = [
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 1.0}, {'clave': 'B', 'cantidad': 2.0}], tipo='original'),
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 4.0}, {'clave': 'B', 'cantidad': 2.0}]),
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 4.0, 'precio_unitario': 12.0}]),
+    ]
+    for mes, version in enumerate(versiones, start=1):
+        version.fecha_subida = date(2025, mes, 1)
+    db.session.commit()
+    return versiones
+
+
+def renglones_congelados(prefiniquito_id):
+    columnas = [c.name for c in DetallePrefiniquito.__table__.columns if c.name not in ('id', 'prefiniquito_id')]
+    detalles = DetallePrefiniquito.query.filter_by(prefiniquito_id=prefiniquito_id).order_by(DetallePrefiniquito.id)
+    return [{columna: getattr(d, columna) for columna in columnas} for d in detalles]
+
+
+def test_congelar_guarda_la_misma_comparacion(client, contrato, versiones_con_fecha):
+    original, _, ultima = versiones_con_fecha
+    comparacion = comparar_versiones_catalogo(original, ultima)
+
+    respuesta = client.post(f'/prefiniquitos/congelar/{contrato.id}', data={'a': original.id, 'b': ultima.id})
+    assert respuesta.status_code == 302
+    db.session.expire_all()
+
+    prefiniquito = Prefiniquito.query.one()
+    assert (prefiniquito.version_original_id, prefiniquito.version_actualizada_id) == (original.id, ultima.id)
+    assert (prefiniquito.total_original, prefiniquito.total_actualizado, prefiniquito.diferencia_total) == \
+        (comparacion.total_original, comparacion.total_actualizado, comparacion.diferencia_total)
+    assert renglones_congelados(prefiniquito.id) == [d._asdict() for d in comparacion.detalles]
+
+    # Congelar directamente da lo mismo
+    otro_id = congelar_comparacion(comparacion)
+    assert renglones_congelados(otro_id) == renglones_congelados(prefiniquito.id)
+
+
+def test_fechas_eligen_la_version_vigente(client, contrato, versiones_con_fecha):
+    original, intermedia, ultima = versiones_con_fecha
+
+    datos = client.get(f'/prefiniquitos/comparar/{contrato.id}',
+                       query_string={'fecha_a': '2025-01-31', 'fecha_b': '2025-02-01', 'formato': 'json'}).get_json()
+    assert (datos['version_original_id'], datos['version_actualizada_id']) == (original.id, intermedia.id)
+    comparacion = comparar_versiones_catalogo(original, intermedia)
+    assert datos['detalles'] == [d._asdict() for d in comparacion.detalles]
+    assert datos['total_actualizado'] == comparacion.total_actualizado
+
+    datos = client.get(f'/prefiniquitos/comparar/{contrato.id}',
+                       query_string={'fecha_a': '2025-02-15', 'fecha_b': '2025-12-31', 'formato': 'json'}).get_json()
+    assert (datos['version_original_id'], datos['version_actualizada_id']) == (intermedia.id, ultima.id)
+
+    # Antes del primer catálogo no hay versión vigente
+    assert client.get(f'/prefiniquitos/comparar/{contrato.id}',
+                      query_string={'fecha_a': '2024-12-31', 'formato': 'json'}).status_code == 404
@@ -0,0 +1,80 @@
+import json
+
+from conftest import crear_version
+from models import db, CatalogoBaseAcumulado, ConceptoCatalogo
+from services.catalogo_base import (
+    generar_catalogo_base, reconstruir_catalogo_base, recalcular_clave_catalogo_base,
+    registrar_snapshot_catalogo_base, reconstruir_snapshot_catalogo_base, obtener_snapshot_catalogo_base,
+    _descomprimir
+)
+
+
+def contenido_vigente(contrato_id):
+    return sorted(generar_catalogo_base(contrato_id).como_dicts(), key=lambda c: c['clave'])
+
+
+def registrar(contrato_id):
+    instantanea = registrar_snapshot_catalogo_base(contrato_id)
+    db.session.commit()
+    return instantanea
+
+
+def test_deltas_y_checkpoints_reconstruyen_cada_version(app, contrato):
+    app.config['CATALOGO_BASE_CHECKPOINT_CADA'] = 3
+    crear_version(contrato.id, [{'clave': f'C{i}', 'cantidad': float(i)} for i in range(6)], tipo='original')
+    registrar(contrato.id)
+    esperados = {1: contenido_vigente(contrato.id)}
+
+    for n in range(2, 9):
+        # Cada versión cambia una clave y agrega otra
+        crear_version(contrato.id, [{'clave': 'C0', 'cantidad': float(n * 10)}, {'clave': f'N{n}'}])
+        assert registrar(contrato.id).version == n
+        esperados[n] = contenido_vigente(contrato.id)
+
+    filas = CatalogoBaseAcumulado.query.filter_by(contrato_id=contrato.id) \
+        .order_by(CatalogoBaseAcumulado.version.asc()).all()
+    assert [f.es_checkpoint for f in filas] == [True, False, False, True, False, False, True, False]
+
+    # Un delta solo trae lo que cambió
+    delta = _descomprimir(filas[1].contenido)
+    assert sorted(c['clave'] for c in delta['cambiados']) == ['C0', 'N2'] and delta['eliminados'] == []
+
+    for version, esperado in esperados.items():
+        assert [c._asdict() for c in reconstruir_snapshot_catalogo_base(contrato.id, version)] == esperado
+        assert [c._asdict() for c in obtener_snapshot_catalogo_base(contrato.id, version).conceptos] == esperado
+    assert reconstruir_snapshot_catalogo_base(contrato.id, 99) is None
+
+
+def test_sin_cambios_no_se_crea_otra_instantanea(contrato):
+    crear_version(contrato.id, [{'clave': 'C1'}], tipo='original')
+    primera = registrar(contrato.id)
+    assert registrar(contrato.id) is primera
+
+    # Recalcular una clave sin cambiarla mueve la marca; la instantánea solo se pone al día
+    recalcular_clave_catalogo_base(contrato.id, 'C1')
+    db.session.commit()
+    assert obtener_snapshot_catalogo_base(contrato.id).version == 'N/A'
+    assert registrar(contrato.id) is primera
+    assert CatalogoBaseAcumulado.query.count() == 1
+    assert obtener_snapshot_catalogo_base(contrato.id).version == 1
+
+
+def test_claves_eliminadas_y_formato_json_anterior(contrato):
+    crear_version(contrato.id, [{'clave': 'C1'}, {'clave': 'C2'}], tipo='original')
+    anteriores = contenido_vigente(contrato.id)
+    # Instantánea guardada con el formato anterior (JSON completo, sin comprimir)
+    db.session.add(CatalogoBaseAcumulado(contrato_id=contrato.id, version=1, conceptos_json=json.dumps(anteriores)))
+    db.session.commit()
+
+    version = crear_version(contrato.id, [{'clave': 'C3'}])
+    registrar(contrato.id)
+    # Al eliminar la versión, C3 sale del catálogo base y el delta lo marca como eliminado
+    ConceptoCatalogo.query.filter_by(version_id=version.id).delete()
+    db.session.delete(version)
+    reconstruir_catalogo_base(contrato.id)
+    tercera = registrar(contrato.id)
+
+    assert _descomprimir(tercera.contenido)['eliminados'] == ['C3']
+    assert [c._asdict() for c in reconstruir_snapshot_catalogo_base(contrato.id, 1)] == anteriores
+    assert [c.clave for c in reconstruir_snapshot_catalogo_base(contrato.id, 2)] == ['C1', 'C2', 'C3']
+    assert [c._asdict() for c in reconstruir_snapshot_catalogo_base(contrato.id, 3)] == contenido_vigente(contrato.id)
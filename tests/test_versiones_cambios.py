@@ -0,0 +1,115 @@
+import pytest
+
+from conftest import crear_version, archivo_catalogo
+from models import db, CatalogoVersion, ConceptoCatalogo
+from services.catalogo_base import conceptos_de_version, consulta_conceptos_version, generar_catalogo_base
+
+
+def cantidades(version):
+    return {c.clave_concepto: c.cantidad for c in conceptos_de_version(version)}
+
+
+def cantidades_sql(version):
+    return dict(db.session.execute(consulta_conceptos_version(version, ['clave_concepto', 'cantidad'])).all())
+
+
+def fila(clave, cantidad, precio_unitario=10.0):
+    return [1, 'Partida 1', clave, f'Concepto {clave}', 'm2', precio_unitario, cantidad, None]
+
+
+def subir(client, contrato_id, filas, solo_cambios=False):
+    datos = {'contrato_id': str(contrato_id), 'archivo': archivo_catalogo(filas)}
+    if solo_cambios:
+        datos['solo_cambios'] = '1'
+    respuesta = client.post('/subir_catalogo', data=datos, content_type='multipart/form-data')
+    assert respuesta.status_code == 200
+    db.session.expire_all()
+    return CatalogoVersion.query.order_by(CatalogoVersion.id.desc()).first()
+
+
+@pytest.fixture
+def tres_versiones(contrato):
+    """v1 completa {A1=10, A2=1, A3=5}; v2 solo cambia A1=12; v3 cambia A3=7 y ya no trae A2."""
+    v1 = crear_version(contrato.id, [{'clave': 'A1', 'cantidad': 10.0}, {'clave': 'A2', 'cantidad': 1.0},
+                                     {'clave': 'A3', 'cantidad': 5.0}], tipo='original')
+    v2 = crear_version(contrato.id, [{'clave': 'A1', 'cantidad': 12.0}], modo='cambios')
+    v3 = crear_version(contrato.id, [{'clave': 'A3', 'cantidad': 7.0}, {'clave': 'A2', 'eliminado': True}],
+                       modo='cambios')
+    return v1, v2, v3
+
+
+def test_importar_solo_cambios_guarda_cambios_y_marcas(client, contrato):
+    subir(client, contrato.id, [fila('A1', 10), fila('A2', 1), fila('A3', 5)])
+    version = subir(client, contrato.id, [fila('A1', 12), fila('A3', 5), fila('A4', 2)], solo_cambios=True)
+
+    assert version.modo_almacenamiento == 'cambios'
+    propios = {c.clave_concepto: c.eliminado for c in ConceptoCatalogo.query.filter_by(version_id=version.id)}
+    assert propios == {'A1': False, 'A4': False, 'A2': True}
+
+    assert cantidades(version) == {'A1': 12.0, 'A3': 5.0, 'A4': 2.0}
+    assert cantidades_sql(version) == cantidades(version)
+    # El catálogo base conserva las claves eliminadas, igual que con versiones completas
+    assert {c.clave: c.cantidad for c in generar_catalogo_base(contrato.id)} == \
+        {'A1': 12.0, 'A2': 1.0, 'A3': 5.0, 'A4': 2.0}
+
+
+def test_reconstruccion_de_versiones_cambios(tres_versiones):
+    v1, v2, v3 = tres_versiones
+    assert cantidades(v1) == {'A1': 10.0, 'A2': 1.0, 'A3': 5.0}
+    assert cantidades(v2) == {'A1': 12.0, 'A2': 1.0, 'A3': 5.0}
+    assert cantidades(v3) == {'A1': 12.0, 'A3': 7.0}
+    for version in tres_versiones:
+        assert cantidades_sql(version) == cantidades(version)
+
+
+def test_eliminar_version_intermedia_conserva_la_siguiente(client, contrato, tres_versiones):
+    v1, v2, v3 = tres_versiones
+    client.post(f'/eliminar_catalogo/{v2.id}')
+    db.session.expire_all()
+
+    v3 = db.session.get(CatalogoVersion, v3.id)
+    assert v3.modo_almacenamiento == 'completo'
+    assert cantidades(v3) == {'A1': 12.0, 'A3': 7.0}
+    assert cantidades_sql(v3) == cantidades(v3)
+    assert generar_catalogo_base(contrato.id).por_clave['A1'].cantidad == 12.0
+
+
+def test_eliminar_primera_version_conserva_las_siguientes(client, contrato, tres_versiones):
+    v1, v2, v3 = tres_versiones
+    propio_v2 = ConceptoCatalogo.query.filter_by(version_id=v2.id, clave_concepto='A1').one().id
+    client.post(f'/eliminar_catalogo/{v1.id}')
+    db.session.expire_all()
+
+    v2, v3 = db.session.get(CatalogoVersion, v2.id), db.session.get(CatalogoVersion, v3.id)
+    assert (v2.modo_almacenamiento, v3.modo_almacenamiento) == ('completo', 'completo')
+    assert cantidades(v2) == {'A1': 12.0, 'A2': 1.0, 'A3': 5.0}
+    assert cantidades(v3) == {'A1': 12.0, 'A3': 7.0}
+    # Los conceptos propios conservan su id (los avances los referencian)
+    assert ConceptoCatalogo.query.filter_by(version_id=v2.id, clave_concepto='A1').one().id == propio_v2
+    assert {c.clave: c.cantidad for c in generar_catalogo_base(contrato.id)} == {'A1': 12.0, 'A2': 1.0, 'A3': 7.0}
+
+
+def test_eliminar_version_conserva_todas_las_versiones_cambios_posteriores(client, contrato):
+    """Al eliminar v1 ninguna versión posterior cambia: ni la cadena de 'cambios' ni las que siguen a una completa."""
+    v1 = crear_version(contrato.id, [{'clave': 'A', 'cantidad': 1.0}, {'clave': 'B', 'cantidad': 2.0},
+                                     {'clave': 'E1', 'cantidad': 5.0, 'estatus': 'A'}], tipo='original')
+    posteriores = [
+        crear_version(contrato.id, [{'clave': 'E1', 'cantidad': 9.0}], modo='cambios'),
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 3.0}], modo='cambios'),
+        crear_version(contrato.id, [{'clave': 'B', 'eliminado': True}, {'clave': 'C', 'cantidad': 4.0}],
+                      modo='cambios'),
+        crear_version(contrato.id, [{'clave': 'A', 'cantidad': 6.0}]),
+        crear_version(contrato.id, [{'clave': 'C', 'cantidad': 8.0}], modo='cambios'),
+    ]
+    antes = [cantidades(v) for v in posteriores]
+    # El extraordinario aprobado en v1 prevalece sobre el que v2 volvió a traer en elaboración
+    assert antes[1] == {'A': 3.0, 'B': 2.0, 'E1': 5.0}
+    assert antes[4] == {'A': 6.0, 'B': 2.0, 'C': 8.0, 'E1': 5.0}
+
+    client.post(f'/eliminar_catalogo/{v1.id}')
+    db.session.expire_all()
+
+    posteriores = [db.session.get(CatalogoVersion, v.id) for v in posteriores]
+    assert [v.modo_almacenamiento for v in posteriores] == ['completo'] * 5
+    assert [cantidades(v) for v in posteriores] == antes
+    assert [cantidades_sql(v) for v in posteriores] == antes